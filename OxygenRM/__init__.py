@@ -6,11 +6,18 @@ handle_events = False
 emit_warnings = True
 
 # Defines the database driver
-def db_config(driver, db_name):
+def db_config(driver, db_name, **options):
+    """ Set up the database driver to use.
+
+        Args:
+            driver: The driver name. Currently only 'sqlite3'.
+            db_name: The database to connect to.
+            **options: Driver specific options, like pool_size.
+    """
     global internal_db, db 
     
     if driver == 'sqlite3':
-        internal_db = SQLite3DB(db_name)
+        internal_db = SQLite3DB(db_name, **options)
         db = internal_db
         return internal_db
     
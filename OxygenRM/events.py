@@ -8,6 +8,11 @@ import OxygenRM
 """
 EVENTS = defaultdict(list)
 
+""" The functions called when an event is fired, even if the events
+    are not being handled. Used internally, for example to invalidate caches.
+"""
+SUBSCRIBERS = defaultdict(list)
+
 """
 """
 HANDLERS = {}
@@ -43,6 +48,21 @@ def listen(event, times=inf):
 
     return decorator
 
+def subscribe(event, f):
+    """ Call a function every time the given event is fired, even if the events
+        are not being handled. The function is not removed by drop_all_events.
+
+        Args:
+            event: The event name.
+            f: The function, which receives the event arguments.
+
+        Returns:
+            The function.
+    """
+    SUBSCRIBERS[event].append(f)
+
+    return f
+
 def drop_all_events():
     """ Stops all events' caller
     """
@@ -56,6 +76,10 @@ def fire(event, *args, **kwargs):
             event: The event name to fire
             *args, **kwargs
     """
+    if event in SUBSCRIBERS:
+        for f in tuple(SUBSCRIBERS[event]):
+            f(*args, **kwargs)
+
     if OxygenRM.handle_events:
         global last_fired
         last_fired = event
@@ -0,0 +1,111 @@
+""" A bounded pool of database connections, to be used by the database
+    drivers when the ORM is accessed from several threads.
+"""
+import threading
+
+from collections import deque
+
+class PoolExhaustedError(Exception):
+    """ An exception to be raised when a connection is requested but every
+        connection of the pool is checked out and none is returned in time.
+    """
+    pass
+
+class ConnectionPool():
+    """ Keeps up to size connections, handing them out and taking them back.
+
+        Args:
+            connect: A function that, when called, returns a new connection.
+            size: The maximum number of connections open at the same time.
+            timeout: The seconds to wait for a free connection before failing.
+                If None, wait forever.
+    """
+    def __init__(self, connect, size, timeout=None):
+        if size < 1:
+            raise ValueError('Invalid pool size {}. Expected at least 1.'.format(size))
+
+        self.size = size
+        self.timeout = timeout
+
+        self._connect = connect
+        self._idle = deque()
+        self._opened = 0
+        self._available = threading.Condition(threading.Lock())
+
+        self._checkouts = 0
+        self._checkins = 0
+        self._waits = 0
+
+    def checkout(self):
+        """ Take a connection from the pool, opening a new one if none is idle
+            and the pool is not full yet.
+
+            Returns:
+                A connection.
+
+            Raises:
+                PoolExhaustedError: If no connection was freed before the timeout.
+        """
+        with self._available:
+            if not self._idle and self._opened >= self.size:
+                self._waits += 1
+
+                if not self._available.wait_for(self._has_free_connection, self.timeout):
+                    raise PoolExhaustedError('All the {} connections of the pool are in use.'.format(self.size))
+
+            self._checkouts += 1
+
+            if self._idle:
+                return self._idle.pop()
+
+            self._opened += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._available:
+                self._opened -= 1
+                self._available.notify()
+            raise
+
+    def checkin(self, connection):
+        """ Give back a connection to the pool. Pending changes are rolled back.
+
+            Args:
+                connection: A connection obtained with checkout.
+        """
+        connection.rollback()
+
+        with self._available:
+            self._checkins += 1
+            self._idle.append(connection)
+            self._available.notify()
+
+    def close(self):
+        """ Close every idle connection of the pool.
+        """
+        with self._available:
+            while self._idle:
+                self._idle.pop().close()
+                self._opened -= 1
+
+    def stats(self):
+        """ Get the current usage of the pool.
+
+            Returns:
+                A dict with the size, the opened, idle and in use connections,
+                and how many checkouts, checkins and waits have happened.
+        """
+        with self._available:
+            return {
+                'size': self.size,
+                'opened': self._opened,
+                'idle': len(self._idle),
+                'in_use': self._opened - len(self._idle),
+                'checkouts': self._checkouts,
+                'checkins': self._checkins,
+                'waits': self._waits,
+            }
+
+    def _has_free_connection(self):
+        return bool(self._idle) or self._opened < self.size
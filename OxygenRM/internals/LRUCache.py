@@ -0,0 +1,193 @@
+""" A size bounded mapping that forgets the least recently used entries first.
+"""
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+
+def shallow_sizeof(value):
+    """ Get the memory used by a value and, if it's a tuple or list, by its items.
+
+        Args:
+            value: Any object.
+
+        Returns:
+            The size in bytes.
+    """
+    size = sys.getsizeof(value)
+
+    if isinstance(value, (tuple, list)):
+        size += sum(map(sys.getsizeof, value))
+
+    return size
+
+class LRUCache():
+    """ A thread safe Least Recently Used cache, which keeps track of
+        how many lookups were hits or misses.
+
+        Args:
+            maxsize: The maximum number of entries to keep.
+            ttl: If given, the seconds after which an entry is forgotten.
+            maxbytes: If given, the maximum memory used by the stored values, 
+                as measured by sizeof.
+            sizeof: A function that returns the bytes used by a value.
+            on_evict: If given, a function called with the key of every entry 
+                forgotten because the cache was full or the entry expired.
+    """
+    def __init__(self, maxsize=128, ttl=None, maxbytes=None, sizeof=shallow_sizeof, on_evict=None):
+        if maxsize < 1:
+            raise ValueError('Invalid cache size {}. Expected at least 1.'.format(maxsize))
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+        self._sizeof = sizeof if maxbytes is not None else None
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._expirations = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ Get the value stored with the given key, marking it as recently used.
+
+            Args:
+                key: The entry key.
+                default: The value to return if the key is not stored.
+
+            Returns:
+                The stored value or default.
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            expires_at = self._expirations.get(key)
+            expired = expires_at is not None and expires_at < time.monotonic()
+
+            if expired:
+                self._forget(key)
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if expired:
+            self._evicted((key,))
+            return default
+
+        return value
+
+    def set(self, key, value, ttl=None):
+        """ Store a value, forgetting the least recently used entry if the cache is full.
+
+            Args:
+                key: The entry key.
+                value: The value to store.
+                ttl: If given, the seconds after which this entry is forgotten, instead of the cache ttl.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        evicted = []
+
+        with self._lock:
+            if key in self._entries:
+                self._forget(key)
+
+            self._entries[key] = value
+
+            if ttl is not None:
+                self._expirations[key] = time.monotonic() + ttl
+
+            if self._sizeof is not None:
+                self._sizes[key] = self._sizeof(value)
+                self.bytes += self._sizes[key]
+
+            while len(self._entries) > self.maxsize or (self._sizeof is not None and self.bytes > self.maxbytes and len(self._entries) > 1):
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                evicted.append(oldest)
+
+        self._evicted(evicted)
+
+    def pop(self, key, default=None):
+        """ Forget the given key.
+
+            Args:
+                key: The entry key.
+                default: The value to return if the key is not stored.
+
+            Returns:
+                The value that was stored or default.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+
+            return self._forget(key)
+
+    def clear(self):
+        """ Forget every entry and reset the counters.
+        """
+        with self._lock:
+            self._clear_entries()
+            self.hits = 0
+            self.misses = 0
+
+    def invalidate(self):
+        """ Forget every entry, keeping the counters.
+        """
+        with self._lock:
+            self._clear_entries()
+
+    def stats(self):
+        """ Get the cache usage.
+
+            Returns:
+                A dict with the hits, misses, the current size and the maxsize, and
+                the bytes used by the values if the memory is limited.
+        """
+        stats = {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+        if self._sizeof is not None:
+            stats['bytes'] = self.bytes
+            stats['maxbytes'] = self.maxbytes
+
+        return stats
+
+    def _forget(self, key):
+        """ Remove an entry. The lock must be held.
+
+            Returns:
+                The value of the entry.
+        """
+        self._expirations.pop(key, None)
+        self.bytes -= self._sizes.pop(key, 0)
+
+        return self._entries.pop(key)
+
+    def _evicted(self, keys):
+        """ Report the evicted keys. The lock must not be held, so the callback can use the cache.
+        """
+        if self._on_evict is not None:
+            for key in keys:
+                self._on_evict(key)
+
+    def _clear_entries(self):
+        self._entries.clear()
+        self._expirations.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -3,13 +3,68 @@ import json
 from itertools import chain
 from collections import defaultdict
 
+""" The number of rows fetched at once by the streaming containers.
+"""
+DEFAULT_ARRAYSIZE = 1000
+
+def fetch_in_batches(cursor, arraysize=DEFAULT_ARRAYSIZE):
+    """ Get the rows of a cursor, keeping at most arraysize of them in memory.
+
+        Args:
+            cursor: A DB cursor.
+            arraysize: The number of rows to fetch at once.
+
+        Yields:
+            Every row of the cursor.
+    """
+    while True:
+        rows = cursor.fetchmany(arraysize)
+
+        if not rows:
+            return
+
+        yield from rows
+
+def group_by_key(models, key):
+    """ Group models by the value of one of their fields.
+
+        Args:
+            models: An iterable of models.
+            key: The name of the field to group by.
+
+        Returns:
+            A dict with value: list of the models with that value.
+    """
+    groups = defaultdict(list)
+
+    for model in models:
+        groups[getattr(model, key)].append(model)
+
+    return groups
+
 class ModelContainer():
     """ Base class for model's rows container.
+
+        Args:
+            result: The DB cursor, or a function that returns it.
+            model: The model class to wrap the rows in.
+            calculated_models: If given, the models of the container, instead of a result.
+            pivot_query: The pivot query of the models, for Multiple relations.
+            relations: A dict with relation_name: query_builder_partial to eager load.
+            retain: If False, the models are built as the rows are fetched 
+                and forgotten after they are yielded, so the container can only be iterated once.
+            arraysize: The number of rows fetched at once when not retaining the models.
+            query: If given, a copy of the QueryBuilder of the result. Until the container is iterated,
+                len(), bool() and the indexes and slices are run with it in SQL.
     """
-    def __init__(self, result, model, calculated_models=None, pivot_query=None, relations=None):
+    def __init__(self, result, model, calculated_models=None, pivot_query=None, relations=None, retain=True, arraysize=DEFAULT_ARRAYSIZE, query=None):
         self._calculated_models = calculated_models
 
         self._model = model
+        self._retain = retain
+        self._query = query
+        self._counted_length = None
+        self._has_models = None
 
         if calculated_models is not None:
             self._iteration_done = True
@@ -18,36 +73,118 @@ class ModelContainer():
             self._result = result
             self._iteration_done = False
             self._pivot_query = pivot_query
-            if relations:
+
+            if not retain:
+                self._arraysize = arraysize
+                self._relations = relations
+            elif relations:
                 self._add_relations(relations)
 
     def __iter__(self):
+        if not self._retain:
+            return self._stream_result()
+
+        # Every model is going to be fetched, so list() and the like don't count them first
+        self._query = None
+
+        return self._iterate_retained()
+
+    def _iterate_retained(self):
         for row in chain(self._calculated_models, self._craft_own_result()):
             yield row
         
         self._iteration_done = True
+
+    def _stream_result(self):
+        """ Build the models batch by batch, loading their relations, without keeping them.
+
+            Yields:
+                The models of every row.
+
+            Raises:
+                RuntimeError: If the container was already iterated.
+        """
+        if self._iteration_done:
+            raise RuntimeError('A streamed container can only be iterated once.')
+
+        self._iteration_done = True
+
+        result = self._result() if callable(self._result) else self._result
+        self._result = None
+        keys = tuple(column[0] for column in result.description or ())
+
+        while True:
+            rows = result.fetchmany(self._arraysize)
+
+            if not rows:
+                return
+
+            models = [self._model._from_row(keys, row, self._pivot_query) for row in rows]
+            del rows
+
+            if self._relations:
+                # The eager load builders can only be used once
+                relations = {rel: self._model.get_relation(rel).eager_load_builder() for rel in self._relations}
+                self._add_relations(relations, models)
+
+            yield from models
             
-    def _add_relations(self, relations):
+    def _add_relations(self, relations, models=None):
         """ Fetches and store the relation so they can be obtained later on.
 
             Args:
                 relations: A dict with relation_name: query_builder_partial
+                models: The models to load the relations of. By default, every model in the container.
         """
+        if models is None:
+            models = self
+
         names = frozenset(self._model.get_relation(rel).parting_model_prop for rel in relations)
         parting_rel_values = defaultdict(list)
 
-        for model in self: 
+        for model in models: 
             for name in names:
                 parting_rel_values[name].append(getattr(model, name))
 
         relations = {
-            rel: builder(parting_rel_values[self._model.get_relation(rel).parting_model_prop]).get() 
+            rel: self._load_relation(rel, builder, parting_rel_values[self._model.get_relation(rel).parting_model_prop]) 
             for rel, builder in relations.items()
         }
 
-        for model in self:
-            for relation, container in relations.items():
-                model.relations_loaded[relation] = container
+        for rel, container in relations.items():
+            relation = self._model.get_relation(rel)
+            buckets = group_by_key(container, relation.eager_load_key)
+            parting_prop = relation.parting_model_prop
+
+            for model in models:
+                related = buckets.get(getattr(model, parting_prop), [])
+
+                if relation._how_much == 'many':
+                    model.relations_loaded[rel] = ModelContainer(None, relation._model, calculated_models=related)
+                else:
+                    model.relations_loaded[rel] = related[0] if related else None
+
+    def _load_relation(self, rel, builder, values):
+        """ Get the models related to the given values. The related models referenced
+            by id are taken from their primary key cache, if they have one.
+
+            Args:
+                rel: The relation name.
+                builder: The query_builder_partial of the relation.
+                values: The values of the parting models column.
+
+            Returns:
+                A ModelContainer.
+        """
+        relation = self._model.get_relation(rel)
+        target = relation._model
+        target.set_up()
+
+        if relation.holds_foreign_key and target._pk_cache is not None and relation._other_name == target.id_key:
+            ids = [value for value in dict.fromkeys(values) if value is not None]
+            return ModelContainer(None, target, calculated_models=target._find_cached(ids))
+
+        return builder(values).get()
 
     def __getitem__(self, index):
         """ Obtain the item nº index of the collection.
@@ -58,7 +195,16 @@ class ModelContainer():
             Returns:
                 The model at position index.
         """
+        self._ensure_retained()
+
         is_slice = isinstance(index, slice)
+
+        if self._is_lazy():
+            sliced = self._get_lazily(index)
+
+            if sliced is not None:
+                return sliced
+
         if is_slice:
             wanted_index = index.stop
 
@@ -77,12 +223,57 @@ class ModelContainer():
         else:
             return self._calculated_models[index]
 
+    def _get_lazily(self, index):
+        """ Get a slice or item of the container with a query that only fetches them.
+
+            Args:
+                index: An integer or a slice.
+
+            Returns:
+                A ModelContainer or a model, or None if the index can't be translated to SQL.
+
+            Raises:
+                IndexError: If the index is out of range.
+        """
+        if isinstance(index, slice):
+            start, stop = index.start or 0, index.stop
+
+            if index.step not in (None, 1) or start < 0 or (stop is not None and stop < 0):
+                return None
+
+            sliced = self._query._slice(start, stop)
+
+            if sliced is None:
+                return ModelContainer(None, self._model, calculated_models=[])
+
+            return sliced.get()
+
+        if index < 0:
+            return None
+
+        sliced = self._query._slice(index, index + 1)
+        model = next(iter(sliced.get()), None) if sliced is not None else None
+
+        if model is None:
+            raise IndexError('ModelContainer index out of range')
+
+        return model
+
+    def _is_lazy(self):
+        """ Check if the models can still be counted and sliced in SQL.
+
+            Returns:
+                True if there's a query and no model has been fetched.
+        """
+        return self._query is not None and callable(self._result) and not self._calculated_models
+
     def __delitem__(self, index):
         """ Invoked when del self[index] is called
 
             Args:
                 index: An nonegative integer.
         """
+        self._ensure_retained()
         self._make_calculated_models_until(index)
         del self._calculated_models[index]
 
@@ -98,8 +289,11 @@ class ModelContainer():
         if callable(self._result):
             self._result = self._result()
 
+        keys = tuple(column[0] for column in self._result.description or ())
+        from_row = self._model._from_row
+
         for row in self._result:
-            model_from_row = self._model(False, pivot_query=self._pivot_query, **dict(zip(row.keys(), tuple(row)))) 
+            model_from_row = from_row(keys, row, self._pivot_query)
             self._calculated_models.append(model_from_row)
             yield model_from_row 
 
@@ -116,6 +310,10 @@ class ModelContainer():
             return 
 
         length = len(self._calculated_models)
+
+        if wanted_access_index < length:
+            return
+
         for row in self._craft_own_result():
             length += 1
             if wanted_access_index < length:
@@ -126,11 +324,51 @@ class ModelContainer():
     def __len__(self):
         """ Calculate the number of models in the container.
         """
+        self._ensure_retained()
+
         if self._iteration_done:
             return len(self._calculated_models)
+        elif self._is_lazy():
+            if self._counted_length is None:
+                self._counted_length = self._query._count_rows(ignore_limit=False)
+
+            return self._counted_length
         else:
             return len(list(iter(self)))
+
+    def __length_hint__(self):
+        """ Guess the number of models in the container, without fetching or counting them.
+        """
+        return len(self._calculated_models)
+
+    def __bool__(self):
+        """ Check if there's any model in the container, fetching only the first one.
+        """
+        self._ensure_retained()
+
+        if self._is_lazy():
+            if self._counted_length is not None:
+                return self._counted_length > 0
+
+            if self._has_models is None:
+                first = self._query._slice(0, 1)
+                self._has_models = first is not None and next(iter(first.get()), None) is not None
+
+            return self._has_models
+
+        self._make_calculated_models_until(0)
+
+        return bool(self._calculated_models)
     
+    def _ensure_retained(self):
+        """ Check that the models can be accessed by index.
+
+            Raises:
+                TypeError: If the container is streaming its models.
+        """
+        if not self._retain:
+            raise TypeError('A streamed container can only be iterated.')
+
     def first_or_fail(self):
         """ Get the first value of the collection.
 
@@ -1,17 +1,109 @@
-from collections import defaultdict, ChainMap
+from collections import defaultdict, ChainMap, namedtuple
 from itertools import chain
 from copy import deepcopy
+import base64
+import binascii
+import json
+import re
+import weakref
 
 from OxygenRM.internals.SQL_builders import *
-from OxygenRM.internals.ModelContainer import ModelContainer
+from OxygenRM.internals.ModelContainer import ModelContainer, fetch_in_batches, DEFAULT_ARRAYSIZE
+from OxygenRM.internals.LRUCache import LRUCache
+from OxygenRM.internals.QueryCache import QueryCache, CachedCursor
+from OxygenRM.events import fire, subscribe
 
 import OxygenRM as O
 
+""" The symbols of the conditions whose field is not a column.
+"""
+UNQUALIFIED_SYMBOLS = ('RAW', 'EXISTS', 'NOT EXISTS')
+
+""" The select fields that are a column (optionally aliased) or every column, 
+    so they can be qualified with the table alias. Literals and expressions are not.
+"""
+QUALIFIABLE_FIELD_RE = re.compile(r'^(\*|[A-Za-z_]\w*)(\s+AS\s+\w+)?$', re.IGNORECASE)
+
+""" The alias given to a select field.
+"""
+FIELD_ALIAS_RE = re.compile(r'\s+AS\s+(\w+)$', re.IGNORECASE)
+
+""" The strategies to query the IN conditions with too many values.
+"""
+LARGE_IN_STRATEGIES = ('temp_table', 'chunks')
+
+class LargeValues(tuple):
+    """ The values of an IN condition too many to be bound at once, 
+        to be queried in chunks.
+    """
+
+class TableValues(LargeValues):
+    """ The values of an IN condition too many to be bound at once,
+        to be put in a temporary table.
+    """
+
+class ValuesTable():
+    """ A subquery of the values of an IN condition, selected from the temporary table
+        they are put in when the query is run. Until then, the table is named by a 
+        placeholder, so the crafted SQL is the same for every run.
+
+        Args:
+            values: The values tuple.
+            index: The number of the table in the query.
+    """
+    def __init__(self, values, index):
+        self.values = values
+        self.placeholder = '[oxygen_values:{}]'.format(index)
+
+    def get_sql(self):
+        return 'SELECT value FROM ' + self.placeholder
+
+    def _shape(self):
+        return self.placeholder
+
+    def _query_values(self):
+        return ()
+
+    def _read_tables(self):
+        return ()
+
+    def __deepcopy__(self, memo):
+        # The values are never changed, and can be too many to be copied
+        return self
+
+""" A page of the records, with the total amount of them.
+"""
+Page = namedtuple('Page', 'items total page per_page last_page')
+
+""" A page of the records, with the cursor of the next one (None if it's the last).
+"""
+CursorPage = namedtuple('CursorPage', 'items next_cursor')
+
 class QueryBuilder:
     """ A class for building and chaining queries.
     """
     _debug = False
 
+    """ The already crafted SQL, keyed by the shape of the query that produced it.
+    """
+    sql_cache = LRUCache(1024)
+
+    """ The rows of the queries run with cache(), keyed by their SQL and values.
+    """
+    result_cache = QueryCache(1024)
+
+    """ The number of values of an IN condition above which they are not bound directly.
+    """
+    large_in_threshold = 999
+
+    """ How the IN conditions with more values than large_in_threshold are queried. Either:
+        'temp_table': The values are put in a temporary table, queried with a subquery.
+        'chunks': The query is run for every chunk of large_in_threshold values, and the rows 
+            are merged in order. Only for the reads without order, limit, offset, grouping,
+            distinct or OR conditions, and for IN conditions; a temporary table is used otherwise.
+    """
+    large_in_strategy = 'temp_table'
+
     def __init__(self, table_name, model=None):
         self._in_wait = defaultdict(list)
         self._in_wait['table_name'] = table_name
@@ -102,17 +194,33 @@ class QueryBuilder:
         self._in_wait['where_cond'].append(ConditionClause('OR', field, symbol, value))
         return self
 
-    def where_in(self, field, values):
+    def where_raw(self, sql, values=()):
+        """ Add an AND WHERE condition written in SQL to the prepared query.
+
+            Args: 
+                sql: The SQL condition, with ? placeholders.
+                values: An iterator with the values of the placeholders.
+
+            Returns:
+                self
+        """
+        self._in_wait['where_cond'].append(ConditionClause('AND', sql, 'RAW', tuple(values)))
+        return self
+
+    def where_in(self, field, values, strategy=None):
         """ Add an AND field IN values condition to the prepared query.
 
             Args: 
                 field: The column name.
-                values: An iterator with the values to check
+                values: An iterator with the values to check, or a QueryBuilder 
+                    selecting a single column, to be run as a subquery.
+                strategy: How to query more values than large_in_threshold. 
+                    By default, large_in_strategy.
 
             Returns:
                 self
         """
-        self._in_wait['where_cond'].append(ConditionClause('AND', field, 'IN', tuple(values)))
+        self._in_wait['where_cond'].append(ConditionClause('AND', field, 'IN', self._in_values(values, strategy)))
         return self    
 
     def where_not_in(self, field, values):
@@ -120,12 +228,88 @@ class QueryBuilder:
 
             Args: 
                 field: The column name.
-                values: An iterator with the values to check
+                values: An iterator with the values to check, or a QueryBuilder 
+                    selecting a single column, to be run as a subquery.
 
             Returns:
                 self
         """
-        self._in_wait['where_cond'].append(ConditionClause('AND', field, 'NOT IN', tuple(values)))
+        # The records not in any chunk are not the records not in all of them
+        values = self._in_values(values, 'temp_table')
+
+        self._in_wait['where_cond'].append(ConditionClause('AND', field, 'NOT IN', values))
+        return self
+
+    def _in_values(self, values, strategy=None):
+        """ Prepare the values of an IN condition.
+
+            Args:
+                values: An iterator with the values, or a QueryBuilder.
+                strategy: How to query more values than large_in_threshold.
+
+            Returns:
+                The values tuple, or a LargeValues tuple if they are too many.
+
+            Raises:
+                ValueError: If the strategy is invalid.
+        """
+        if is_subquery(values):
+            return values
+
+        values = tuple(values)
+        strategy = strategy or self.large_in_strategy
+
+        if strategy not in LARGE_IN_STRATEGIES:
+            raise ValueError('Invalid strategy {}. Expected one of {}'.format(strategy, ', '.join(LARGE_IN_STRATEGIES)))
+
+        if len(values) <= self.large_in_threshold:
+            return values
+        elif strategy == 'chunks':
+            return LargeValues(values)
+        else:
+            return TableValues(values)
+
+    def where_exists(self, query):
+        """ Add an AND EXISTS condition to the prepared query.
+
+            Usage:
+                User.where_exists(Order.where_column('orders.user_id', '=', 'users.id'))
+
+            Args: 
+                query: The QueryBuilder of the subquery. It can reference the 
+                    columns of this query with where_column.
+
+            Returns:
+                self
+        """
+        self._in_wait['where_cond'].append(ConditionClause('AND', '', 'EXISTS', query))
+        return self
+
+    def where_not_exists(self, query):
+        """ Add an AND NOT EXISTS condition to the prepared query.
+
+            Args: 
+                query: The QueryBuilder of the subquery. It can reference the 
+                    columns of this query with where_column.
+
+            Returns:
+                self
+        """
+        self._in_wait['where_cond'].append(ConditionClause('AND', '', 'NOT EXISTS', query))
+        return self
+
+    def where_column(self, field, symbol, other_field):
+        """ Add an AND WHERE condition comparing two columns to the prepared query.
+
+            Args: 
+                field: The column name.
+                symbol: The operator.
+                other_field: The column to compare with, which may belong to an outer query.
+
+            Returns:
+                self
+        """
+        self._in_wait['where_cond'].append(ConditionClause('AND', field, symbol, ColumnReference(other_field)))
         return self
 
     def where_null(self, field):
@@ -192,9 +376,7 @@ class QueryBuilder:
             Returns:
                 An int with the number of rows.
         """
-        self.select('count(*)')
-
-        return next(O.db.execute_without_saving(self.get_sql()))[0]
+        return self._single_value('count(*)')
 
     def max(self, col):
         """ Return the max value of the specified table's column.
@@ -205,9 +387,7 @@ class QueryBuilder:
             Returns:
                 The max value.
         """
-        self.select('max({})'.format(col))
-
-        return next(O.db.execute_without_saving(self.get_sql()))[0]        
+        return self._single_value('max({})'.format(col))
 
     def min(self, col):
         """ Return the minimun value of the specified table's column.
@@ -218,8 +398,7 @@ class QueryBuilder:
             Returns:
                 The min value.
         """
-        self.select('min({})'.format(col))
-        return next(O.db.execute_without_saving(self.get_sql()))[0]
+        return self._single_value('min({})'.format(col))
 
     def sum(self, col):
         """ Return the sum value of the specified table's column.
@@ -230,16 +409,89 @@ class QueryBuilder:
             Returns:
                 The result of the sum.
         """
-        self.select('sum({})'.format(col))
+        return self._single_value('sum({})'.format(col))
+
+    def _single_value(self, expression):
+        """ Select a single expression and get its value in the first row.
+
+            Args:
+                expression: The SQL expression.
+
+            Returns:
+                The value.
+        """
+        self.select(expression)
+        query = self._without_large_values()
+        values = query._query_values()
+
+        return query._with_values_tables(query.get_sql(), lambda sql: O.db.execute_without_saving(sql, values).fetchall())[0][0]
+
+    def exists(self):
+        """ Check if any record fulfills the current conditions, without fetching it.
+
+            Returns:
+                A bool.
+        """
+        probe = self._without_large_values()._clone().select('1').limit(1)
+        probe._in_wait.pop('order_by', None)
+        probe._in_wait.pop('relations', None)
+
+        query = 'SELECT EXISTS({})'.format(probe.get_sql())
+        values = probe._query_values()
+
+        return bool(probe._with_values_tables(query, lambda sql: probe._executor()(sql, values).fetchall())[0][0])
+
+    def doesnt_exist(self):
+        """ Check if no record fulfills the current conditions, without fetching any.
+
+            Returns:
+                A bool.
+        """
+        return not self.exists()
+
+    def aggregate(self, **aggregates):
+        """ Compute multiple aggregates of the specified records in a single query,
+            without changing the prepared query.
+
+            Usage:
+                Orders.where('paid', '=', True).aggregate(total=Count(), revenue=Sum('amount'))
+
+            Args:
+                **aggregates: The name=Aggregate of every value to compute.
+
+            Returns:
+                A dict with the name: value of every aggregate. If the query is grouped,
+                a list with a dict of the group fields and the aggregates for every group.
+
+            Raises:
+                ValueError: If no aggregate is passed.
+        """
+        if not aggregates:
+            raise ValueError('No aggregate passed')
+
+        aggregated = self._without_large_values()._clone()
+        group_fields = tuple(clause.field for clause in aggregated._in_wait['group_by'])
+
+        aggregated._in_wait['select_fields'] = group_fields + tuple(
+            '{} AS {}'.format(aggregate.sql(), name) for name, aggregate in aggregates.items()
+        )
+        aggregated._in_wait.pop('relations', None)
+
+        values = aggregated._query_values()
+        rows = aggregated._with_values_tables(aggregated.get_sql(), lambda sql: aggregated._executor()(sql, values).fetchall())
+        rows = [dict(zip(row.keys(), row)) for row in rows]
 
-        return next(O.db.execute_without_saving(self.get_sql()))[0]        
+        if group_fields:
+            return rows
+
+        return rows[0] if rows else dict.fromkeys(aggregates)
 
     def group_by(self, field, order='ASC'):
         """ Add a GROUP BY to the prepared query.
 
             Args:
                 fields: The field to group by.
-                order: Whether to order it ASC or DESC 
+                order: Unused, as SQLite can't sort the groups in the GROUP BY. Use order_by.
 
             Returns:
                 self
@@ -392,6 +644,66 @@ class QueryBuilder:
 
         return self
 
+    def cache(self, ttl=None):
+        """ Keep the result of the prepared query, so the next get() with the same
+            SQL and values doesn't run it again. The result is forgotten when one
+            of the read tables is written, or when another connection commits.
+            While the connection has uncommited changes, the cache is not used.
+
+            Args:
+                ttl: The seconds to keep the result. If None, until it's invalidated.
+
+            Returns:
+                self
+        """
+        self._in_wait['cache'] = True
+        self._in_wait['cache_ttl'] = ttl
+        return self
+
+    def _read_tables(self):
+        """ Get the tables read by the prepared query.
+
+            Returns:
+                A tuple with the table names.
+        """
+        tables = [self._in_wait['table_name'].split(' ')[0]]
+
+        if self._in_wait['join_with']:
+            tables.append(self._in_wait['join_with'].split(' ')[0])
+
+        for condition in self._in_wait['where_cond']:
+            if is_subquery(condition.value):
+                tables.extend(condition.value._read_tables())
+
+        return tuple(tables)
+
+    def _execute_cached(self, query, values):
+        """ Get the result of a read query from the cache, running it if it's not there.
+
+            Args:
+                query: The query to be executed.
+                values: The values of the query placeholders.
+
+            Returns:
+                A cursor with the rows.
+        """
+        # The uncommited changes must not be read by the other connections
+        if O.db.in_transaction():
+            return O.db.execute_without_saving(query, values)
+
+        cache = self.result_cache
+        cache.check_data_version(*O.db.data_version())
+        cursor = cache.get(query, values)
+
+        if cursor is None:
+            generation = cache.generation
+            cursor = cache.set(
+                query, values, O.db.execute_without_saving(query, values), 
+                self._read_tables(), self._in_wait['cache_ttl'], generation
+            )
+
+        return cursor
+
     def truncate(self):
         """ Delete the entire table records.
         """
@@ -410,20 +722,71 @@ class QueryBuilder:
             alias = options['table_name'].split(' ')[1]
         
         new_options = deepcopy(options)
-        new_options['select_fields'] = (alias + '.' + select_field if '.' not in select_field else select_field for select_field in options['select_fields'] )
+        new_options['select_fields'] = tuple(
+            alias + '.' + select_field if '.' not in select_field and QUALIFIABLE_FIELD_RE.match(select_field) else select_field 
+            for select_field in options['select_fields']
+        )
+
+        # The having may refer to an aliased select field, like an aggregate
+        select_aliases = {match.group(1) for match in map(FIELD_ALIAS_RE.search, new_options['select_fields']) if match}
 
-        for field in ('where_cond', 'group_by', 'having', 'group_by'):
+        if options['having'] and '.' not in options['having'].field and options['having'].field not in select_aliases:
+            new_options['having'] = options['having']._replace(field=alias + '.' + options['having'].field)
+
+        for field in ('where_cond', 'group_by'):
             if options[field]:
-                new_options[field] = tuple(option._replace(field=alias + '.' + option.field) if '.' not in option.field else option for option in options[field])
+                new_options[field] = tuple(
+                    option._replace(field=alias + '.' + option.field) if '.' not in option.field and getattr(option, 'symbol', None) not in UNQUALIFIED_SYMBOLS else option 
+                    for option in options[field]
+                )
 
         return new_options
 
+    def _shape(self):
+        """ Get a hashable description of everything that affects the crafted SQL
+            of the prepared query, but not its values.
+
+            Returns:
+                A tuple.
+        """
+        options = self._in_wait
+        # The unset options are empty lists, which are not hashable
+        having = options['having']
+
+        return (
+            options['table_name'], 
+            options['join_type'] or None, options['join_with'] or None, tuple(options['join_on']), tuple(options['using']),
+            tuple(options['select_fields']), bool(options['distinct']),
+            conditions_shape(options['where_cond']),
+            tuple(options['group_by']), (having.field, having.symbol) if having else None,
+            tuple(options['order_by']), 
+            options['limit'] or None, options['offset'] or None
+        )
+
     def get_sql(self):
         """  Craft a get sql command.
 
             Returns:
                 A query string
         """
+        shape = ('SELECT', self._shape())
+        query = self.sql_cache.get(shape)
+
+        if query is None:
+            query = self._craft_get_sql()
+            self.sql_cache.set(shape, query)
+
+        if self._debug:
+            print(query)
+
+        return query
+
+    def _craft_get_sql(self):
+        """ Craft a get sql command, without looking for it in the cache.
+
+            Returns:
+                A query string
+        """
         options = self._get_options()
 
         if options['join_type']:
@@ -451,9 +814,6 @@ class QueryBuilder:
         if options['limit']:
             query += ' ' + limit_clause(options['limit'], options['offset'])
 
-        if self._debug:
-            print(query)
-
         return query
 
     def delete_sql(self):
@@ -462,7 +822,15 @@ class QueryBuilder:
             Returns:
                 A query string
         """
-        return delete_clause(self._in_wait['table_name'].split(' ')[0], self._in_wait['where_cond'])
+        table_name = self._in_wait['table_name'].split(' ')[0]
+        shape = ('DELETE', table_name, conditions_shape(self._in_wait['where_cond']))
+        query = self.sql_cache.get(shape)
+
+        if query is None:
+            query = delete_clause(table_name, self._in_wait['where_cond'])
+            self.sql_cache.set(shape, query)
+
+        return query
 
     def update_sql(self, values):
         """ Craft a update sql command.
@@ -470,12 +838,24 @@ class QueryBuilder:
             Args:
                 values: A dict with the keys as the fields and the values as the values to be set.
         """
-        return update_clause(self._in_wait['table_name'], values.keys(), self._in_wait['where_cond'])
+        table_name = self._in_wait['table_name']
+        shape = ('UPDATE', table_name, tuple(values.keys()), conditions_shape(self._in_wait['where_cond']))
+        query = self.sql_cache.get(shape)
+
+        if query is None:
+            query = update_clause(table_name, values.keys(), self._in_wait['where_cond'])
+            self.sql_cache.set(shape, query)
+
+        return query
     
     def delete(self):
         """  Delete records according to the chained methods.
         """
-        O.db.execute(self.delete_sql(), tuple(extract_values(self._in_wait['where_cond'])))
+        query = self._without_large_values()
+        values = tuple(extract_values(query._in_wait['where_cond']))
+
+        query._with_values_tables(query.delete_sql(), lambda sql: O.db.execute(sql, values))
+        fire('db.deleted_records', self._in_wait['table_name'])
 
     def update(self, values={}, **kwvalues):
         """ Update records in the database according with the given values.
@@ -484,10 +864,69 @@ class QueryBuilder:
                 values: A dict with the keys as the fields and the values as the values to be set.
                 **kwvalues: The values to update
         """
+        query = self._without_large_values()
         values = ChainMap(values, kwvalues)
-        values_to_prepare = chain(values.values(), extract_values(self._in_wait['where_cond']))
+        values_to_prepare = tuple(chain(values.values(), extract_values(query._in_wait['where_cond'])))
+
+        query._with_values_tables(query.update_sql(values), lambda sql: O.db.execute(sql, values_to_prepare))
+        fire('db.updated_records', self._in_wait['table_name'])
+
+    def update_returning(self, values):
+        """ Update records in the database according with the given values, getting 
+            back the updated rows in the same statement.
+
+            Args:
+                values: A dict with the keys as the fields and the values as the values to be set.
+
+            Returns:
+                A list with the updated rows. None if the driver does not support RETURNING clauses,
+                in which case the records are updated anyway.
+        """
+        if not O.db.supports_returning:
+            return self.update(values)
+
+        query = self._without_large_values()
+        values_to_prepare = tuple(chain(values.values(), extract_values(query._in_wait['where_cond'])))
 
-        O.db.execute(self.update_sql(values), tuple(values_to_prepare))
+        rows = query._with_values_tables(
+            returning_clause(query.update_sql(values)), lambda sql: O.db.execute_returning(sql, values_to_prepare)
+        )
+        fire('db.updated_records', self._in_wait['table_name'])
+
+        return rows
+
+    def bulk_update(self, rows, key='id', fields=None):
+        """ Update many records, each one with its own values, in a single transaction. 
+            The rows that set the same fields are updated with a single prepared statement.
+
+            Args:
+                rows: An iterator of dicts with the key value and the values to be set.
+                key: The field that identifies every record.
+                fields: An iterator with the only fields to update. If None, every field 
+                    in the rows (but the key) is updated.
+
+            Returns:
+                The number of updated records.
+        """
+        table_name = self._in_wait['table_name']
+        fields = frozenset(fields) if fields is not None else None
+        groups = defaultdict(list)
+
+        for row in rows:
+            row_fields = tuple(field for field in row if field != key and (fields is None or field in fields))
+
+            if row_fields:
+                groups[row_fields].append(tuple(row[field] for field in row_fields) + (row[key],))
+
+        updated = 0
+        with O.db.transaction():
+            for row_fields, values in groups.items():
+                updated += O.db.execute_many(update_by_key_clause(table_name, row_fields, key), values).rowcount
+
+        if updated:
+            fire('db.updated_records', table_name)
+
+        return updated
 
     def get(self):
         """  Get the specified records.
@@ -495,17 +934,545 @@ class QueryBuilder:
             Returns:
                 The rows obtained.
         """
-        query = self.get_sql()
+        # The container counts and slices the records in SQL with a copy of the query, until it fetches them
+        query = self._clone() if self._model and not self._in_wait['cache'] and not self._in_wait['relations'] else None
+
+        return self._wrap_in_model(self._get_result(self._executor()), query=query)
+
+    def paginate(self, per_page, after=None):
+        """ Get a page of the specified records, starting after the record of the given cursor.
+
+            The records are sorted by the order_by fields and then by id, and the page is
+            looked up by their values, so its cost doesn't grow with the amount of records before it. 
+            The order_by fields must be selected.
+
+            Args:
+                per_page: The maximum number of records in the page.
+                after: The next_cursor of the previous page. If None, the first page is got.
+
+            Returns:
+                A CursorPage.
+
+            Raises:
+                ValueError: If the cursor is invalid, or the query has a limit or offset.
+        """
+        if self._in_wait['limit'] or self._in_wait['offset']:
+            raise ValueError('Cannot paginate a query with a limit or offset. Use page instead.')
+
+        paged = self._clone()
+        order = list(paged._in_wait['order_by'])
+        id_field = paged._id_field()
+
+        if not any(clause.field in (id_field, id_field.split('.')[-1]) for clause in order):
+            order.append(OrderClause(id_field, 'ASC'))
+
+        paged._in_wait['order_by'] = order
+        paged._in_wait['limit'] = per_page + 1
+        paged._in_wait.pop('offset', None)
+
+        if after is not None:
+            sql, values = keyset_condition(order, decode_cursor(after, len(order)))
+
+            paged._group_conditions()
+            paged.where_raw(sql, values)
+
+        rows, items = paged._fetch_rows(per_page)
+
+        if len(rows) > per_page:
+            next_cursor = encode_cursor([clause.field.split('.')[-1] for clause in order], rows[per_page - 1])
+        else:
+            next_cursor = None
+
+        return CursorPage(items, next_cursor)
+
+    def chunk(self, size):
+        """ Get the specified records in batches, each one fetched with its own query. 
+            The records are paged with an offset, in the order_by order, or by id if there's none.
+
+            If the records are edited while iterating, some may be skipped or repeated; use
+            chunk_by_id in that case.
+
+            Args:
+                size: The maximum number of records in every batch.
+
+            Yields:
+                A ModelContainer with every batch, or a list of rows if there's no model.
+        """
+        chunked = self._clone()
+
+        if not chunked._in_wait['order_by']:
+            chunked.order_by(chunked._id_field())
+
+        offset = chunked._in_wait['offset'] or 0
+        remaining = chunked._in_wait['limit'] or None
+
+        while remaining is None or remaining > 0:
+            batch_size = size if remaining is None else min(size, remaining)
+            rows, items = chunked._clone().limit(batch_size).offset(offset)._fetch_rows()
+
+            if not rows:
+                return
+
+            yield items
+
+            if len(rows) < batch_size:
+                return
+
+            offset += batch_size
+
+            if remaining is not None:
+                remaining -= batch_size
+
+    def chunk_by_id(self, size):
+        """ Get the specified records in batches sorted by id, each one fetched with its own query.
+            Every batch is looked up by the last id of the previous one, so the records created 
+            or deleted while iterating don't make others be skipped or repeated.
+
+            Args:
+                size: The maximum number of records in every batch.
+
+            Yields:
+                A ModelContainer with every batch, or a list of rows if there's no model.
+
+            Raises:
+                ValueError: If the query is ordered or has an offset.
+        """
+        if self._in_wait['order_by'] or self._in_wait['offset']:
+            raise ValueError('Cannot chunk by id an ordered query or one with an offset. Use chunk instead.')
+
+        chunked = self._clone()
+        remaining = chunked._in_wait.pop('limit', None) or None
+        cursor = None
+
+        while remaining is None or remaining > 0:
+            batch_size = size if remaining is None else min(size, remaining)
+            page = chunked._clone().paginate(batch_size, after=cursor)
+
+            if not page.items:
+                return
+
+            yield page.items
+
+            if page.next_cursor is None:
+                return
+
+            cursor = page.next_cursor
+
+            if remaining is not None:
+                remaining -= batch_size
+
+    def each(self, f, size=DEFAULT_ARRAYSIZE):
+        """ Call a function with every specified record, fetching them in batches sorted by id.
+
+            Args:
+                f: The function, which receives a record. If it returns False, the iteration stops.
+                size: The number of records fetched at once.
+
+            Returns:
+                False if the iteration was stopped, True otherwise.
+        """
+        for batch in self.chunk_by_id(size):
+            for record in batch:
+                if f(record) is False:
+                    return False
+
+        return True
+
+    def page(self, n, per_page=20):
+        """ Get the nth page of the specified records, along with their total count.
+
+            Args:
+                n: The page number, starting from 1.
+                per_page: The maximum number of records in every page.
+
+            Returns:
+                A Page.
+        """
+        if n < 1:
+            raise ValueError('Invalid page {}. Pages start from 1.'.format(n))
+
+        total = self._count_rows()
+        paged = self._clone().limit(per_page).offset((n - 1) * per_page)
+
+        return Page(paged.get(), total, n, per_page, max(1, (total + per_page - 1) // per_page))
+
+    def _count_rows(self, ignore_limit=True):
+        """ Count the records of the prepared query, ignoring its order.
+
+            Args:
+                ignore_limit: Whether to ignore the limit and offset too.
+
+            Returns:
+                An int.
+        """
+        counted = self._without_large_values()._clone()
+        counted._in_wait.pop('order_by', None)
+
+        if ignore_limit:
+            counted._in_wait.pop('limit', None)
+            counted._in_wait.pop('offset', None)
+
+        query = 'SELECT COUNT(*) FROM ({})'.format(counted.get_sql())
+        values = counted._query_values()
+
+        return counted._with_values_tables(query, lambda sql: O.db.execute_without_saving(sql, values).fetchall())[0][0]
+
+    def _fetch_rows(self, keep=None):
+        """ Run the prepared query, fetching all of its rows at once.
+
+            Args:
+                keep: If given, the maximum number of records to wrap.
+
+            Returns:
+                A tuple with the list of rows and the records, in a ModelContainer if there's a model.
+        """
+        cursor = self._get_result(self._executor())()
+        rows = cursor.fetchall()
+        kept_rows = rows[:keep] if keep is not None else rows
+
+        items = self._wrap_in_model(lambda: CachedCursor(cursor.description, kept_rows))
+
+        if not self._model:
+            items = list(items)
+
+        return rows, items
+
+    def _slice(self, start, stop=None):
+        """ Get a copy of the query that only gets the records from start to stop.
+
+            Args:
+                start: The nonnegative index of the first record, in the records of this query.
+                stop: The nonnegative index after the last record. If None, until the end.
+
+            Returns:
+                A QueryBuilder, or None if the slice is empty.
+        """
+        sliced = self._clone()
+        limit = sliced._in_wait['limit'] or None
+
+        if limit is not None:
+            stop = limit if stop is None else min(stop, limit)
+
+        if stop is not None and stop <= start:
+            return None
+
+        sliced._in_wait['offset'] = (sliced._in_wait['offset'] or 0) + start
+        # SQLite needs a LIMIT for the OFFSET, and -1 means no limit
+        sliced._in_wait['limit'] = -1 if stop is None else stop - start
+
+        return sliced
+
+    def _clone(self):
+        """ Get a copy of the QueryBuilder, that can be changed without changing this one.
+
+            Returns:
+                A QueryBuilder.
+        """
+        clone = QueryBuilder(self._in_wait['table_name'], self._model)
+        clone._in_wait = defaultdict(list, {
+            option: list(value) if isinstance(value, list) else value
+            for option, value in self._in_wait.items()
+        })
+
+        # The eager load builders can only be used once
+        if self._in_wait['relations']:
+            clone._in_wait['relations'] = {
+                relation: self._model.get_relation(relation).eager_load_builder() 
+                for relation in self._in_wait['relations']
+            }
+
+        return clone
+
+    def _id_field(self):
+        """ Get the id field of the queried records, qualified if there's a join.
+
+            Returns:
+                The field name.
+        """
+        if self._model:
+            self._model.set_up()
+
+        id_field = self._model.id_key if self._model and self._model.id_key else 'id'
+
+        if self._in_wait['join_with']:
+            id_field = self._in_wait['table_name'].split(' ')[-1] + '.' + id_field
+
+        return id_field
+
+    def _group_conditions(self):
+        """ Put the where conditions between parentheses if they have an OR, so 
+            the next AND conditions apply to all of them.
+        """
+        conditions = self._in_wait['where_cond']
+
+        if any(condition.connector == 'OR' for condition in conditions):
+            self._in_wait['where_cond'] = [
+                ConditionClause('AND', conditions_gen(conditions), 'RAW', tuple(extract_values(conditions)))
+            ]
+
+    def _executor(self):
+        """ Get the DB method that runs the read queries.
+
+            Returns:
+                A function that takes the query and its values.
+        """
+        # The temporary tables of the large values are named differently on every run
+        if self._in_wait['cache'] and next(self._large_values(), None) is None:
+            return self._execute_cached
+
+        return O.db.execute_without_saving
+
+    def stream(self, arraysize=DEFAULT_ARRAYSIZE):
+        """ Get the specified records, fetching arraysize of them at once
+            and without keeping them after they are yielded. 
+            
+            Useful for iterating over results too big to be held in memory.
+
+            Args:
+                arraysize: The number of rows to fetch at once.
+
+            Returns:
+                A ModelContainer that can only be iterated once, or a rows iterator if there's no model.
+        """
+        return self._wrap_in_model(self._get_result(O.db.execute_in_new_cursor, keep_cursor=True), retain=False, arraysize=arraysize)
+
+    def _get_result(self, execute, keep_cursor=False):
+        """ Prepare the query of the specified records.
+
+            Args:
+                execute: The DB method that runs the query.
+                keep_cursor: Whether to return the cursor of the query even if it has temporary tables,
+                    which are then dropped when it's forgotten. Otherwise, its rows are fetched before dropping them.
+
+            Returns:
+                A function that runs the query and returns the cursor.
+        """
+        large_conditions = [
+            condition for condition in self._in_wait['where_cond'] 
+            if isinstance(condition.value, LargeValues) and not isinstance(condition.value, TableValues)
+        ]
+
+        if large_conditions and self._can_run_in_chunks(large_conditions):
+            return lambda: self._execute_in_chunks(execute, large_conditions[0])
+
+        query = self._without_large_values()
+        sql = query.get_sql()
+        values_to_prepare = query._query_values()
+
+        if not query._values_tables():
+            return lambda: execute(sql, values_to_prepare)
+        elif keep_cursor:
+            return lambda: query._with_values_tables(sql, lambda sql: execute(sql, values_to_prepare), keep=True)
+
+        def fetch(sql):
+            cursor = execute(sql, values_to_prepare)
+            return CachedCursor(cursor.description, cursor.fetchall())
+
+        return lambda: query._with_values_tables(sql, fetch)
+
+    def _can_run_in_chunks(self, large_conditions):
+        """ Check if the query can be run for every chunk of the values of its large IN condition.
+
+            Args:
+                large_conditions: The conditions with LargeValues.
+
+            Returns:
+                A bool.
+        """
         options = self._in_wait
 
+        return (
+            len(large_conditions) == 1 and large_conditions[0].symbol == 'IN' 
+            and not any(condition.connector == 'OR' for condition in options['where_cond'])
+            and not any(options[option] for option in ('order_by', 'limit', 'offset', 'group_by', 'distinct'))
+        )
+
+    def _execute_in_chunks(self, execute, large_condition):
+        """ Run the query for every chunk of the values of its large IN condition.
+
+            Args:
+                execute: The DB method that runs the query.
+                large_condition: The condition with LargeValues.
+
+            Returns:
+                A cursor with the rows of every chunk, in order.
+        """
+        index = self._in_wait['where_cond'].index(large_condition)
+        values = large_condition.value
+        size = self.large_in_threshold
+        description, rows = None, []
+
+        for start in range(0, len(values), size):
+            chunk = self._clone()
+            chunk._in_wait['where_cond'][index] = large_condition._replace(value=values[start:start + size])
+
+            cursor = chunk._get_result(execute)()
+            description = cursor.description
+            rows.extend(cursor.fetchall())
+
+        return CachedCursor(description, rows)
+
+    def _large_values(self):
+        """ Get the values of the IN conditions too many to be bound at once, 
+            including the ones of the subqueries.
+
+            Yields:
+                Every LargeValues tuple or ValuesTable.
+        """
+        for condition in self._in_wait['where_cond']:
+            if isinstance(condition.value, (LargeValues, ValuesTable)):
+                yield condition.value
+            elif isinstance(condition.value, QueryBuilder):
+                yield from condition.value._large_values()
+
+    def _values_tables(self):
+        """ Get the temporary tables that the query needs to be run.
+
+            Returns:
+                A list of ValuesTable.
+        """
+        return [values for values in self._large_values() if isinstance(values, ValuesTable)]
+
+    def _without_large_values(self, tables=None):
+        """ Get the query with the LargeValues of its IN conditions, and of its subqueries, 
+            selected from temporary tables, which are created when it's run.
+
+            Args:
+                tables: The list of the ValuesTable of the outer query, if it's a subquery.
+
+            Returns:
+                self if there are no LargeValues, a changed copy otherwise.
+        """
+        if not any(isinstance(values, LargeValues) for values in self._large_values()):
+            return self
+
+        tables = [] if tables is None else tables
+        query = self._clone()
+        where_cond = []
+
+        for condition in query._in_wait['where_cond']:
+            if isinstance(condition.value, LargeValues):
+                tables.append(ValuesTable(condition.value, len(tables)))
+                condition = condition._replace(value=tables[-1])
+            elif isinstance(condition.value, QueryBuilder):
+                condition = condition._replace(value=condition.value._without_large_values(tables))
+
+            where_cond.append(condition)
+
+        query._in_wait['where_cond'] = where_cond
+
+        return query
+
+    def _with_values_tables(self, sql, run, keep=False):
+        """ Run a query of the prepared one, with the values of its ValuesTable put in
+            temporary tables of the connection that runs it, which are dropped afterwards.
+
+            Args:
+                sql: The query, with the placeholders of the tables.
+                run: A function that runs the query and returns its result, already fetched.
+                keep: If True, the tables are dropped when the result is forgotten instead,
+                    so it can be a cursor still being read.
+
+            Returns:
+                The result of run.
+        """
+        drops = []
+
+        def drop_tables():
+            for drop in drops:
+                drop()
+
+        try:
+            for table in self._values_tables():
+                table_name, drop = O.db.create_values_table(table.values)
+                drops.append(drop)
+                sql = sql.replace(table.placeholder, table_name)
+
+            result = run(sql)
+        except BaseException:
+            drop_tables()
+            raise
+
+        if keep:
+            weakref.finalize(result, drop_tables)
+        else:
+            drop_tables()
+
+        return result
+
+    def _query_values(self):
+        """ Get the values of the prepared query placeholders.
+
+            Returns:
+                A tuple.
+        """
+        options = self._in_wait
         values_to_prepare = extract_values(options['where_cond'])
 
         if options['having']:
-            values_to_prepare = chain(values_to_prepare, options['having'].value)
+            values_to_prepare = chain(values_to_prepare, (options['having'].value,))
 
-        values_to_prepare = tuple(values_to_prepare)
-        result = lambda: O.db.execute_without_saving(query, values_to_prepare)
-        return self._wrap_in_model(result)
+        return tuple(values_to_prepare)
+
+    def values(self, *fields, convert=False):
+        """ Get the specified records as dicts, without building models.
+
+            Args:
+                *fields: The fields to select. By default, the selected ones.
+                convert: Whether to format the values as the model fields do.
+
+            Returns:
+                A list with a dict of field:value for every row.
+        """
+        names, rows = self._fetch_raw(fields, convert)
+
+        return [dict(zip(names, row)) for row in rows]
+
+    def tuples(self, *fields, convert=False):
+        """ Get the specified records as tuples, without building models.
+
+            Args:
+                *fields: The fields to select. By default, the selected ones.
+                convert: Whether to format the values as the model fields do.
+
+            Returns:
+                A list with a tuple of values for every row.
+        """
+        return self._fetch_raw(fields, convert)[1]
+
+    def scalars(self, field, convert=False):
+        """ Get the values of a single field of the specified records, without building models.
+
+            Args:
+                field: The field to select.
+                convert: Whether to format the values as the model field does.
+
+            Returns:
+                A list with the value of every row.
+        """
+        return [row[0] for row in self._fetch_raw((field,), convert)[1]]
+
+    def _fetch_raw(self, fields, convert):
+        """ Run the query and get the rows straight from the cursor.
+
+            Args:
+                fields: The fields to select, if any.
+                convert: Whether to format the values with the model fields.
+
+            Returns:
+                A tuple with the column names and a list with the rows as tuples.
+        """
+        if fields:
+            self.select(*fields)
+
+        cursor = self._get_result(self._executor())()
+        names = tuple(column[0] for column in cursor.description)
+        rows = [tuple(row) for row in cursor]
+
+        if convert and self._model and rows:
+            rows = convert_columns(self._model, names, rows)
+
+        return names, rows
 
     def all(self):
         """ Gets all the records.
@@ -516,22 +1483,31 @@ class QueryBuilder:
         result = lambda: O.db.all(self._in_wait['table_name'], self._in_wait['select_fields']) 
         return self._wrap_in_model(result)
 
-    def first(self):
+    def first(self, fields=None):
         """ Get the first record of the specified query.
 
+            Args:
+                fields: If given, an iterator with the only fields to select.
+
             Returns:
                 The first record specified.
         """
+        if fields:
+            self.select(*fields)
+
         result = self.limit(1).get()
         if self._model:
-            return result.first()
+            return next(iter(result), None)
         else:
             return result.fetchone()
 
-    def first_or_fail(self):
+    def first_or_fail(self, fields=None):
         """ Get the first record of the specified record or fail if None returned.
+
+            Args:
+                fields: If given, an iterator with the only fields to select.
         """
-        value = self.first() 
+        value = self.first(fields) 
         if value is None:
             raise ValueError('No record exists')
         else:
@@ -545,20 +1521,25 @@ class QueryBuilder:
         """
         return self.get()
 
-    def _wrap_in_model(self, result):
+    def _wrap_in_model(self, result, retain=True, arraysize=DEFAULT_ARRAYSIZE, query=None):
         """ Wrap the results of the query cursor in 
             a ModelContainer, if a model is available.
 
             Args:
                 result: An iterator with the rows
+                retain: Whether the models are kept after being iterated.
+                arraysize: The number of rows fetched at once if not retaining them.
+                query: The QueryBuilder of the results, to count and slice them in SQL.
 
             Return:
                 An iterator with the rows
         """
         if not self._model:
-            return result()
+            return result() if retain else fetch_in_batches(result(), arraysize)
         else:
-            return ModelContainer(result, self._model, relations=self._in_wait['relations'])
+            return ModelContainer(
+                result, self._model, relations=self._in_wait['relations'], retain=retain, arraysize=arraysize, query=query
+            )
 
     """ A dict indicating which operation is pending.
     """
@@ -613,6 +1594,12 @@ class QueryBuilder:
         self._in_wait['relations'] = relations_builders
         return self
 
+for event in ('db.table_written', 'db.truncated_table', 'db.dropped_table', 'db.renamed_table'):
+    subscribe(event, QueryBuilder.result_cache.invalidate_table)
+
+subscribe('db.all_tables_dropped', QueryBuilder.result_cache.invalidate)
+subscribe('db.transaction_failed', QueryBuilder.result_cache.invalidate)
+
 def extract_values(conditions):
     """ Get every value of the passed conditions.
 
@@ -623,8 +1610,174 @@ def extract_values(conditions):
             The values of every condition.
     """
     for condition in conditions:
-        if 'IN' in condition.symbol:
+        if condition.symbol == 'RAW':
+            yield from condition.value
+        elif is_subquery(condition.value):
+            yield from condition.value._query_values()
+        elif isinstance(condition.value, ColumnReference):
+            continue
+        elif 'IN' in condition.symbol:
             for value in condition.value:
                 yield value
         else:
-            yield condition.value
\ No newline at end of file
+            yield condition.value
+
+def conditions_shape(conditions):
+    """ Get what matters of the passed conditions when crafting their SQL.
+
+        Args:
+            conditions: An iterator of ConditionClause.
+
+        Returns:
+            A tuple with the connector, field, symbol and either the amount 
+            of values (IN conditions), the referenced column, the shape of the
+            subquery or whether the value is truthy, of every condition.
+    """
+    return tuple(
+        (condition.connector, condition.field, condition.symbol, value_shape(condition))
+        for condition in conditions
+    )
+
+def value_shape(condition):
+    """ Get what matters of a condition value when crafting its SQL.
+
+        Args:
+            condition: A ConditionClause.
+
+        Returns:
+            Something hashable.
+    """
+    value = condition.value
+
+    if is_subquery(value):
+        return ('SELECT', value._shape())
+    elif isinstance(value, ColumnReference):
+        return value
+    elif 'IN' in condition.symbol:
+        return len(value)
+    else:
+        return bool(value)
+
+def keyset_condition(order, values):
+    """ Craft the condition of the records that come after the given ones,
+        in the given order. In SQLite the NULLs go before any other value.
+
+        Args:
+            order: A list of OrderClause.
+            values: The values of the order fields in the last record.
+
+        Returns:
+            A tuple with the SQL and its values.
+    """
+    alternatives = []
+    alternative_values = []
+
+    for index, (clause, value) in enumerate(zip(order, values)):
+        descending = clause.order.upper() == 'DESC'
+        equal = ['{} IS ?'.format(previous.field) for previous in order[:index]]
+
+        if value is None and descending:
+            # Nothing goes after a NULL
+            continue
+        elif value is None:
+            alternatives.append(' AND '.join(equal + ['{} IS NOT NULL'.format(clause.field)]))
+            alternative_values.extend(values[:index])
+        else:
+            after = '({0} < ? OR {0} IS NULL)' if descending else '{0} > ?'
+            alternatives.append(' AND '.join(equal + [after.format(clause.field)]))
+            alternative_values.extend(values[:index + 1])
+
+    if not alternatives:
+        return '0', ()
+
+    return ' OR '.join('({})'.format(alternative) for alternative in alternatives), tuple(alternative_values)
+
+def encode_cursor(fields, row):
+    """ Craft the pagination cursor of a record.
+
+        Args:
+            fields: The names of the order fields.
+            row: The record row.
+
+        Returns:
+            A string.
+    """
+    try:
+        values = [row[field] for field in fields]
+    except IndexError:
+        raise ValueError('The order_by fields {} must be selected to paginate.'.format(', '.join(fields)))
+
+    for index, (field, value) in enumerate(zip(fields, values)):
+        if isinstance(value, bytes):
+            # JSON has no bytes, so they are tagged
+            values[index] = {'bytes': base64.b64encode(value).decode()}
+        elif not isinstance(value, (str, int, float, type(None))):
+            raise ValueError('The values of the order_by field {} can\'t be put in a pagination cursor.'.format(field))
+
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor_value(value):
+    """ Get a value of a pagination cursor as it was in the record.
+
+        Args:
+            value: The JSON decoded value.
+
+        Returns:
+            The value.
+    """
+    if isinstance(value, dict) and set(value) == {'bytes'}:
+        return base64.b64decode(value['bytes'].encode(), validate=True)
+
+    return value
+
+def decode_cursor(cursor, length):
+    """ Get the values of a pagination cursor.
+
+        Args:
+            cursor: The cursor string.
+            length: The expected amount of values.
+
+        Returns:
+            A list with the values.
+
+        Raises:
+            ValueError: If the cursor is invalid.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        if not isinstance(values, list) or len(values) != length:
+            raise ValueError
+
+        values = [decode_cursor_value(value) for value in values]
+    except (binascii.Error, UnicodeError, ValueError, AttributeError):
+        raise ValueError('Invalid pagination cursor {}'.format(cursor))
+
+    if any(isinstance(value, (dict, list)) for value in values):
+        raise ValueError('Invalid pagination cursor {}'.format(cursor))
+
+    return values
+
+def convert_columns(model, names, rows):
+    """ Format the values of the rows column by column, as the model fields do.
+
+        Args:
+            model: The model whose fields format the values.
+            names: The column names of the rows.
+            rows: A list of tuples.
+
+        Returns:
+            A list with the formatted rows.
+    """
+    model.set_up()
+    fields = [model._fields.get(name) for name in names]
+
+    if not any(fields):
+        return rows
+
+    columns = [
+        column if field is None else tuple(field.value_formatter(field.db_get(value)) for value in column)
+        for field, column in zip(fields, zip(*rows))
+    ]
+
+    return list(zip(*columns))
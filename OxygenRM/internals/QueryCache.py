@@ -0,0 +1,172 @@
+""" A cache of read query results, forgotten when the tables they read are written.
+"""
+import threading
+import weakref
+
+from collections import defaultdict
+
+from OxygenRM.internals.LRUCache import LRUCache
+
+class CachedCursor():
+    """ A read only cursor over already fetched rows.
+
+        Args:
+            description: The description of the cursor that fetched the rows.
+            rows: A list of rows.
+    """
+    def __init__(self, description, rows):
+        self.description = description
+        self._rows = iter(rows)
+
+    def __iter__(self):
+        return self._rows
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=1):
+        return [row for _, row in zip(range(size), self._rows)]
+
+    def fetchall(self):
+        return list(self._rows)
+
+class QueryCache():
+    """ Keeps the rows of read queries by their SQL and values. The entries are
+        forgotten after their ttl, when a table they read is written, or when
+        another connection commits to the database.
+
+        Args:
+            maxsize: The maximum number of results to keep.
+    """
+    def __init__(self, maxsize=1024):
+        self._results = LRUCache(maxsize, on_evict=self._unindex)
+        self._by_table = defaultdict(set)
+        self._tables_by_key = {}
+        self._data_versions = weakref.WeakKeyDictionary()
+        # Reentrant, as the results evicted while storing one are unindexed with it held
+        self._lock = threading.RLock()
+
+        # Increased on every invalidation, so the results read before one are not stored
+        self.generation = 0
+
+    def get(self, query, values):
+        """ Get the cached rows of a query.
+
+            Args:
+                query: The SQL.
+                values: The values of the query placeholders.
+
+            Returns:
+                A CachedCursor, or None if the result is not cached or expired.
+        """
+        entry = self._results.get((query, values))
+
+        return CachedCursor(*entry) if entry is not None else None
+
+    def set(self, query, values, cursor, tables, ttl=None, generation=None):
+        """ Fetch and store the rows of a cursor.
+
+            Args:
+                query: The SQL.
+                values: The values of the query placeholders.
+                cursor: The cursor of the executed query.
+                tables: An iterator with the names of the tables read by the query.
+                ttl: The seconds to keep the result. If None, until it's invalidated.
+                generation: The generation when the query was run. If the cache was 
+                    invalidated since then, the result is not stored.
+
+            Returns:
+                A CachedCursor with the rows.
+        """
+        key = (query, values)
+        description, rows = cursor.description, cursor.fetchall()
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return CachedCursor(description, rows)
+
+            tables = frozenset(tables)
+            self._tables_by_key[key] = tables
+
+            for table in tables:
+                self._by_table[table].add(key)
+
+            self._results.set(key, (description, rows), ttl)
+
+        return CachedCursor(description, rows)
+
+    def invalidate_table(self, table_name, *args, **kwargs):
+        """ Forget the results that read the given table.
+
+            Args:
+                table_name: The name of the written table.
+        """
+        with self._lock:
+            self.generation += 1
+            keys = self._by_table.pop(table_name, ())
+
+            for key in keys:
+                self._unindex(key)
+
+        for key in keys:
+            self._results.pop(key)
+
+    def invalidate(self, *args, **kwargs):
+        """ Forget every result.
+        """
+        with self._lock:
+            self.generation += 1
+            self._by_table.clear()
+            self._tables_by_key.clear()
+
+        self._results.invalidate()
+
+    def check_data_version(self, connection, version):
+        """ Forget every result if the database was changed by another connection
+            since the last check made with the same connection. As the results may 
+            have been read by other connections, the first check of a connection 
+            forgets them too.
+
+            Args:
+                connection: The connection, which must support weak references.
+                version: The PRAGMA data_version of the connection.
+        """
+        with self._lock:
+            last_version = self._data_versions.get(connection)
+            self._data_versions[connection] = version
+
+        if last_version != version:
+            self.invalidate()
+
+    def _unindex(self, key):
+        """ Forget the tables read by the query of a result that is no longer stored.
+
+            Args:
+                key: The (query, values) of the result.
+        """
+        with self._lock:
+            for table in self._tables_by_key.pop(key, ()):
+                keys = self._by_table.get(table)
+
+                if keys is not None:
+                    keys.discard(key)
+
+                    if not keys:
+                        del self._by_table[table]
+
+    def stats(self):
+        """ Get the cache usage.
+
+            Returns:
+                A dict with the hits, misses, the current size and the maxsize.
+        """
+        return self._results.stats()
+
+    def clear(self):
+        """ Forget every result and reset the counters.
+        """
+        self.invalidate()
+        self._results.clear()
+
+        with self._lock:
+            self._data_versions.clear()
@@ -1,5 +1,5 @@
 from OxygenRM.internals.QueryBuilder import QueryBuilder
-from OxygenRM.internals.ModelContainer import ModelContainer
+from OxygenRM.internals.ModelContainer import ModelContainer, DEFAULT_ARRAYSIZE
 import OxygenRM as O
 
 class RelationQueryBuilder(QueryBuilder):    
@@ -200,7 +200,8 @@ class BelongsToManyQueryBuilder(RelationQueryBuilder):
             self_name: The name of target_model table column to use for the relation.
             other_name:The name of parting_model table column to use for the relation.
     """
-    def _wrap_in_model(self, result):
+    def _wrap_in_model(self, result, retain=True, arraysize=DEFAULT_ARRAYSIZE, query=None):
+        # The query is not kept, as the pivots must be loaded with the models
         pivot_query = None
 
         if self._pivot:
@@ -211,7 +212,7 @@ class BelongsToManyQueryBuilder(RelationQueryBuilder):
 
             pivot_query.add_model_id = add_model_id
         
-        result = ModelContainer(result, self._model, pivot_query=pivot_query)
+        result = ModelContainer(result, self._model, pivot_query=pivot_query, retain=retain, arraysize=arraysize)
         result.get_pivot = self._get_pivot
 
         return result
@@ -8,7 +8,7 @@ from collections import namedtuple
 from OxygenRM.internals.columns import ColumnData
 
 VALID_CONNECTORS = ('AND', 'OR')
-VALID_WHERE_OPERATIONS  = ('=', '!=', 'IS', 'IS NOT', '>=', '>', '<=', '<', 'IN', 'NOT IN', 'LIKE')
+VALID_WHERE_OPERATIONS  = ('=', '!=', 'IS', 'IS NOT', '>=', '>', '<=', '<', 'IN', 'NOT IN', 'LIKE', 'RAW', 'EXISTS', 'NOT EXISTS')
 COLUMN_RE = re.compile(
         r"""\ ?(?P<col_name>\w+)\ 
             (?P<col_type>\w+)\ ?
@@ -24,12 +24,66 @@ COLUMN_RE = re.compile(
 ConditionClause = namedtuple('ConditionClause', 'connector field symbol value')
 OrderClause = namedtuple('OrderClause', 'field order')
 
-def insert_clause(table_name, keys):
+""" A column to compare with, instead of a value. Used for correlated subqueries.
+"""
+ColumnReference = namedtuple('ColumnReference', 'name')
+
+def is_subquery(value):
+    """ Check if a condition value is a query, to be nested in the SQL.
+
+        Args:
+            value: The condition value.
+
+        Returns:
+            A bool.
+    """
+    return hasattr(value, 'get_sql')
+
+class Aggregate(namedtuple('Aggregate', 'field distinct')):
+    """ An aggregate function over a column, to be selected.
+
+        Args:
+            field: The column name, or an SQL expression.
+            distinct: Whether to only aggregate the distinct values.
+    """
+    function = None
+
+    def __new__(cls, field, distinct=False):
+        return super().__new__(cls, field, distinct)
+
+    def sql(self):
+        """ Craft the SQL of the aggregate.
+
+            Returns:
+                A string.
+        """
+        return '{}({}{})'.format(self.function, 'DISTINCT ' if self.distinct else '', self.field)
+
+class Count(Aggregate):
+    function = 'COUNT'
+
+    def __new__(cls, field='*', distinct=False):
+        return super().__new__(cls, field, distinct)
+
+class Sum(Aggregate):
+    function = 'SUM'
+
+class Max(Aggregate):
+    function = 'MAX'
+
+class Min(Aggregate):
+    function = 'MIN'
+
+class Avg(Aggregate):
+    function = 'AVG'
+
+def insert_clause(table_name, keys, rows=1):
     """ Create a insert clause string for SQL.
 
         Args:
             table_name: The table where the insertion will happen.
             keys: An iterator with strings specifying the fields to change.
+            rows: The number of rows to be inserted by the clause.
         
         Returns:
             The query as a string
@@ -37,11 +91,46 @@ def insert_clause(table_name, keys):
     fields = list(keys)
 
     fields_str = ', '.join(fields)
-    values_str = ', '.join(['?']*len(fields))
+    values_str = ', '.join(['({})'.format(', '.join(['?']*len(fields)))]*rows)
 
-    query = 'INSERT INTO {} ({}) VALUES ({})'.format(table_name, fields_str, values_str)
+    query = 'INSERT INTO {} ({}) VALUES {}'.format(table_name, fields_str, values_str)
     return query 
 
+def upsert_clause(table_name, keys, conflict, update=()):
+    """ Create an insert clause string for SQL that updates the existing
+        row instead, if the insertion fails because of a conflict.
+
+        Args:
+            table_name: The table where the insertion will happen.
+            keys: An iterator with strings specifying the fields to set.
+            conflict: An iterator with the unique fields that may conflict.
+            update: An iterator with the fields to update if there's a conflict. 
+                If empty, the conflicting row is left as it is.
+
+        Returns:
+            The query as a string
+    """
+    update = tuple(update)
+    query = '{} ON CONFLICT ({})'.format(insert_clause(table_name, keys), ', '.join(conflict))
+
+    if update:
+        query += ' DO UPDATE SET ' + ', '.join('{0} = excluded.{0}'.format(field) for field in update)
+    else:
+        query += ' DO NOTHING'
+
+    return query
+
+def default_insert_clause(table_name):
+    """ Create a insert clause string for SQL, for a row with only default values.
+
+        Args:
+            table_name: The table where the insertion will happen.
+
+        Returns:
+            The query as a string
+    """
+    return 'INSERT INTO {} DEFAULT VALUES'.format(table_name)
+
 def update_clause(table_name, fields, where=None):
     """ Create an update (with no where condition) clause string for SQL.
 
@@ -59,6 +148,31 @@ def update_clause(table_name, fields, where=None):
 
     return update_str
 
+def update_by_key_clause(table_name, fields, key):
+    """ Create an update clause string for SQL, for the row with the given key value.
+
+        Args:
+            table_name: The table to update.
+            fields: An iterator that yields the fields to change. 
+            key: The field that identifies the row to update.
+
+        Returns:
+            The crafted SQL.
+    """
+    return '{} WHERE {} = ?'.format(update_clause(table_name, fields), key)
+
+def returning_clause(query, fields=()):
+    """ Add a RETURNING clause to an INSERT, UPDATE or DELETE query.
+
+        Args:
+            query: The query string.
+            fields: The fields to return. If empty, every field is returned.
+
+        Returns:
+            The crafted SQL.
+    """
+    return '{} RETURNING {}'.format(query, ', '.join(fields) if fields else '*')
+
 def where_clause(conditions):
     """ Create a where clause with the given conditions.
 
@@ -166,14 +280,15 @@ def group_by_clause(fields, having=None):
     """ Generate an GROUP BY clause
 
         Args:
-            fields: An iterator with the groupped by fields.
+            fields: An iterator with the groupped by OrderClause.
             having: A ConditionClause with the having condition. 
                 If falsy, no HAVING condition will be added. 
 
         Return:
             The completed clause
     """
-    group_by_str = 'GROUP BY {}'.format(order_gen(fields))
+    # SQLite doesn't accept ASC/DESC in the GROUP BY
+    group_by_str = 'GROUP BY {}'.format(', '.join(field.field for field in fields))
 
     if having:
         group_by_str += ' HAVING {field} {symbol} ?'.format(**having._asdict())
@@ -288,19 +403,31 @@ def conditions_gen(conditions, safe=True):
         elif condition.symbol not in VALID_WHERE_OPERATIONS:
             raise ValueError('Unvalid SQL operation: {}'.format(condition.symbol))
 
-        if safe:
+        condition_str = '' if index == 0 else condition.connector + ' '
+
+        # The field of a RAW condition is an SQL expression, with its own placeholders
+        if condition.symbol == 'RAW':
+            conditions_str += condition_str + '({}) '.format(condition.field)
+            continue
+        elif condition.symbol in ('EXISTS', 'NOT EXISTS'):
+            conditions_str += condition_str + '{} ({}) '.format(condition.symbol, condition.value.get_sql())
+            continue
+
+        if isinstance(condition.value, ColumnReference):
+            value = condition.value.name
+        elif is_subquery(condition.value):
+            value = '({})'.format(condition.value.get_sql())
+        elif safe:
             value = '?'
         else:
             value = condition.value
 
-        if 'IN' in condition.symbol:
+        if 'IN' in condition.symbol and not is_subquery(condition.value):
             if value == '?':
                 value *= len(condition.value)
 
             value = '({})'.format(', '.join(value))
 
-        condition_str = '' if index == 0 else condition.connector + ' '
-
         if condition.symbol == '!=' and condition.value and safe:
             condition_str += '({field} IS NULL OR {field} != {value}) '
         elif condition.symbol[0] in '<>' and condition.value and safe:
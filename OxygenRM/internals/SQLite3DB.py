@@ -4,11 +4,20 @@
 """
 import sqlite3
 import logging
+import re
+import threading
+import atexit
+import time
 import contextlib
+import weakref
+
+from itertools import chain, count
+from functools import partial
 
 logging.basicConfig(filename='test/test.log',level=logging.DEBUG)
 
 from OxygenRM.internals.SQL_builders import *
+from OxygenRM.internals.ConnectionPool import ConnectionPool, PoolExhaustedError
 from OxygenRM.events import fire, fires_after, fires_before
 
 VALID_TABLE_TYPES = [
@@ -36,18 +45,426 @@ VALID_TABLE_TYPES = [
 
 SEQUENCE_TABLE = 'sqlite_sequence'
 
+""" Whether the SQLite library supports INSERT/UPDATE ... RETURNING (since 3.35).
+"""
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+""" The PRAGMAs that can be set up for every connection of the driver.
+"""
+TUNING_PRAGMAS = (
+    'journal_mode', 
+    'synchronous', 
+    'cache_size', 
+    'mmap_size', 
+    'temp_store', 
+    'busy_timeout', 
+    'query_only', 
+    'foreign_keys',
+    'wal_autocheckpoint',
+)
+
+""" Sets of PRAGMAs for the common use cases.
+"""
+PRAGMA_PROFILES = {
+    # Readers don't block the writer, and fsyncs happen only at checkpoints
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    # Every commit is fsynced
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+    # For connections that never write
+    'readonly': {
+        'query_only': 'ON',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+PRAGMA_VALUE_RE = re.compile(r'^-?\w+$')
+
+""" The valid durability levels, from the safest to the fastest.
+"""
+DURABILITY_LEVELS = ('strict', 'batched', 'manual')
+
+""" The SQLITE_MAX_VARIABLE_NUMBER of SQLite builds older than 3.32.
+"""
+DEFAULT_MAX_VARIABLES = 999
+
+""" Matches the statements that write to a table, capturing its name.
+"""
+WRITTEN_TABLE_RE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE)\s+["`\[]?(\w+)',
+    re.IGNORECASE
+)
+
+def written_table(query):
+    """ Get the table a query writes to.
+
+        Args:
+            query: The SQL.
+
+        Returns:
+            The table name, or None if the query doesn't write to a table.
+    """
+    match = WRITTEN_TABLE_RE.match(query)
+
+    return match.group(1) if match else None
+
+def tuning_pragmas(profile=None, pragmas=None):
+    """ Get the PRAGMAs of the given profile, updated with the given ones.
+
+        Args:
+            profile: A PRAGMA_PROFILES key, or None.
+            pragmas: A dict of PRAGMA names and values, or None.
+
+        Returns:
+            A dict of PRAGMA names and values.
+
+        Raises:
+            ValueError: If the profile, a PRAGMA name or its value are invalid.
+    """
+    if profile is not None and profile not in PRAGMA_PROFILES:
+        raise ValueError('Invalid profile {}. Expected one of {}'.format(profile, ', '.join(PRAGMA_PROFILES)))
+
+    result = dict(PRAGMA_PROFILES[profile]) if profile else {}
+    result.update(pragmas or {})
+
+    for pragma, value in result.items():
+        if pragma not in TUNING_PRAGMAS:
+            raise ValueError('Invalid PRAGMA {}. Expected one of {}'.format(pragma, ', '.join(TUNING_PRAGMAS)))
+        elif not PRAGMA_VALUE_RE.match(str(value)):
+            raise ValueError('Invalid value {} for PRAGMA {}'.format(value, pragma))
+
+    return result
+
+def flush_at_exit(db_reference):
+    """ Commit the pending writes of a driver, if it's still alive.
+
+        Args:
+            db_reference: A weak reference to the driver.
+    """
+    db = db_reference()
+
+    if db is not None:
+        db.flush()
+
+class Connection(sqlite3.Connection):
+    """ A sqlite3 connection that can be weakly referenced, so it can 
+        identify itself in the caches without being kept alive by them.
+    """
+    pass
+
+class ConnectionStatus():
+    """ Whether the edition operations of a connection are being commited
+        right away, the writes that are waiting to be commited and how many
+        transactions are nested in the current one.
+    """
+    def __init__(self):
+        self.save = True
+        self.pending_writes = 0
+        self.pending_since = None
+        self.savepoints = 0
+        self.uncommited_tables = set()
+
+class ConnectionState():
+    """ The connection in use, with its cursor and status.
+    """
+    connection = None
+    cursor = None
+    status = None
+
+    """ An object whose collection gives the connection back to the pool,
+        and the finalizer that does it.
+    """
+    owner = None
+    finalizer = None
+
+class ThreadConnectionState(ConnectionState, threading.local):
+    """ A ConnectionState that is different for every thread.
+    """
+    pass
+
+class ConnectionOwner():
+    """ Stays alive as long as its thread holds a pooled connection.
+    """
+    pass
+
 class SQLite3DB():
     """ Init the connection to the database
 
         Args:
             db_name: The path to the sqlite3 database as a string.
+            pool_size: If given, every thread gets its own connection from a
+                pool with at most pool_size connections, instead of sharing one.
+                Take into account that every ':memory:' connection is a different database.
+            pool_timeout: The seconds a thread waits for a free pooled connection.
+                If None, it waits forever.
+            durability: When the writes made outside transactions are commited. Either:
+                'strict': After every write. 
+                'batched': Every commit_every writes or commit_interval milliseconds.
+                'manual': Only when flush() is called.
+                By default, 'batched' if commit_every or commit_interval are given, 'strict' if not.
+                The pending writes are always commited when the interpreter exits.
+            commit_every: The number of writes to group in a single commit.
+            commit_interval: The milliseconds after which the pending writes are commited. 
+                It's checked every time the database is accessed.
+            profile: The name of a set of PRAGMAs from PRAGMA_PROFILES to set on every connection.
+                Either 'throughput', 'durable' or 'readonly'.
+            pragmas: A dict with PRAGMAs to set on every connection, overriding the profile ones.
     """
-    def __init__(self, db_name):
-        self.connection = sqlite3.connect(db_name)
-        self.connection.row_factory = sqlite3.Row
-    
-        self.cursor     = self.connection.cursor()
-        self._save = True
+    def __init__(self, db_name, pool_size=None, pool_timeout=None, durability=None, commit_every=None, commit_interval=None, 
+            profile=None, pragmas=None):
+        if durability is None:
+            durability = 'batched' if commit_every or commit_interval else 'strict'
+
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError('Invalid durability {}. Expected one of {}'.format(durability, ', '.join(DURABILITY_LEVELS)))
+
+        self.pragmas = tuning_pragmas(profile, pragmas)
+        self.db_name = db_name
+        self.durability = durability
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval / 1000 if commit_interval else None
+        self._values_tables = count(1)
+        self._undropped_tables = []
+        self._undropped_lock = threading.Lock()
+
+        if pool_size:
+            self.pool  = ConnectionPool(self._connect_pooled, pool_size, pool_timeout)
+            self._state = ThreadConnectionState()
+        else:
+            self.pool  = None
+            self._state = ConnectionState()
+            self._set_connection(self._connect())
+
+        if durability != 'strict':
+            atexit.register(flush_at_exit, weakref.ref(self))
+
+    def _connect(self, **options):
+        """ Open a new connection to the database.
+
+            Returns:
+                A sqlite3 connection.
+        """
+        connection = sqlite3.connect(self.db_name, factory=Connection, **options)
+        connection.row_factory = sqlite3.Row
+
+        for pragma, value in self.pragmas.items():
+            connection.execute('PRAGMA {} = {}'.format(pragma, value))
+
+        return connection
+
+    def _connect_pooled(self):
+        """ Open a new connection that can be shared between threads.
+        """
+        return self._connect(check_same_thread=False)
+
+    def _set_connection(self, connection):
+        """ Make the given connection the one used by the current thread.
+
+            Args:
+                connection: A sqlite3 connection.
+        """
+        state = self._state
+
+        state.connection = connection
+        state.cursor = connection.cursor()
+        state.status = ConnectionStatus()
+
+    def _current_state(self):
+        """ Get the connection state of the current thread, checking out
+            a connection from the pool if the thread has none.
+
+            Returns:
+                A ConnectionState.
+        """
+        state = self._state
+
+        if state.connection is None:
+            self._set_connection(self.pool.checkout())
+
+            # When the thread dies, the owner is collected and the connection goes back to the pool
+            state.owner = ConnectionOwner()
+            state.finalizer = weakref.finalize(state.owner, self._checkin, state.connection, state.status)
+
+        return state
+
+    @property
+    def connection(self):
+        """ The sqlite3 connection of the current thread.
+        """
+        return self._current_state().connection
+
+    @property
+    def cursor(self):
+        """ The cursor of the current thread connection.
+        """
+        return self._current_state().cursor
+
+    @property
+    def _save(self):
+        return self._current_state().status.save
+
+    @_save.setter
+    def _save(self, save):
+        self._current_state().status.save = save
+
+    def _checkin(self, connection, status):
+        """ Give a connection back to the pool, commiting its pending writes. 
+
+            Args:
+                connection: The pooled connection.
+                status: The ConnectionStatus of the connection.
+        """
+        if status.save and status.pending_writes:
+            self._commit(connection, status)
+
+        self.pool.checkin(connection)
+
+    def _commit_write(self):
+        """ Commit the last write according to the durability, unless in a transaction.
+        """
+        status = self._current_state().status
+
+        if not status.save:
+            return
+
+        if self.durability == 'strict':
+            self._commit(self.connection, status)
+            return
+
+        status.pending_writes += 1
+
+        if status.pending_since is None:
+            status.pending_since = time.monotonic()
+
+        self._flush_if_due(status)
+
+    def _flush_if_due(self, status):
+        """ Commit the pending writes if the batched durability requires it.
+
+            Args:
+                status: The ConnectionStatus of the current connection.
+        """
+        if self.durability != 'batched' or not status.pending_writes:
+            return
+
+        too_many = self.commit_every and status.pending_writes >= self.commit_every
+        too_old = self.commit_interval and time.monotonic() - status.pending_since >= self.commit_interval
+
+        if too_many or too_old:
+            self.flush()
+
+    def flush(self):
+        """ Commit the pending writes of the current connection. 
+            Does nothing inside a transaction, since those are commited at its end.
+        """
+        state = self._state
+
+        if state.connection is None or not state.status.save:
+            return
+
+        if state.status.pending_writes:
+            self._commit(state.connection, state.status)
+
+        state.status.pending_writes = 0
+        state.status.pending_since = None
+
+    def _commit(self, connection, status):
+        """ Commit a connection, firing db.table_written again for the tables it wrote, 
+            since only now the other connections can read the changes.
+
+            Args:
+                connection: The connection to commit.
+                status: Its ConnectionStatus.
+        """
+        connection.commit()
+        tables, status.uncommited_tables = status.uncommited_tables, set()
+
+        for table_name in tables:
+            fire('db.table_written', table_name)
+
+    def in_transaction(self):
+        """ Whether the current connection has changes not commited yet, 
+            which the other connections can't read.
+
+            Returns:
+                A bool.
+        """
+        state = self._state
+
+        return state.connection is not None and state.connection.in_transaction
+
+    def release(self):
+        """ Give the current thread connection back to the pool, so other 
+            threads can use it. Does nothing if the driver is not pooled.
+
+            Raises:
+                RuntimeError: If called in the middle of a transaction.
+        """
+        state = self._state
+
+        if self.pool is None or state.connection is None:
+            return
+
+        if not state.status.save:
+            raise RuntimeError('Cannot release a connection in the middle of a transaction.')
+
+        state.finalizer()
+        state.connection = state.cursor = state.owner = state.finalizer = None
+
+    @contextlib.contextmanager
+    def connection_scope(self):
+        """ Starts a context that releases the thread connection when it ends.
+        """
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def effective_pragmas(self):
+        """ Get the current values of the tuning PRAGMAs in the current connection.
+
+            Returns:
+                A dict with the PRAGMA names and their values, as reported by SQLite.
+        """
+        return {
+            pragma: self.connection.execute('PRAGMA {}'.format(pragma)).fetchone()[0]
+            for pragma in TUNING_PRAGMAS
+        }
+
+    def pool_stats(self):
+        """ Get the connection pool usage.
+
+            Returns:
+                A dict with the pool stats, or None if the driver is not pooled.
+        """
+        if self.pool is None:
+            return None
+
+        return self.pool.stats()
+
+    def data_version(self):
+        """ Get the PRAGMA data_version of the current connection, which changes 
+            every time another connection commits to the database.
+
+            Returns:
+                A tuple with the connection and the data version.
+        """
+        connection = self.connection
+
+        return connection, connection.execute('PRAGMA data_version').fetchone()[0]
 
     def last_id(self):
         """ Get the last edited row id.
@@ -194,8 +611,16 @@ class SQLite3DB():
             Args:
                 table_name: The table to query.
                 **values: The field=value dictionary
+
+            Returns:
+                The created row, if the driver supports RETURNING clauses. None if not.
         """        
-        self.execute(insert_clause(table_name, values), tuple(values.values()))   
+        query = insert_clause(table_name, values)
+
+        if self.supports_returning:
+            return self.execute_returning(returning_clause(query), tuple(values.values()))[0]
+        else:
+            self.execute(query, tuple(values.values()))   
 
     def create_many(self, table_name, keys, values):
         """ Create multiple new records in the database. 
@@ -210,6 +635,138 @@ class SQLite3DB():
         """
         return self.execute_many(insert_clause(table_name, keys), values)
 
+    @fires_after('db.upserted_records')
+    def upsert(self, table_name, values, conflict, update=()):
+        """ Create a new record in the database or, if it conflicts with an existing one,
+            update the existing record.
+
+            Args:
+                table_name: The table to query.
+                values: A dict with the field: value of the record.
+                conflict: An iterator with the unique fields that may conflict.
+                update: An iterator with the fields to update if there's a conflict.
+                    If empty, the existing record is left untouched.
+
+            Returns:
+                The created or updated row, if the driver supports RETURNING clauses. None if not,
+                or if the existing record was left untouched.
+        """
+        query = upsert_clause(table_name, values, conflict, update)
+
+        if self.supports_returning:
+            rows = self.execute_returning(returning_clause(query), tuple(values.values()))
+            return rows[0] if rows else None
+        else:
+            self.execute(query, tuple(values.values()))
+
+    @fires_after('db.upserted_records')
+    def upsert_many(self, table_name, keys, rows, conflict, update=()):
+        """ Create or update multiple records in the database. 
+
+            Args:
+                table_name: The table to query.
+                keys: An iterator to know the keys
+                rows: An iterator that yield tuplables iterators, corresponding to the keys.
+                conflict: An iterator with the unique fields that may conflict.
+                update: An iterator with the fields to update if there's a conflict.
+                    If empty, the existing records are left untouched.
+        """
+        return self.execute_many(upsert_clause(table_name, keys, conflict, update), rows)
+
+    def create_bulk(self, table_name, keys, rows, returning=None):
+        """ Create multiple new records in the database with a single statement.
+
+            Args:
+                table_name: The table to query.
+                keys: An iterator with the fields to set.
+                rows: An iterator that yield tuplables iterators, corresponding to the keys. 
+                    The total amount of values must not be bigger than max_variables().
+                returning: If given, the integer key field to return of every created record.
+                    Requires supports_returning.
+
+            Returns:
+                The id of the last created record or, if returning is given, 
+                a list with the returning field of every created record.
+        """
+        keys = tuple(keys)
+        rows = tuple(rows)
+
+        if keys:
+            statements = [(insert_clause(table_name, keys, len(rows)), tuple(chain.from_iterable(rows)))]
+        else:
+            statements = [(default_insert_clause(table_name), ())] * len(rows)
+
+        if returning is not None:
+            # The returned rows order is not guaranteed, but the keys given by a statement grow as it inserts
+            return sorted(
+                row[0] for query, values in statements 
+                for row in self.execute_returning(returning_clause(query, (returning,)), values)
+            )
+
+        for query, values in statements:
+            self.execute(query, values)
+
+        return self.last_id()
+
+    def max_variables(self):
+        """ Get the maximum number of values that can be bound to a single statement.
+
+            Returns:
+                An int.
+        """
+        try:
+            return self.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        except AttributeError:
+            # Connection.getlimit is only available since Python 3.11
+            return DEFAULT_MAX_VARIABLES
+
+    def create_values_table(self, values):
+        """ Create a temporary table, only visible to the current connection, with the
+            given values in its value column. Useful to query more values than max_variables().
+
+            Args:
+                values: An iterator with the values.
+
+            Returns:
+                A tuple with the table name and a function that drops it.
+        """
+        connection = self.connection
+        table_name = 'oxygen_values_{}'.format(next(self._values_tables))
+        outside_transaction = not connection.in_transaction
+
+        with self._undropped_lock:
+            undropped_tables = [undropped for undropped in self._undropped_tables if undropped[0] is connection]
+
+            for undropped in undropped_tables:
+                self._undropped_tables.remove(undropped)
+
+        for undropped in undropped_tables:
+            self._drop_values_table(*undropped)
+
+        connection.execute('CREATE TEMP TABLE {} (value)'.format(table_name))
+        connection.executemany('INSERT INTO temp.{} (value) VALUES (?)'.format(table_name), ((value,) for value in values))
+
+        # Only the temporary table was written, so no pending write is commited
+        if outside_transaction:
+            connection.commit()
+
+        return table_name, partial(self._drop_values_table, connection, table_name)
+
+    def _drop_values_table(self, connection, table_name):
+        """ Drop a table created by create_values_table. If it can't be dropped now,
+            it's tried again the next time a table is created with the same connection.
+
+            Args:
+                connection: The connection that created the table.
+                table_name: The table name.
+        """
+        try:
+            connection.execute('DROP TABLE IF EXISTS temp.{}'.format(table_name))
+        except sqlite3.Error:
+            # Closed, used from another thread or still being read
+            with self._undropped_lock:
+                self._undropped_tables.append((connection, table_name))
+
     def all(self, table_name, fields=[]):
         """ Get every record in the table_name. 
 
@@ -234,14 +791,32 @@ class SQLite3DB():
             Returns:
                 The query result.
         """
-        fire('db.operation_called', query, args)
         result = self.cursor.execute(query, args)
-
-        if self._save:
-            self.connection.commit()
+        self._commit_write()
+        self._table_written(query)
 
         return result
 
+    @fires_before('db.operation_called')
+    @fires_after('db.operation_perfomed')
+    def execute_returning(self, query, args=()):
+        """ Run a query with a RETURNING clause and commit. The returned rows are 
+            fetched before commiting, as SQLite requires.
+
+            Args:
+                query: The query to be executed.
+                args: If the query has to be protected from sql injection,
+                   the args to substitute can be passed as a tuple.
+
+            Returns:
+                A list with the returned rows.
+        """
+        rows = self.cursor.execute(query, args).fetchall()
+        self._commit_write()
+        self._table_written(query)
+
+        return rows
+
     @fires_before('db.operation_called')
     @fires_after('db.operation_perfomed')
     def execute_without_saving(self, query, args=()):
@@ -252,9 +827,28 @@ class SQLite3DB():
                 args: If the query has to be protected from sql injection,
                    the args to substitute can be passed as a tuple.
         """
-        fire('db.operation_perfomed', query, args)
+        self._flush_if_due(self._current_state().status)
+
         return self.cursor.execute(query, args)
 
+    @fires_before('db.operation_called')
+    @fires_after('db.operation_perfomed')
+    def execute_in_new_cursor(self, query, args=()):
+        """ Run a query without commit in its own cursor, so other queries
+            can be run while its rows are being fetched.
+
+            Args:
+                query: The query to be executed.
+                args: If the query has to be protected from sql injection,
+                   the args to substitute can be passed as a tuple.
+
+            Returns:
+                The new cursor.
+        """
+        self._flush_if_due(self._current_state().status)
+
+        return self.connection.execute(query, args)
+
     def execute_many(self, query, args=()):
         """ Run a query multiple times with commit (for Create operations). 
 
@@ -263,14 +857,40 @@ class SQLite3DB():
                 args: If the query has to be protected from sql injection,
                    the args to substitute can be passed as an iterator that yields tuples.
         """
-        return self.cursor.executemany(query, (tuple(field) for field in args))
+        cursor = self.cursor.executemany(query, (tuple(field) for field in args))
+        self._commit_write()
+        self._table_written(query)
+
+        return cursor
+
+    def _table_written(self, query):
+        """ Fire db.table_written if the query wrote to a table.
+
+            Args:
+                query: The executed query.
+        """
+        table_name = written_table(query)
+
+        if table_name is None:
+            return
+
+        if self.connection.in_transaction:
+            self._current_state().status.uncommited_tables.add(table_name)
+
+        fire('db.table_written', table_name)
 
     @fires_before('db.transaction_started')
     def transaction_begin(self):
         """ Init a transaction (prevents edition operations to not be saved).
         """
+        # The writes pending from before belong to no transaction, so they must not be rolled back
+        self.flush()
         self._save = False
 
+        # Begin explicitly, or the first savepoint would become the transaction
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN')
+
     @fires_after('db.transaction_ended')
     def transaction_end(self):
         """ Ends a started transaction and commits the changes made to the database.
@@ -279,20 +899,55 @@ class SQLite3DB():
 
     @contextlib.contextmanager
     def transaction(self):
-        """ Starts a new transaction context.
+        """ Starts a new transaction context. If a transaction is already started, 
+            the context is a savepoint of it, which is undone if an exception is raised 
+            inside of it, and commited along with the outer transaction.
         """
+        status = self._current_state().status
+
+        if not status.save:
+            with self._savepoint(status):
+                yield
+
+            return
+
         self.transaction_begin()
         
         try:
             yield
-            self.connection.commit()
+            self._commit(self.connection, status)
         except Exception as E:
             self.connection.rollback()
+            status.uncommited_tables.clear()
             fire('db.transaction_failed', E)
             raise E
         finally:
             self.transaction_end()
 
+    @contextlib.contextmanager
+    def _savepoint(self, status):
+        """ Starts a savepoint context inside the current transaction.
+
+            Args:
+                status: The ConnectionStatus of the current connection.
+        """
+        savepoint = 'oxygenrm_savepoint_{}'.format(status.savepoints)
+        status.savepoints += 1
+
+        # A new cursor is used, so the results of the shared one are not lost
+        self.connection.execute('SAVEPOINT ' + savepoint)
+
+        try:
+            yield
+            self.connection.execute('RELEASE ' + savepoint)
+        except Exception as E:
+            self.connection.execute('ROLLBACK TO ' + savepoint)
+            self.connection.execute('RELEASE ' + savepoint)
+            fire('db.transaction_failed', E)
+            raise E
+        finally:
+            status.savepoints -= 1
+
     def modify_columns(self, table_name, add_columns, drop_columns, edit_columns, old_columns):
         """ Modify the table columns in the database.
 
@@ -304,7 +959,11 @@ class SQLite3DB():
                 old_columns: A ColumnData iterator with the current columns of the table.
         """
         temp_table_name = 'temp_oxygenrm_sqlite3_table_change'
-        self.execute_without_saving('PRAGMA foreing_keys=OFF')
+
+        # The foreign keys can only be turned off outside transactions
+        self.flush()
+        foreign_keys = self.execute_without_saving('PRAGMA foreign_keys').fetchone()[0]
+        self.execute_without_saving('PRAGMA foreign_keys=OFF')
         # DEAL WITH INDEXES AND TRIGGERS
         
         columns = {}
@@ -320,19 +979,22 @@ class SQLite3DB():
             raise ValueError('All the columns of table {} cannot be dropped'.format(table_name))
 
         columns_to_create = list(columns.values()) + list(add_columns)
-        with self.transaction():            
-            self.execute('PRAGMA foreing_keys=OFF')
-
-            self.create_table(temp_table_name, columns_to_create)
-            self.execute('INSERT INTO {} ({}) SELECT {} FROM {}'.format(
-                temp_table_name, ', '.join(col.name for col in columns.values()), 
-                ', '.join(old_name + ' as ' + col.name for old_name, col in columns.items()), table_name
-            ))
-            
-            self.drop_table(table_name)
-            self.rename_table(temp_table_name, table_name)
-
-            self.execute('PRAGMA foreing_keys=ON')
+        try:
+            with self.transaction():            
+                self.create_table(temp_table_name, columns_to_create)
+                self.execute('INSERT INTO {} ({}) SELECT {} FROM {}'.format(
+                    temp_table_name, ', '.join(col.name for col in columns.values()), 
+                    ', '.join(old_name + ' as ' + col.name for old_name, col in columns.items()), table_name
+                ))
+                
+                self.drop_table(table_name)
+                self.rename_table(temp_table_name, table_name)
+        finally:
+            self.execute_without_saving('PRAGMA foreign_keys={}'.format(foreign_keys))
+
+    """ Whether the write operations can return the written rows.
+    """
+    supports_returning = SUPPORTS_RETURNING
 
     """ The name of the DB driver.
     """
@@ -10,6 +10,7 @@ from collections import namedtuple
 
 from OxygenRM.internals.QueryBuilder import QueryBuilder
 from OxygenRM.internals.ModelContainer import ModelContainer
+from OxygenRM.session import current_session
 from OxygenRM.internals.RelationQueryBuilder import HasManyQueryBuilder, BelongsToManyQueryBuilder, HasOneQueryBuilder, BelongsToOneQueryBuilder
 
 class Field(metaclass=abc.ABCMeta):
@@ -18,6 +19,16 @@ class Field(metaclass=abc.ABCMeta):
     """
     _attr = None
 
+    """ The key of the field value in the model values. The attribute name,
+        or its position for compact models.
+    """
+    _key = None
+
+    """ Whether the values can be changed without being set, so they have
+        to be compared with the loaded ones every time the model is saved.
+    """
+    mutable = False
+
     def __init__(self, null=False):
         """ The abstract base class for defining a Model property that is in the database as a column.
 
@@ -35,7 +46,7 @@ class Field(metaclass=abc.ABCMeta):
             Returns:
                 The value of the model
         """
-        return self.value_formatter(model._field_values[self._attr])
+        return self.value_formatter(model._field_values[self._key])
 
     def set(self, model, value):
         """ Validate and set the the value of the column.
@@ -46,7 +57,13 @@ class Field(metaclass=abc.ABCMeta):
         """
         self.validate(value)
         
-        model._field_values[self._attr] = self.value_processor(value)
+        model._field_values[self._key] = self.value_processor(value)
+        model._dirty.add(self._attr)
+
+        # The session must not forget the changed model before flushing it
+        session = current_session()
+        if session is not None:
+            session.keep(model)
 
     def validate(self, value):
         """ Decide wheter a non-null value that wants to be set is valid.
@@ -172,34 +189,38 @@ class Relation(Field):
         self._other_name = on_other_col  
         self._setted_up = False
 
+    """ Whether the parting model has the foreign key, so the related models are saved first.
+    """
+    holds_foreign_key = False
+
+    def set(self, model, value):
+        """ The related models are assigned with rel(), so there's nothing to store.
+        """
+        pass
+
     def get(self, starting_model):
         if not self._setted_up:
             self._set_up()
 
-        # Move elsewhere
-        model_container = starting_model.relations_loaded.get(self._attr)
-        
-        if model_container:
-            model_id = getattr(starting_model, self._self_name)
+        # A model referenced by id may be loaded already, or cached
+        self._model.set_up()
 
-            predicate = lambda model: getattr(model, self._other_name) == model_id
-            
-            if self._how_much == 'many':
-                result = model_container.filter(predicate)
-            else:
-                result = model_container.find(predicate)
+        if self._how_much == 'one' and self._other_name == self._model.id_key:
+            if current_session() is not None or self._model._pk_cache is not None:
+                id_value = getattr(starting_model, self._self_name)
+
+                return None if id_value is None else self._model.find(id_value)
+
+        # Eager loaded already, grouped for each parting model
+        if self._attr in starting_model.relations_loaded:
+            return starting_model.relations_loaded[self._attr]
 
-            setattr(starting_model, self._attr, result)
-        
         qb = self.query_builder(starting_model)
 
         if self._how_much == 'many':
-            result = qb.get()
+            return qb.get()
         else:
-            result = qb.first()
-
-        starting_model.relations_loaded[self._attr] = result
-        return result
+            return qb.first()
 
     def eager_load_builder(self):
         """ Used when a class is to be eager loaded. Allows to get every one of the
@@ -244,6 +265,15 @@ class Relation(Field):
             self._set_up()
 
         return self._self_name
+
+    @property
+    def eager_load_key(self):
+        """ Used to group the eager loaded models by the parting model they belong to.
+        """
+        if not self._setted_up:
+            self._set_up()
+
+        return self._other_name
     
 class Has(Relation):
     def _set_up(self):
@@ -262,6 +292,8 @@ class Has(Relation):
         return class_to_use(self._model, parting_model, self._self_name, self._other_name)
 
 class BelongsTo(Relation):
+    holds_foreign_key = True
+
     def _set_up(self):
         if not self._other_name:
             self._other_name = self.parting_model.id_key
@@ -301,23 +333,24 @@ class Multiple(Relation):
 
     parting_model_prop = 'id'
 
-    def get(self, parting_model):
+    _how_much = 'many'
+
+    @property
+    def eager_load_key(self):
         if not self._setted_up:
             self._set_up()
 
-        # Move elsewhere
-        model_container = parting_model.relations_loaded.get(self._attr)
-        
-        if model_container:
-            model_id = parting_model.get_id()
+        return self._self_name
 
-            predicate = lambda model: getattr(model, self._self_name) == model_id
-            result = model_container.filter(predicate)
-        else:
-            result = self.query_builder(parting_model).get()
+    def get(self, parting_model):
+        if not self._setted_up:
+            self._set_up()
+
+        # Eager loaded already, grouped for each parting model
+        if self._attr in parting_model.relations_loaded:
+            return parting_model.relations_loaded[self._attr]
 
-        setattr(parting_model, self._attr, result)
-        return result
+        return self.query_builder(parting_model).get()
 
     def query_builder(self, parting_model):
         if not self._setted_up:
@@ -384,6 +417,8 @@ class JSON(Field):
                 The class passed must subclass dict or list.
     """
 
+    mutable = True
+
     def __init__(self, default_class=dict):
         if default_class not in (dict, list):
             raise ValueError('Wrong default constructor {}. Must be a class constructor of dict or list'.format(default_class))
@@ -403,6 +438,10 @@ class JSON(Field):
         constructor = self._make_container_jsonable(value.__class__)
         return constructor(value)
 
+    def db_set(self, model, value):
+        # Serialized, so it can be compared with the loaded value
+        return value.to_json() if getattr(value, 'conformable', None) else value
+
     def db_get(self, value):
         if value is None:
             value = self._default_constructor()
@@ -463,6 +502,8 @@ class Pickle(Field):
             kwargs: If the default_cons is callable, the args will be passed as **kwargs to it.
             strict: Whether to mmake sure that the the column must have just the default_cons type.
     """
+    mutable = True
+
     def __init__(self, default_cons=None, args=(), kwargs={}, strict=False):
         self.default_cons = default_cons if callable(default_cons) else lambda: default_cons
 
@@ -1,10 +1,67 @@
+import weakref
+
 from copy import deepcopy
+from collections import defaultdict
+from itertools import groupby, islice
+from operator import itemgetter
 
 from OxygenRM.internals.QueryBuilder import QueryBuilder
+from OxygenRM.internals.SQL_builders import Count, Sum, Max, Min, Avg
+from OxygenRM.internals.ModelContainer import ModelContainer
+from OxygenRM.internals.LRUCache import LRUCache, shallow_sizeof
+from OxygenRM.events import subscribe
 from OxygenRM.internals.fields import *
+from OxygenRM.session import current_session
 
 import OxygenRM as O
 
+""" The types of the values that can be kept in a model snapshot without being copied.
+"""
+IMMUTABLE_TYPES = frozenset((str, int, float, bool, bytes, type(None)))
+
+""" The primary key caches of the models, by table name.
+"""
+PK_CACHES = defaultdict(weakref.WeakSet)
+
+""" The events after which the cached records of a table may be outdated.
+"""
+INVALIDATING_EVENTS = (
+    'db.table_written',
+    'db.updated_records', 
+    'db.deleted_records', 
+    'db.upserted_records', 
+    'db.truncated_table', 
+    'db.dropped_table', 
+    'db.renamed_table',
+)
+
+def invalidate_pk_caches(table_name, *args, **kwargs):
+    """ Forget the cached records of the given table.
+
+        Args:
+            table_name: The name of the table, optionally followed by an alias.
+    """
+    for cache in tuple(PK_CACHES.get(table_name.split(' ')[0], ())):
+        cache.invalidate()
+
+def invalidate_all_pk_caches(*args, **kwargs):
+    """ Forget every cached record. Used when a transaction is rolled back.
+    """
+    for caches in tuple(PK_CACHES.values()):
+        for cache in tuple(caches):
+            cache.invalidate()
+
+for event in INVALIDATING_EVENTS:
+    subscribe(event, invalidate_pk_caches)
+
+subscribe('db.all_tables_dropped', invalidate_all_pk_caches)
+subscribe('db.transaction_failed', invalidate_all_pk_caches)
+
+def cached_row_sizeof(entry):
+    """ Get the memory used by a cached (keys, row) entry. The keys are shared.
+    """
+    return shallow_sizeof(entry[1])
+
 class ModelHasNoIdError(Exception):
     def __init__(self, model, method):
         """ An error to be raised when an operation that requires a model with
@@ -18,10 +75,32 @@ class ModelHasNoIdError(Exception):
         self.model = model
         self.method = method
 
+""" The instance attributes of the compact models.
+"""
+COMPACT_SLOTS = (
+    '_field_values', 
+    '_original_values', 
+    '_creating_new', 
+    '_pivot_query', 
+    '_lazy_pivots', 
+    '_lazy_relations_loaded', 
+    '_lazy_rel_queue', 
+    '_extra', 
+    '_loaded_pivot',
+    '_dirty',
+)
+
 class MetaModel(type):
     """ The metaclass that allows the model subclasses to construct queries, when
         accessing static methods. 
     """
+    def __new__(mcs, name, bases, namespace):
+        # The compact models have no instance __dict__
+        if namespace.get('compact') and '__slots__' not in namespace:
+            namespace['__slots__'] = COMPACT_SLOTS
+
+        return super().__new__(mcs, name, bases, namespace)
+
     def __getattr__(cls, name):
         if not cls._set_up:
             cls._set_up_model()
@@ -32,6 +111,8 @@ class MetaModel(type):
             return None
 
 class Model(metaclass=MetaModel):
+    __slots__ = ('__weakref__',)
+
     # PRIVATE
     """ The original field values of the model.
     """
@@ -51,6 +132,11 @@ class Model(metaclass=MetaModel):
     """
     _fields = {}
 
+    """ The LRUCache of the records by id, if enabled with cache_size.
+        @static
+    """
+    _pk_cache = None
+
     """ The name of the table. Used in the metaclass
         @static
     """
@@ -79,6 +165,8 @@ class Model(metaclass=MetaModel):
             # Checks every class attribute to find the model DB fields
             if isinstance(value, Field):
                 if not isinstance(value, Relation):
+                    # The compact models keep their values in a list, in the fields order
+                    value._key = len(cls._fields) if cls.compact else attr
                     cls._fields[attr] = value
                 
                 value._attr = attr
@@ -103,6 +191,12 @@ class Model(metaclass=MetaModel):
         cls._set_up = True
         cls._self_name = cls.__name__
         cls._fields_names = frozenset(cls._fields)
+        cls._row_layouts = {}
+
+        cls._pk_cache = None
+        if cls.cache_size and id_key is not None:
+            cls._pk_cache = LRUCache(cls.cache_size, ttl=cls.cache_ttl, maxbytes=cls.cache_bytes, sizeof=cached_row_sizeof)
+            PK_CACHES[cls.table_name].add(cls._pk_cache)
 
     def _convert_orig_values_to_conditions(self):
         """ Convert the internal _original_values
@@ -120,21 +214,169 @@ class Model(metaclass=MetaModel):
             Args:
                 values: A dict with the values of the model.
         """
-        self._original_values = deepcopy(values)
+        self._hydrate(tuple(values), tuple(values.values()))
 
-        self._rel_queue = []
-        self._field_values = {}
+    def _hydrate(self, keys, row, from_db=False):
+        """ Set up the internal model values from a row.
+
+            Args:
+                keys: A tuple with the column names of the row.
+                row: A sequence with the values of the row, in the order of the keys.
+                from_db: Whether the values come straight from the database, 
+                    so they don't need to be copied.
+        """
+        fields, extra_columns = self._row_layout(keys)
+
+        if from_db or all(type(value) in IMMUTABLE_TYPES for value in row):
+            self._original_values = dict(zip(keys, row))
+        else:
+            self._original_values = {key: deepcopy(value) for key, value in zip(keys, row)}
+
+        self._lazy_rel_queue = None
+        self._dirty = set()
 
         # Set's up the internal values using the special setters
-        for field, col in self._fields.items():
-            field_val = values.get(field, None)
+        if self.compact:
+            self._field_values = [col.db_get(None if index is None else row[index]) for field, col, index in fields]
+        else:
+            field_values = {}
+            for field, col, index in fields:
+                field_values[field] = col.db_get(None if index is None else row[index])
 
-            self._field_values[field] = col.db_get(field_val)
+            self._field_values = field_values
 
         # Sets up the values that are not "assigned" to the model. Useful for relations
-        field_values_not_in_model = ((field, values[field]) for field in frozenset(values) - self._fields_names)  
-        for field, value in field_values_not_in_model:
-            setattr(self, field, value)
+        if self.compact and extra_columns:
+            self._extra = {field: row[index] for field, index in extra_columns}
+        else:
+            for field, index in extra_columns:
+                setattr(self, field, row[index])
+
+    @classmethod
+    def _row_layout(cls, keys):
+        """ Get where the model fields are in the rows with the given columns. 
+            It's calculated once for every set of columns.
+
+            Args:
+                keys: A tuple with the column names of the row.
+
+            Returns:
+                A tuple with a (field name, field, index or None if missing) tuple for every field, 
+                and a (column name, index) tuple for every column that isn't a field.
+        """
+        try:
+            return cls._row_layouts[keys]
+        except KeyError:
+            pass
+
+        indexes = {key: index for index, key in enumerate(keys)}
+        layout = (
+            tuple((field, col, indexes.get(field)) for field, col in cls._fields.items()),
+            tuple((key, index) for key, index in indexes.items() if key not in cls._fields_names)
+        )
+
+        cls._row_layouts[keys] = layout
+        return layout
+
+    @classmethod
+    def _from_row(cls, keys, row, pivot_query=None):
+        """ Build a model of a record gotten from the database.
+
+            Args:
+                keys: A tuple with the column names of the row.
+                row: The database row.
+                pivot_query: If the model is gotten from a Multiple query, 
+                    a QueryBuilder to get the pivot middle table.
+
+            Returns:
+                The model.
+        """
+        if not cls._set_up:
+            cls._set_up_model()
+
+        # In a session, the already loaded instance is kept as it is
+        session = current_session()
+        if session is not None and cls.id_key in keys:
+            loaded = session.get(cls, row[keys.index(cls.id_key)])
+
+            if loaded is not None:
+                return loaded
+
+        model = cls.__new__(cls)
+        model._init_state(False, pivot_query)
+        model._hydrate(keys, row, from_db=True)
+
+        return model if session is None else session.register(model)
+
+    def _init_state(self, creating_new, pivot_query):
+        """ Set up the internal state of a new instance, besides its values.
+
+            Args:
+                creating_new: Wheter the model is not in the database already.
+                pivot_query: The QueryBuilder to get the pivot middle table, if any.
+        """
+        self._creating_new = creating_new
+        self._pivot_query = pivot_query
+
+        # The relations bookkeeping is created when first used
+        self._lazy_pivots = None
+        self._lazy_relations_loaded = None
+        self._lazy_rel_queue = None
+
+    @property
+    def relations_loaded(self):
+        """ The eager loaded relations of the model, by name.
+        """
+        if self._lazy_relations_loaded is None:
+            self._lazy_relations_loaded = {}
+
+        return self._lazy_relations_loaded
+
+    @relations_loaded.setter
+    def relations_loaded(self, value):
+        self._lazy_relations_loaded = value
+
+    @property
+    def _pivots(self):
+        """ The pivot models to be saved with the model, by relation name.
+        """
+        if self._lazy_pivots is None:
+            self._lazy_pivots = {attr: None for attr in self._pivot_classes}
+
+        self._keep_in_session()
+        return self._lazy_pivots
+
+    @property
+    def _rel_queue(self):
+        """ The pending relation operations, to be run when the model is saved.
+        """
+        if self._lazy_rel_queue is None:
+            self._lazy_rel_queue = []
+
+        self._keep_in_session()
+        return self._lazy_rel_queue
+
+    @_rel_queue.setter
+    def _rel_queue(self, value):
+        self._lazy_rel_queue = value
+
+    def _keep_in_session(self):
+        """ Make the current session keep the model until it's flushed, as its relations are being changed.
+        """
+        session = current_session()
+        if session is not None:
+            session.keep(self)
+
+    def __getattr__(self, name):
+        # Only reached when the attribute is missing. The compact models keep
+        # the columns that are not fields apart.
+        if name != '_extra':
+            extra = getattr(self, '_extra', None)
+
+            if extra and name in extra:
+                return extra[name]
+
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
 
     # PUBLIC
     
@@ -144,6 +386,30 @@ class Model(metaclass=MetaModel):
     """
     table_name = ''
 
+    """ Whether the instances are compact: without __dict__ and with their
+        values in a list, so they take less memory. 
+        Their columns that aren't fields can't be set as attributes, but can be read.
+        @static
+    """
+    compact = False
+
+    """ The maximum number of records to keep in memory, by id, for find and 
+        the BelongsTo relations. They are forgotten whenever the table is 
+        written through the ORM. If 0, the records are not cached.
+        @static
+    """
+    cache_size = 0
+
+    """ The seconds after which a cached record is forgotten. If None, it's kept until invalidated.
+        @static
+    """
+    cache_ttl = None
+
+    """ The maximum bytes used by the cached records. If None, only their number is limited.
+        @static
+    """
+    cache_bytes = None
+
     """ The table id key name.
         @static
     """
@@ -162,11 +428,7 @@ class Model(metaclass=MetaModel):
         if not self._set_up:
             self.__class__._set_up_model()
 
-        self._creating_new = creating_new
-        self._pivot_query = pivot_query
-        self._pivots = {attr: None for attr in self._pivot_classes}
-        self.relations_loaded = {}
-
+        self._init_state(creating_new, pivot_query)
         self._update_values(values)
 
     @classmethod
@@ -197,13 +459,228 @@ class Model(metaclass=MetaModel):
         if not cls._set_up:
             cls._set_up_model()
 
-        O.db.create(cls.table_name, **values)
+        row = O.db.create(cls.table_name, **values)
 
-        if return_model and not cls._dumb:
+        if not return_model or cls._dumb:
+            return True
+        elif row is not None:
+            return cls._from_row(tuple(row.keys()), row)
+        else:
             return cls.where(cls.id_key, '=', O.db.last_id()).first()
+
+    @classmethod
+    def craft_many(cls, rows, chunk_size=500, return_models=False):
+        """ Create many records in the database, in a single transaction and using as few 
+            statements as possible. The values are converted by the model fields, as in save.
+
+            Args:
+                rows: An iterator of dicts with the values of every record, or of new models.
+                    The models with relations or pivots to save are saved one by one, as in save.
+                chunk_size: The maximum number of records to insert with a single statement.
+                    It will be lowered if needed to keep the values under the database limit.
+                return_models: Wheter to return the created models.
+
+            Return:
+                True if return_models is false.
+                A ModelContainer with the created models, with their id set, if not.
+        """
+        if not cls._set_up:
+            cls._set_up_model()
+
+        created = []
+        max_variables = O.db.max_variables()
+
+        # Every dict row is converted with the same placeholder model, unless the models are wanted
+        placeholder = None if return_models else cls()
+        prepared_rows = (cls._prepare_for_bulk_insert(row, placeholder) for row in rows)
+        returning = cls.id_key if O.db.supports_returning and not cls._dumb else None
+
+        with O.db.transaction():
+            # Consecutive rows with the same keys can be inserted by the same statement
+            for keys, group in groupby(prepared_rows, key=itemgetter(0)):
+                group = map(itemgetter(1, 2), group)
+
+                if keys is None:
+                    for model, values in group:
+                        model.save()
+                        created.append(model)
+
+                    continue
+
+                rows_per_statement = max(1, min(chunk_size, max_variables // max(len(keys), 1)))
+
+                for chunk in iter(lambda: tuple(islice(group, rows_per_statement)), ()):
+                    ids = O.db.create_bulk(cls.table_name, keys, (values for model, values in chunk), returning)
+
+                    # The given models are set up anyway, so saving them later doesn't insert them again
+                    cls._set_up_created(keys, chunk, ids, placeholder)
+
+                    if return_models:
+                        created.extend(model for model, values in chunk)
+
+        if return_models:
+            return ModelContainer(None, cls, calculated_models=created)
         else:
             return True
 
+    @classmethod
+    def upsert(cls, values, conflict, update=None, return_model=True):
+        """ Create a record in the database or, if one with the same conflict fields 
+            already exists, update it. Done with a single statement.
+
+            Args:
+                values: A dict with the values of the record.
+                conflict: An iterator with the unique fields that identify the record.
+                update: An iterator with the fields to update if the record exists. 
+                    If None, every given field but the conflict ones is updated.
+                return_model: Wheter to return the created or updated model.
+
+            Return:
+                True if return_model is false.
+                A self model of the stored row if not.
+        """
+        if not cls._set_up:
+            cls._set_up_model()
+
+        conflict = tuple(conflict)
+        keys, model, db_values = cls._prepare_for_insert(values, cls())
+        values = dict(zip(keys, db_values))
+
+        if update is None:
+            update = (key for key in keys if key not in conflict)
+
+        row = O.db.upsert(cls.table_name, values, conflict, tuple(update))
+
+        if not return_model:
+            return True
+        elif row is not None:
+            return cls._from_row(tuple(row.keys()), row)
+        else:
+            return cls.where_many((field, '=', values[field]) for field in conflict).first()
+
+    @classmethod
+    def upsert_many(cls, rows, conflict, update=None):
+        """ Create or update many records in the database, in a single transaction. 
+            The rows that set the same fields are upserted with a single prepared statement.
+
+            Args:
+                rows: An iterator of dicts with the values of every record.
+                conflict: An iterator with the unique fields that identify every record.
+                update: An iterator with the fields to update if a record exists. 
+                    If None, every given field but the conflict ones is updated.
+
+            Return:
+                True
+        """
+        if not cls._set_up:
+            cls._set_up_model()
+
+        conflict = tuple(conflict)
+        # Every group of rows uses the fields to update
+        update = tuple(update) if update is not None else None
+        placeholder = cls()
+        groups = {}
+
+        for row in rows:
+            keys, model, values = cls._prepare_for_insert(row, placeholder)
+            groups.setdefault(keys, []).append(values)
+
+        with O.db.transaction():
+            for keys, values in groups.items():
+                fields_to_update = update if update is not None else (key for key in keys if key not in conflict)
+                O.db.upsert_many(cls.table_name, keys, values, conflict, tuple(fields_to_update))
+
+        return True
+
+    @classmethod
+    def _prepare_for_insert(cls, row, placeholder=None):
+        """ Get the values to insert of a row.
+
+            Args:
+                row: A dict with the record values or a new model.
+                placeholder: The model to use for the dicts values conversion.
+                    If None, a new model is crafted for every dict.
+
+            Returns:
+                A tuple with the fields to insert, the row model and the values for the database.
+        """
+        if isinstance(row, Model):
+            model = row
+            values = {
+                field_name: field_instance.db_set(model, model._field_values[field_instance._key]) 
+                for field_name, field_instance in cls._fields.items()
+            }
+        else:
+            model = placeholder if placeholder is not None else cls()
+            values = {}
+
+            for field_name, value in row.items():
+                field_instance = cls._fields.get(field_name)
+
+                if field_instance is None:
+                    values[field_name] = value
+                    continue
+
+                value = field_instance.value_processor(value)
+
+                if model is not placeholder:
+                    model._field_values[field_instance._key] = value
+
+                values[field_name] = field_instance.db_set(model, value)
+
+        # Let the database set the ids that are not given
+        if not cls._dumb and values.get(cls.id_key, None) is None:
+            values.pop(cls.id_key, None)
+
+        return tuple(values), model, tuple(values.values())
+
+    @classmethod
+    def _prepare_for_bulk_insert(cls, row, placeholder=None):
+        """ Get the values to insert of a row, as _prepare_for_insert does. The new models with 
+            relations or pivots to save are saved apart, so their fields are None.
+
+            Args:
+                row: A dict with the record values or a new model.
+                placeholder: The model to use for the dicts values conversion.
+
+            Returns:
+                A tuple with the fields to insert, the row model and the values for the database.
+        """
+        if isinstance(row, Model) and row._has_pending_relations():
+            return None, row, None
+
+        return cls._prepare_for_insert(row, placeholder)
+
+    @classmethod
+    def _set_up_created(cls, keys, chunk, ids, placeholder=None):
+        """ Update the models inserted in a single statement so they 
+            reflect the created records.
+
+            Args:
+                keys: The inserted fields.
+                chunk: A tuple of (model, inserted values) tuples. 
+                ids: A list with the ids of the inserted records, in order. 
+                    Without RETURNING support, the id of the last inserted record.
+                placeholder: The model used for the dicts values conversion, which is left as it is.
+        """
+        set_ids = not cls._dumb and cls.id_key not in keys
+
+        if set_ids and not isinstance(ids, list):
+            # Without RETURNING, the ids given to the rows inserted together are assumed consecutive
+            ids = range(ids - len(chunk) + 1, ids + 1)
+
+        for index, (model, values) in enumerate(chunk):
+            if model is placeholder:
+                continue
+
+            model._original_values = dict(zip(keys, values))
+            model._creating_new = False
+            model._dirty = set()
+
+            if set_ids:
+                model._original_values[cls.id_key] = ids[index]
+                model._field_values[cls._fields[cls.id_key]._key] = ids[index]
+
     @classmethod
     def find(cls, *indexes):
         """ Find the models with the specified id value(s).
@@ -228,6 +705,21 @@ class Model(metaclass=MetaModel):
         if cls._dumb:
             raise ModelHasNoIdError(cls, 'find')
 
+        session = current_session()
+        if session is not None and indexes_amount == 1:
+            loaded = session.get(cls, indexes[0])
+
+            if loaded is not None:
+                return loaded
+
+        if cls._pk_cache is not None:
+            models = cls._find_cached(indexes)
+
+            if indexes_amount == 1:
+                return models[0] if models else None
+            else:
+                return ModelContainer(None, cls, calculated_models=models)
+
         result = cls.where_in(cls.id_key, indexes)
         
         if indexes_amount == 1:
@@ -235,6 +727,54 @@ class Model(metaclass=MetaModel):
         else:
             return result.get()
 
+    @classmethod
+    def _find_cached(cls, indexes):
+        """ Get the models with the given ids, querying only the records that are not cached.
+
+            Args:
+                indexes: A sequence of id values.
+
+            Returns:
+                A list with the models found, in the order of the indexes.
+        """
+        # The uncommited changes must not be read by the other connections
+        cache = cls._pk_cache if not O.db.in_transaction() else None
+        found = {}
+        missing = []
+
+        for index in indexes:
+            entry = cache.get(index) if cache is not None else None
+
+            if entry is None:
+                missing.append(index)
+            else:
+                found[index] = entry
+
+        if missing:
+            keys, rows = cls.where_in(cls.id_key, missing)._fetch_raw((), False)
+            id_position = keys.index(cls.id_key)
+
+            for row in rows:
+                found[row[id_position]] = (keys, row)
+
+                if cache is not None:
+                    cache.set(row[id_position], (keys, row))
+
+        return [cls._from_row(*found[index]) for index in indexes if index in found]
+
+    @classmethod
+    def cache_stats(cls):
+        """ Get the usage of the primary key cache.
+
+            Returns:
+                A dict with the hits, misses, size, maxsize and bytes if limited.
+                None if the model is not cached.
+        """
+        if not cls._set_up:
+            cls._set_up_model()
+
+        return cls._pk_cache.stats() if cls._pk_cache is not None else None
+
     @classmethod
     def destroy(cls, *indexes):
         """ Delete the models with the specified id value(s).
@@ -276,50 +816,179 @@ class Model(metaclass=MetaModel):
         return getattr(self, self.id_key)
                                 
     def save(self):
-        """ Commit the current changes to the database.
+        """ Commit the current changes to the database. Only the fields 
+            that changed since the model was loaded are updated.
 
             Return:
                 self
         """
-        values_for_db = {}
-        for field_name, field_instance in self._fields.items():
-            values_for_db[field_name] = field_instance.db_set(self, self._field_values[field_name])
+        if self._creating_new:
+            values_for_db = {}
+            for field_name, field_instance in self._fields.items():
+                values_for_db[field_name] = field_instance.db_set(self, self._field_values[field_instance._key])
+        else:
+            values_for_db = self._changed_db_values()
+
+            if not values_for_db and not self._has_pending_relations():
+                return self
 
         # Make sure that the model + the relationships are saved in a transaction
         with O.db.transaction():            
+            row = None
+
             if self._creating_new:
-                O.db.create(self.table_name, **values_for_db)
-            else:
+                row = O.db.create(self.table_name, **values_for_db)
+            elif values_for_db:
                 if self._dumb:
                     # If the model has no primary key, then do a "where_many" with all fields and hope for the best 
                     O.warn(f"Updating model {self.table_name} without primary key is error prone.")
                     self.__class__.where_many(self._convert_orig_values_to_conditions()).update(values_for_db)
                 else:
-                    self.__class__.where(self.id_key, '=', self.get_id()).update(values_for_db)
-
-            # Deal with all simple relations
-            for rel_function in self._rel_queue:
-                rel_function()
+                    rows = self.__class__.where(self.id_key, '=', self.get_id()).update_returning(values_for_db)
+                    row = rows[0] if rows else None
 
+            id_of_row = None
             if not self._dumb:
-                id_of_row = O.db.last_id() if self._creating_new else self.get_id()
+                if row is not None:
+                    id_of_row = row[self.id_key]
+                else:
+                    id_of_row = O.db.last_id() if self._creating_new else self.get_id()
 
-                # Deal with ManyToMany middle table saving
-                for pivot in self._pivots.values():
-                    if pivot is None:
-                        continue
+            self._save_relations(id_of_row)
 
-                    pivot.set_self_id(id_of_row)
-                    pivot.save()
+            # The eager loaded relations may be outdated now, so they are queried again
+            self._lazy_relations_loaded = None
 
+            if self._dumb:
+                self._original_values.update(values_for_db)
+                self._dirty = set()
+            elif row is not None or self._creating_new or values_for_db:
                 # When updating, update the values with the one gotten from the database
-                row = QueryBuilder.table(self.table_name).where(self.id_key, '=', id_of_row).first()
-                self._update_values(dict(zip(row.keys(), tuple(row))))
+                if row is None:
+                    row = QueryBuilder.table(self.table_name).where(self.id_key, '=', id_of_row).first()
+
+                self._hydrate(tuple(row.keys()), row, from_db=True)
 
             self._creating_new = False
 
+        session = current_session()
+        if session is not None:
+            session.register(self)
+
         return self
 
+    def _has_pending_relations(self):
+        """ Whether there are relation operations or pivots waiting for the model to be saved.
+
+            Returns:
+                bool.
+        """
+        pivots = self._lazy_pivots
+
+        return bool(self._lazy_rel_queue) or bool(pivots and any(pivots.values()))
+
+    def _save_relations(self, id_of_row):
+        """ Run the pending relations operations of the model.
+
+            Args:
+                id_of_row: The id of the model in the database. None if the model has no Id.
+        """
+        # Deal with all simple relations
+        for rel_function in self._rel_queue:
+            rel_function()
+
+        self._rel_queue = []
+
+        if id_of_row is None:
+            return
+
+        # Deal with ManyToMany middle table saving
+        for pivot in self._pivots.values():
+            if pivot is None:
+                continue
+
+            pivot.set_self_id(id_of_row)
+            pivot.save()
+
+    def _changed_db_values(self):
+        """ Get the values for the database of the fields that differ from the loaded ones.
+            Only the fields that were set, and the mutable ones, are converted and compared. 
+            If any changed, the fields updated on every save are added.
+
+            Returns:
+                A dict with the changed field names and their values for the database.
+        """
+        changed = {}
+        original_values = self._original_values
+        dirty = self._dirty
+
+        for field_name, field_instance in self._fields.items():
+            if field_name not in dirty and not field_instance.mutable:
+                continue
+
+            value = field_instance.db_set(self, self._field_values[field_instance._key])
+
+            if field_name not in original_values or value != original_values[field_name]:
+                changed[field_name] = value
+
+        if changed:
+            for field_name, field_instance in self._fields.items():
+                if getattr(field_instance, 'update_date', False) and field_name not in changed:
+                    changed[field_name] = field_instance.db_set(self, self._field_values[field_instance._key])
+
+        return changed
+
+    @classmethod
+    def save_many(cls, models):
+        """ Commit the changes of many models to the database, in a single transaction.
+
+            The new models are inserted as in craft_many, and the changed fields of the 
+            others are updated with one statement for every set of changed fields.
+            Unlike save, the models are not fetched again from the database.
+
+            Args:
+                models: An iterator of models of this class.
+
+            Return:
+                True
+        """
+        if not cls._set_up:
+            cls._set_up_model()
+
+        models = tuple(models)
+        new_models = [model for model in models if model._creating_new]
+        saved_models = [model for model in models if not model._creating_new]
+
+        with O.db.transaction():
+            if new_models:
+                cls.craft_many(new_models, return_models=True)
+
+            if cls._dumb:
+                # Without primary key there's no way to tell the rows apart in a single statement
+                for model in saved_models:
+                    model.save()
+
+                return True
+
+            rows = []
+            for model in saved_models:
+                changed = model._changed_db_values()
+                changed.pop(cls.id_key, None)
+
+                if changed:
+                    rows.append(dict(changed, **{cls.id_key: model.get_id()}))
+                    model._original_values.update(changed)
+
+                model._dirty = set()
+
+            QueryBuilder.table(cls.table_name).bulk_update(rows, key=cls.id_key)
+
+            # The relations of the new models were saved by craft_many
+            for model in saved_models:
+                model._save_relations(model.get_id())
+
+        return True
+
     def delete(self):
         """ Remove the working model from the database.
         """
@@ -340,6 +1009,9 @@ class Model(metaclass=MetaModel):
             Return:
                 A dict with the field names and values.
         """
+        if self.compact:
+            return dict(zip(self._fields, self._field_values))
+
         return self._field_values
 
     def being_created(self):
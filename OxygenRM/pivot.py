@@ -18,6 +18,7 @@ class Pivot(Model):
         for attr, value in cls.__dict__.items():
             if isinstance(value, Field):
                 value._attr = attr
+                value._key = attr
                 
                 row_prop = property(fget=value.get, fset=value.set) 
                 setattr(cls, attr, row_prop)
@@ -47,12 +48,16 @@ class Pivot(Model):
 
     def _update_values(self, values):
         self._field_values = {}
+        self._dirty = set()
 
         for field, col in self._fields.items():
             field_val = values.get(field, None)
 
             self._field_values[field] = col.db_get(field_val)
 
+    def _hydrate(self, keys, row, from_db=False):
+        self._update_values(dict(zip(keys, row)))
+
     @classmethod
     def new(cls):
         return cls()
@@ -0,0 +1,265 @@
+""" A unit of work that keeps one model per record and saves
+    the changes of every model together.
+"""
+import threading
+import weakref
+
+from itertools import islice
+
+from OxygenRM.internals.QueryBuilder import QueryBuilder
+
+import OxygenRM as O
+
+_local = threading.local()
+
+def current_session():
+    """ Get the innermost session open in the current thread.
+
+        Returns:
+            A Session, or None if no session is open.
+    """
+    sessions = getattr(_local, 'sessions', None)
+
+    return sessions[-1] if sessions else None
+
+class Session():
+    """ While open, every model with an id that is loaded in the current thread
+        is kept in an identity map, so the same record is always the same
+        instance and the lookups by id don't query the database again.
+
+        The identity map only references weakly the models without changes, so the
+        ones no longer used are forgotten, as when streaming. The models that are 
+        changed, and the ones with mutable fields, are kept until they are flushed.
+
+        When the session is closed without errors, the new, changed and deleted
+        models are flushed in a single transaction: the models are saved in
+        dependency order (the BelongsTo targets first), with one statement
+        for every batch of inserts, every set of changed fields and every
+        model class deletions.
+
+        Usage:
+            with Session() as session:
+                post = Post.find(1)
+                post.title = 'Edited'
+
+                session.add(Post(title='New'))
+                session.delete(Post.find(2))
+    """
+    def __init__(self):
+        self._identity_map = weakref.WeakValueDictionary()
+        self._kept = {}
+        self._new = []
+        self._deleted = []
+
+    def __enter__(self):
+        if not hasattr(_local, 'sessions'):
+            _local.sessions = []
+
+        _local.sessions.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.sessions.remove(self)
+
+        if exc_type is None:
+            self.flush()
+
+        return False
+
+    def get(self, model, id_value):
+        """ Get a model from the identity map.
+
+            Args:
+                model: The model class.
+                id_value: The value of its id.
+
+            Returns:
+                The model instance, or None if it's not loaded.
+        """
+        return self._identity_map.get((model, id_value))
+
+    def register(self, model):
+        """ Put a model loaded from the database in the identity map. If a model
+            of the same record is already there, that one is kept.
+
+            Args:
+                model: The loaded model.
+
+            Returns:
+                The model instance of the record.
+        """
+        if model._dumb or model.get_id() is None:
+            return model
+
+        key = (type(model), model.get_id())
+        loaded = self._identity_map.setdefault(key, model)
+
+        # Their changes can't be noticed when they are made, so they are kept anyway
+        if any(field.mutable for field in model._fields.values()):
+            self._kept[key] = loaded
+
+        return loaded
+
+    def keep(self, model):
+        """ Keep a loaded model until the session is flushed, as it's being changed.
+
+            Args:
+                model: The model.
+        """
+        if model._dumb or model._creating_new:
+            return
+
+        key = (type(model), model.get_id())
+
+        if self._identity_map.get(key) is model:
+            self._kept[key] = model
+
+    def add(self, *models):
+        """ Queue the creation of new models.
+
+            Args:
+                *models: The models to create.
+
+            Returns:
+                self
+        """
+        for model in models:
+            if not model.being_created():
+                raise ValueError('Tried to add a model that is already in the database.')
+
+            if not any(model is new for new in self._new):
+                self._new.append(model)
+
+        return self
+
+    def delete(self, *models):
+        """ Queue the deletion of models.
+
+            Args:
+                *models: The models to delete.
+
+            Returns:
+                self
+        """
+        for model in models:
+            if model.being_created():
+                self._new = [new for new in self._new if new is not model]
+                continue
+
+            if model._dumb:
+                raise ValueError('Cannot delete models without id in a session.')
+
+            self._deleted.append(model)
+            self._identity_map.pop((type(model), model.get_id()), None)
+            self._kept.pop((type(model), model.get_id()), None)
+
+        return self
+
+    def dirty(self):
+        """ Get the loaded models with changes waiting to be saved.
+
+            Returns:
+                A list of models.
+        """
+        deleted = set(map(id, self._deleted))
+
+        return [
+            model for model in self._kept.values()
+            if id(model) not in deleted and (model._changed_db_values() or model._has_pending_relations())
+        ]
+
+    def flush(self):
+        """ Save the new and changed models and delete the deleted ones, in a single transaction.
+
+            Returns:
+                self
+        """
+        to_save = {}
+        for model in self._new + self.dirty():
+            to_save.setdefault(type(model), []).append(model)
+
+        to_delete = {}
+        for model in self._deleted:
+            to_delete.setdefault(type(model), []).append(model.get_id())
+
+        if not to_save and not to_delete:
+            return self
+
+        order = dependency_order(set(to_save) | set(to_delete))
+
+        with O.db.transaction():
+            for model_class in order:
+                if model_class in to_save:
+                    model_class.save_many(to_save[model_class])
+
+            # The dependent records go first
+            for model_class in reversed(order):
+                if model_class in to_delete:
+                    delete_by_ids(model_class, to_delete[model_class])
+
+        self._kept = {key: model for key, model in self._kept.items() if any(field.mutable for field in model._fields.values())}
+
+        for model in self._new:
+            self.register(model)
+
+        self._new = []
+        self._deleted = []
+
+        return self
+
+    def clear(self):
+        """ Forget every loaded model and discard the queued operations.
+        """
+        self._identity_map.clear()
+        self._kept = {}
+        self._new = []
+        self._deleted = []
+
+    def __contains__(self, model):
+        return not model._dumb and self._identity_map.get((type(model), model.get_id())) is model
+
+    def __len__(self):
+        return len(self._identity_map)
+
+def dependency_order(model_classes):
+    """ Sort model classes so every class comes after the classes it belongs to.
+
+        Args:
+            model_classes: A set of model classes.
+
+        Returns:
+            A list with the sorted classes.
+    """
+    order = []
+    visiting = set()
+
+    def visit(model_class):
+        if model_class in order or model_class in visiting:
+            return
+
+        visiting.add(model_class)
+
+        for relation in model_class._relations.values():
+            if relation.holds_foreign_key and relation._model in model_classes:
+                visit(relation._model)
+
+        visiting.discard(model_class)
+        order.append(model_class)
+
+    for model_class in sorted(model_classes, key=lambda model_class: model_class.__name__):
+        visit(model_class)
+
+    return order
+
+def delete_by_ids(model_class, ids):
+    """ Delete records by id, with as few statements as the variables limit allows.
+
+        Args:
+            model_class: The model class of the records.
+            ids: A list of id values.
+    """
+    ids = iter(ids)
+    chunk_size = O.db.max_variables()
+
+    for chunk in iter(lambda: tuple(islice(ids, chunk_size)), ()):
+        QueryBuilder.table(model_class.table_name).where_in(model_class.id_key, chunk).delete()
@@ -1,6 +1,8 @@
 import OxygenRM as O
 import OxygenRM.events as event
 
+import contextlib
+
 from functools import wraps, partial
 
 def temporal_events(f):
@@ -36,4 +38,28 @@ def print_queries(f):
         _.times = 0
         return result
 
-    return _prints_queries
\ No newline at end of file
+    return _prints_queries
+
+@contextlib.contextmanager
+def record_queries():
+    """ Starts a context where all the SQL queries called by OxygenRM are recorded.
+
+        Yields:
+            The list where the queries are appended.
+    """
+    queries = []
+    deactivate_events = not O.handle_events
+
+    O.use_events()
+
+    @event.listen('db.operation_perfomed')
+    def _(query, values):
+        queries.append(query)
+
+    try:
+        yield queries
+    finally:
+        _.times = 0
+
+        if deactivate_events:
+            O.cancel_events()
@@ -5,6 +5,7 @@ from OxygenRM import db
 from OxygenRM.internals.ModelContainer import *
 from OxygenRM.internals.fields import *
 from OxygenRM.models import Model
+from OxygenRM.testing import record_queries
 
 from . import default_cols
 
@@ -117,4 +118,106 @@ class TestModelContainer(unittest.TestCase):
         cont_as_dict = list(self.mc.to_dict())
 
         self.assertEqual(len(cont_as_dict), 3)
-        self.assertEqual(cont_as_dict, [{'a': 'a'}, {'a': 'b'}, {'a': 'c'}])
\ No newline at end of file
+        self.assertEqual(cont_as_dict, [{'a': 'a'}, {'a': 'b'}, {'a': 'c'}])
+
+class TestLazyModelContainer(unittest.TestCase):
+    """ Tests concerning the containers that count and slice in SQL until their models are fetched.
+    """
+    def tearDown(self):
+        db.drop_all_tables()
+
+    def setUp(self):
+        db.create_table('tests', default_cols(a='text'))
+        db.create_many('tests', ('a', ), 'abcdef')
+
+    def test_len_counts_in_sql(self):
+        with record_queries() as queries:
+            self.assertEqual(len(Test.where('a', '!=', 'a').get()), 5)
+            self.assertEqual(len(Test.where('a', '!=', 'a').limit(3).offset(4).get()), 1)
+
+        self.assertTrue(all(query.startswith('SELECT COUNT(*) FROM (') for query in queries))
+
+    def test_slices_are_pushed_to_sql(self):
+        with record_queries() as queries:
+            items = Test.where('a', '!=', 'a').get()[1:3]
+
+            self.assertEqual(list(items.pluck('a')), ['c', 'd'])
+
+        self.assertEqual(queries, ['SELECT * FROM tests WHERE (a IS NULL OR a != ?) LIMIT 2 OFFSET 1'])
+
+    def test_slices_respect_the_query_limit_and_offset(self):
+        items = Test.order_by('a').limit(4).offset(1).get()
+
+        self.assertEqual(list(items[1:].pluck('a')), ['c', 'd', 'e'])
+        self.assertEqual(list(items[2:10].pluck('a')), ['d', 'e'])
+        self.assertEqual(list(items[4:].pluck('a')), [])
+
+    def test_index_is_pushed_to_sql(self):
+        items = Test.get()
+
+        with record_queries() as queries:
+            self.assertEqual(items[2].a, 'c')
+
+        self.assertEqual(queries, ['SELECT * FROM tests LIMIT 1 OFFSET 2'])
+
+        with self.assertRaises(IndexError):
+            items[10]
+
+    def test_iterated_containers_index_in_memory(self):
+        items = Test.get()
+
+        with record_queries() as queries:
+            for index, item in enumerate(items):
+                self.assertIs(items[index], item)
+
+        self.assertEqual(queries, ['SELECT * FROM tests'])
+
+    def test_list_fetches_without_counting(self):
+        with record_queries() as queries:
+            self.assertEqual(len(list(Test.where('a', '!=', 'a').get())), 5)
+            self.assertEqual(len(tuple(Test.get())), 6)
+
+        self.assertEqual(queries, ['SELECT * FROM tests WHERE (a IS NULL OR a != ?)', 'SELECT * FROM tests'])
+
+    def test_bool_fetches_only_the_first_model(self):
+        with record_queries() as queries:
+            self.assertTrue(Test.get())
+            self.assertFalse(Test.where('a', '=', 'z').get())
+
+        self.assertEqual(queries, ['SELECT * FROM tests LIMIT 1', 'SELECT * FROM tests WHERE a = ? LIMIT 1'])
+
+    def test_bool_is_checked_once(self):
+        items = Test.get()
+
+        with record_queries() as queries:
+            self.assertTrue(items)
+            self.assertTrue(items)
+
+        self.assertEqual(queries, ['SELECT * FROM tests LIMIT 1'])
+
+        list(items)
+
+        with record_queries() as queries:
+            self.assertTrue(items)
+
+        self.assertEqual(queries, [])
+
+    def test_changed_queries_are_not_used_to_count(self):
+        query = Test.where('a', '!=', 'a')
+        items = query.get()
+        query._in_wait['where_cond'][0] = query._in_wait['where_cond'][0]._replace(value='f')
+        query.where('a', '!=', 'b')
+
+        self.assertEqual(len(items), 5)
+        self.assertEqual(list(items[:2].pluck('a')), ['b', 'c'])
+
+    def test_fetched_containers_count_and_slice_in_memory(self):
+        items = Test.get()
+        list(items)
+
+        with record_queries() as queries:
+            self.assertEqual(len(items), 6)
+            self.assertEqual(list(items[1:3].pluck('a')), ['b', 'c'])
+            self.assertEqual(items[-1].a, 'f')
+
+        self.assertEqual(queries, [])
@@ -1,7 +1,17 @@
 import unittest
+import tempfile
+import sqlite3
+import os
+import gc
+import threading
 
+import OxygenRM
 from OxygenRM import db
+from OxygenRM.internals.SQLite3DB import SQLite3DB
 from OxygenRM.internals.QueryBuilder import *
+from OxygenRM.internals.LRUCache import LRUCache
+from OxygenRM.internals.QueryCache import QueryCache
+from OxygenRM.testing import record_queries
 from . import default_cols
 
 t1 = QueryBuilder('t')
@@ -72,11 +82,31 @@ class TestQueryBuilderSQL(unittest.TestCase):
 
     def test_group_by(self):
         t = QueryBuilder.table('t').group_by('a')
-        self.assertEqual(t.get_sql(), saft + ' GROUP BY a ASC')
+        self.assertEqual(t.get_sql(), saft + ' GROUP BY a')
 
     def test_having(self):
         t = QueryBuilder.table('t').group_by('a').having('b', '>', 5)
-        self.assertEqual(t.get_sql(), saft + ' GROUP BY a ASC HAVING b > ?')
+        self.assertEqual(t.get_sql(), saft + ' GROUP BY a HAVING b > ?')
+
+    def test_where_in_subquery(self):
+        sub = QueryBuilder.table('s').select('t_id').where('a', '=', 1)
+        t = QueryBuilder.table('t').where('b', '=', 2).where_not_in('id', sub)
+
+        self.assertEqual(t.get_sql(), saft + ' WHERE b = ? AND id NOT IN (SELECT t_id FROM s WHERE a = ?)')
+        self.assertEqual(t._query_values(), (2, 1))
+
+    def test_where_exists(self):
+        sub = QueryBuilder.table('s').where_column('s.t_id', '=', 't.id').where('a', '>', 1)
+        t = QueryBuilder.table('t').where_exists(sub)
+
+        self.assertEqual(t.get_sql(), saft + ' WHERE EXISTS (SELECT * FROM s WHERE s.t_id = t.id AND (a NOT NULL AND a > ?))')
+        self.assertEqual(t._query_values(), (1,))
+
+    def test_subqueries_shapes_are_not_confused(self):
+        first = QueryBuilder.table('t').where_in('id', QueryBuilder.table('s').select('a')).get_sql()
+        second = QueryBuilder.table('t').where_in('id', QueryBuilder.table('s').select('b')).get_sql()
+
+        self.assertNotEqual(first, second)
 
     def test_limit(self):
         t = QueryBuilder.table('t').limit(5)
@@ -140,6 +170,369 @@ class TestQueryBuilderSQL(unittest.TestCase):
 
 
 
+class TestQueryBuilderSQLCache(unittest.TestCase):
+    """ Tests concerning the reuse of the already crafted SQL.
+    """
+    def setUp(self):
+        QueryBuilder.sql_cache.clear()
+
+    def test_same_shape_reuses_the_sql(self):
+        first_sql = QueryBuilder.table('t').where('a', '=', 1).limit(1).get_sql()
+        second_sql = QueryBuilder.table('t').where('a', '=', 2).limit(1).get_sql()
+
+        self.assertEqual(first_sql, second_sql)
+        self.assertEqual(QueryBuilder.sql_cache.stats()['hits'], 1)
+        self.assertEqual(QueryBuilder.sql_cache.stats()['misses'], 1)
+
+    def test_different_shapes_are_not_confused(self):
+        self.assertEqual(QueryBuilder.table('t').where('a', '=', 1).get_sql(), saft + ' WHERE a = ?')
+        self.assertEqual(QueryBuilder.table('t').where('a', '=', None).get_sql(), saft + ' WHERE a IS ?')
+        self.assertEqual(QueryBuilder.table('t').where('a', '=', 1).limit(2).get_sql(), saft + ' WHERE a = ? LIMIT 2')
+
+        self.assertEqual(QueryBuilder.table('t').where_in('a', (1, 2)).get_sql(), saft + ' WHERE a IN (?, ?)')
+        self.assertEqual(QueryBuilder.table('t').where_in('a', (1, 2, 3)).get_sql(), saft + ' WHERE a IN (?, ?, ?)')
+
+        self.assertEqual(QueryBuilder.sql_cache.stats()['hits'], 0)
+
+    def test_update_and_delete_sql_are_cached(self):
+        QueryBuilder.table('t').where('id', '=', 1).update_sql({'a': 1})
+        update_sql = QueryBuilder.table('t').where('id', '=', 2).update_sql({'a': 2})
+
+        QueryBuilder.table('t').where('id', '=', 1).delete_sql()
+        delete_sql = QueryBuilder.table('t').where('id', '=', 2).delete_sql()
+
+        self.assertEqual(update_sql, 'UPDATE t SET a = ? WHERE id = ?')
+        self.assertEqual(delete_sql, 'DELETE FROM t WHERE id = ?')
+        self.assertEqual(QueryBuilder.sql_cache.stats()['hits'], 2)
+
+    def test_cache_is_bounded(self):
+        cache = LRUCache(2)
+
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_cache_entries_expire(self):
+        cache = LRUCache(2, ttl=0)
+
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_cache_memory_is_bounded(self):
+        cache = LRUCache(10, maxbytes=10, sizeof=len)
+
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+        cache.set('c', 'cccc')
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+        cache.invalidate()
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+class TestQueryBuilderResultCache(unittest.TestCase):
+    """ Tests concerning the reuse of the results of the cached queries.
+    """
+    def setUp(self):
+        QueryBuilder.result_cache.clear()
+
+        db.create_table('t', default_cols(a='integer'))
+        db.create_table('s', default_cols(a='integer'))
+        db.create_many('t', ('a',), [(i,) for i in range(3)]) 
+
+    def tearDown(self):
+        db.drop_table('t')
+        db.drop_table('s')
+
+    def test_same_query_is_only_run_once(self):
+        first = [row['a'] for row in qb.table('t').where('a', '>', 0).cache().get()]
+        second = [row['a'] for row in qb.table('t').where('a', '>', 0).cache().get()]
+
+        self.assertEqual(first, [1, 2])
+        self.assertEqual(second, [1, 2])
+        self.assertEqual(QueryBuilder.result_cache.stats()['hits'], 1)
+
+    def test_raw_results_use_the_cache(self):
+        self.assertEqual(qb.table('t').where('a', '>', 0).cache().scalars('a'), [1, 2])
+        self.assertEqual(qb.table('t').where('a', '>', 0).cache().scalars('a'), [1, 2])
+        self.assertEqual(qb.table('t').where('a', '>', 0).select('a').cache().tuples(), [(1,), (2,)])
+        self.assertEqual(qb.table('t').where('a', '>', 0).select('a').cache().values(), [{'a': 1}, {'a': 2}])
+
+        self.assertEqual(QueryBuilder.result_cache.stats()['hits'], 3)
+
+    def test_different_values_are_not_confused(self):
+        qb.table('t').where('a', '>', 0).cache().get()
+
+        self.assertEqual(len(qb.table('t').where('a', '>', 1).cache().get().fetchall()), 1)
+        self.assertEqual(QueryBuilder.result_cache.stats()['hits'], 0)
+
+    def test_writes_to_the_table_invalidate_the_result(self):
+        qb.table('t').cache().get()
+        db.create('t', a=3)
+
+        self.assertEqual(len(qb.table('t').cache().get().fetchall()), 4)
+
+        qb.table('t').where('a', '=', 3).update({'a': 4})
+        self.assertEqual(qb.table('t').where('a', '=', 4).cache().first()['a'], 4)
+
+        qb.table('t').where('a', '=', 4).delete()
+        self.assertIsNone(qb.table('t').where('a', '=', 4).cache().first())
+
+    def test_writes_to_other_tables_keep_the_result(self):
+        qb.table('t').cache().get()
+        db.create('s', a=1)
+        qb.table('t').cache().get()
+
+        self.assertEqual(QueryBuilder.result_cache.stats()['hits'], 1)
+
+    def test_writes_to_subqueries_tables_invalidate_the_result(self):
+        query = lambda: qb.table('t').where_in('a', qb.table('s').select('a')).cache().get().fetchall()
+
+        self.assertEqual(len(query()), 0)
+        db.create('s', a=1)
+        self.assertEqual(len(query()), 1)
+
+    def test_writes_to_joined_tables_invalidate_the_result(self):
+        db.create('s', a=1)
+        query = lambda: qb.table('t').join('s').on('t.a', '=', 's.a').cache().get().fetchall()
+
+        self.assertEqual(len(query()), 1)
+        db.create('s', a=2)
+        self.assertEqual(len(query()), 2)
+
+    def test_results_expire(self):
+        qb.table('t').cache(ttl=0).get()
+        qb.table('t').cache(ttl=0).get()
+
+        self.assertEqual(QueryBuilder.result_cache.stats()['hits'], 0)
+
+    def test_evicted_results_are_unindexed(self):
+        cache = QueryCache(2)
+
+        for i in range(10):
+            cache.set('SELECT * FROM t WHERE a = ?', (i,), db.execute('SELECT 1'), ('t', 's'))
+
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual([len(cache._by_table[table]) for table in ('t', 's')], [2, 2])
+
+        cache.invalidate_table('t')
+        self.assertEqual(dict(cache._by_table), {})
+
+    def test_writes_from_other_connections_invalidate_the_results(self):
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        file_db = SQLite3DB(db_file)
+        file_db.create_table('t', default_cols(a='integer'))
+        other_connection = sqlite3.connect(db_file)
+
+        OxygenRM.db = file_db
+        try:
+            self.assertEqual(qb.table('t').cache().get().fetchall(), [])
+
+            other_connection.execute('INSERT INTO t (a) VALUES (1)')
+            other_connection.commit()
+
+            self.assertEqual(len(qb.table('t').cache().get().fetchall()), 1)
+        finally:
+            OxygenRM.db = db
+            other_connection.close()
+            file_db.release()
+            os.remove(db_file)
+
+    def test_first_check_of_a_connection_invalidates_the_results(self):
+        cache = QueryCache()
+        connection, other_connection = db.connection, sqlite3.connect(':memory:', factory=type(db.connection))
+
+        cache.check_data_version(connection, 1)
+        cache.set(saft, (), db.execute('SELECT 1'), ('t',))
+        cache.check_data_version(connection, 1)
+        self.assertIsNotNone(cache.get(saft, ()))
+
+        cache.check_data_version(other_connection, 1)
+        self.assertIsNone(cache.get(saft, ()))
+
+        other_connection.close()
+        del other_connection
+        gc.collect()
+
+        self.assertEqual(len(cache._data_versions), 1)
+
+    def test_uncommited_changes_are_not_cached(self):
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        file_db = SQLite3DB(db_file, pool_size=2)
+        file_db.create_table('t', default_cols(a='text'))
+        file_db.create('t', a='free')
+        written, read = threading.Event(), threading.Event()
+        seen_inside = []
+
+        def write_in_transaction():
+            try:
+                with file_db.transaction():
+                    qb.table('t').update({'a': 'uncommited'})
+                    seen_inside.extend(qb.table('t').cache().scalars('a'))
+                    written.set()
+                    read.wait(5)
+                    raise RuntimeError('Rollback')
+            except RuntimeError:
+                pass
+            finally:
+                file_db.release()
+
+        OxygenRM.db = file_db
+        try:
+            writer = threading.Thread(target=write_in_transaction)
+            writer.start()
+            written.wait(5)
+
+            self.assertEqual(qb.table('t').cache().scalars('a'), ['free'])
+
+            read.set()
+            writer.join()
+
+            self.assertEqual(seen_inside, ['uncommited'])
+            self.assertEqual(qb.table('t').cache().scalars('a'), ['free'])
+        finally:
+            OxygenRM.db = db
+            file_db.release()
+            os.remove(db_file)
+
+    def test_commits_invalidate_the_results_read_meanwhile(self):
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        file_db = SQLite3DB(db_file, pool_size=2)
+        file_db.create_table('t', default_cols(a='text'))
+        file_db.create('t', a='free')
+        written, read = threading.Event(), threading.Event()
+
+        def read_meanwhile():
+            written.wait(5)
+            qb.table('t').cache().scalars('a')
+            file_db.release()
+            read.set()
+
+        OxygenRM.db = file_db
+        try:
+            reader = threading.Thread(target=read_meanwhile)
+            reader.start()
+
+            with file_db.transaction():
+                qb.table('t').update({'a': 'pro'})
+                written.set()
+                read.wait(5)
+
+            reader.join()
+            self.assertEqual(qb.table('t').cache().scalars('a'), ['pro'])
+        finally:
+            OxygenRM.db = db
+            file_db.release()
+            os.remove(db_file)
+
+class TestQueryBuilderLargeIn(unittest.TestCase):
+    """ Tests concerning the IN conditions with more values than large_in_threshold.
+    """
+    def setUp(self):
+        QueryBuilder.large_in_threshold = 3
+
+        db.create_table('t', default_cols(id='integer'))
+        db.create_many('t', ('id',), [(i,) for i in range(1, 11)]) 
+
+    def tearDown(self):
+        QueryBuilder.large_in_threshold = 999
+        db.drop_table('t')
+
+    def temp_tables(self):
+        return [row[0] for row in db.connection.execute("SELECT name FROM sqlite_temp_master WHERE type = 'table'")]
+
+    def test_temp_table_strategy(self):
+        query = qb.table('t').where_in('id', [2, 4, 6, 8, 20])
+
+        with record_queries() as queries:
+            self.assertEqual([row['id'] for row in query.get()], [2, 4, 6, 8])
+
+        self.assertRegex(queries[-1], r'^SELECT \* FROM t WHERE id IN \(SELECT value FROM oxygen_values_\d+\)$')
+        self.assertEqual(qb.table('t').where_not_in('id', range(1, 9)).count(), 2)
+        self.assertEqual(qb.table('t').where_in('id', qb.table('t').select('id').where_in('id', range(2, 7))).count(), 5)
+
+    def test_temp_tables_are_created_when_the_query_runs(self):
+        query = qb.table('t').where_in('id', range(5))
+        self.assertEqual(self.temp_tables(), [])
+
+        self.assertEqual(len(query.get().fetchall()), 4)
+        self.assertEqual(query.count(), 4)
+        self.assertTrue(query.exists())
+        self.assertEqual(self.temp_tables(), [])
+
+    def test_temp_tables_have_the_same_sql_every_time(self):
+        first = qb.table('t').where_in('id', range(5)).get_sql()
+        second = qb.table('t').where_in('id', range(1, 6)).get_sql()
+
+        self.assertEqual(first, second)
+
+    def test_temp_tables_are_created_by_the_thread_that_runs_the_query(self):
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        file_db = SQLite3DB(db_file, pool_size=2)
+        file_db.create_table('t', default_cols(id='integer'))
+        file_db.create_many('t', ('id',), [(i,) for i in range(1, 11)])
+        rows = []
+
+        def run(query):
+            try:
+                rows.extend(row['id'] for row in query.get())
+            finally:
+                file_db.release()
+
+        OxygenRM.db = file_db
+        try:
+            query = qb.table('t').where_in('id', range(5))
+
+            thread = threading.Thread(target=run, args=(query,))
+            thread.start()
+            thread.join()
+
+            self.assertEqual(rows, [1, 2, 3, 4])
+            self.assertEqual(file_db.connection.execute("SELECT name FROM sqlite_temp_master").fetchall(), [])
+        finally:
+            OxygenRM.db = db
+            file_db.release()
+            os.remove(db_file)
+
+    def test_temp_tables_still_read_are_dropped_later(self):
+        rows = qb.table('t').where_in('id', range(5)).stream()
+        self.assertEqual(len(self.temp_tables()), 1)
+
+        self.assertEqual([row['id'] for row in rows], [1, 2, 3, 4])
+        del rows
+        gc.collect()
+
+        self.assertEqual(self.temp_tables(), [])
+
+    def test_chunks_strategy(self):
+        with record_queries() as queries:
+            rows = qb.table('t').where('id', '!=', 4).where_in('id', [9, 4, 1, 2, 10], strategy='chunks').get()
+
+        self.assertEqual(sorted(row['id'] for row in rows), [1, 2, 9, 10])
+        self.assertEqual(queries, ['SELECT * FROM t WHERE (id IS NULL OR id != ?) AND id IN (?, ?, ?)', 'SELECT * FROM t WHERE (id IS NULL OR id != ?) AND id IN (?, ?)'])
+
+    def test_chunks_strategy_falls_back_to_a_temp_table(self):
+        query = qb.table('t').where_in('id', [9, 4, 1, 2, 10], strategy='chunks').order_by('id', 'DESC').limit(4)
+
+        self.assertEqual([row['id'] for row in query.get()], [10, 9, 4, 2])
+        self.assertEqual(qb.table('t').where_in('id', [9, 4, 1, 2, 10], strategy='chunks').count(), 5)
+
+        qb.table('t').where_in('id', [9, 4, 1, 2, 10], strategy='chunks').delete()
+        self.assertEqual(qb.table('t').count(), 5)
+
+    def test_invalid_strategy(self):
+        with self.assertRaises(ValueError):
+            qb.table('t').where_in('id', [1], strategy='bind')
+
 class RecordManipulationTest(unittest.TestCase):
     """ Tests concerning getting data from the database.
     """
@@ -154,6 +547,144 @@ class RecordManipulationTest(unittest.TestCase):
         self.assertEqual(created['name'], 't1')
         self.assertEqual(created['number'], 1)
 
+    def test_table_stream(self):
+        db.create_table('t', default_cols(a='integer'))
+        db.create_many('t', ('a',), [(i,) for i in range(10)]) 
+
+        streamed = qb.table('t').where('a', '>', 2).stream(arraysize=4)
+
+        self.assertEqual([row['a'] for row in streamed], list(range(3, 10)))
+
+    def test_table_raw_results(self):
+        db.create_table('t', default_cols(a='integer', b='text'))
+        db.create_many('t', ('a', 'b'), [(i, str(i)) for i in range(3)]) 
+
+        self.assertEqual(qb.table('t').values('b'), [{'b': '0'}, {'b': '1'}, {'b': '2'}])
+        self.assertEqual(qb.table('t').where('a', '>', 0).tuples(), [(1, '1'), (2, '2')])
+        self.assertEqual(qb.table('t').scalars('a'), [0, 1, 2])
+
+    def test_where_raw(self):
+        db.create_table('t', default_cols(a='integer', b='integer'))
+        db.create_many('t', ('a', 'b'), [(i, 10 - i) for i in range(10)]) 
+
+        rows = qb.table('t').where('a', '>', 2).where_raw('a + b > ? OR a = ?', (10, 9)).get()
+
+        self.assertEqual([row['a'] for row in rows], [9])
+
+    def test_paginate_by_cursor(self):
+        db.create_table('t', default_cols(id='integer', a='integer'))
+        db.create_many('t', ('id', 'a'), [(i, i % 3) for i in range(1, 11)]) 
+
+        pages = []
+        cursor = None
+
+        while True:
+            page = qb.table('t').where('a', '!=', 1).or_where('id', '=', 1).order_by('a', 'DESC').paginate(3, after=cursor)
+            pages.append([row['id'] for row in page.items])
+
+            if page.next_cursor is None:
+                break
+
+            cursor = page.next_cursor
+
+        self.assertEqual(pages, [[2, 5, 8], [1, 3, 6], [9]])
+
+    def test_paginate_with_nulls(self):
+        db.create_table('t', default_cols(id='integer', a='integer'))
+        db.create_many('t', ('id', 'a'), [(1, None), (2, 1), (3, None), (4, 0)]) 
+
+        first_page = qb.table('t').order_by('a').paginate(2)
+        second_page = qb.table('t').order_by('a').paginate(2, after=first_page.next_cursor)
+
+        self.assertEqual([row['id'] for row in first_page.items], [1, 3])
+        self.assertEqual([row['id'] for row in second_page.items], [4, 2])
+        self.assertIsNone(second_page.next_cursor)
+
+    def test_paginate_by_bytes(self):
+        db.create_table('t', default_cols(id='integer', a='blob'))
+        db.create_many('t', ('id', 'a'), [(i, bytes([255 - i])) for i in range(1, 6)]) 
+
+        first_page = qb.table('t').order_by('a').paginate(3)
+        second_page = qb.table('t').order_by('a').paginate(3, after=first_page.next_cursor)
+
+        self.assertEqual([row['id'] for row in first_page.items], [5, 4, 3])
+        self.assertEqual([row['id'] for row in second_page.items], [2, 1])
+
+    def test_paginate_with_invalid_cursor(self):
+        db.create_table('t', default_cols(id='integer'))
+
+        with self.assertRaises(ValueError):
+            qb.table('t').paginate(2, after='invalid')
+
+    def test_chunk(self):
+        db.create_table('t', default_cols(id='integer', a='integer'))
+        db.create_many('t', ('id', 'a'), [(i, i % 2) for i in range(1, 8)]) 
+
+        chunks = [[row['id'] for row in chunk] for chunk in qb.table('t').where('a', '=', 1).chunk(2)]
+
+        self.assertEqual(chunks, [[1, 3], [5, 7]])
+
+    def test_chunk_respects_the_limit(self):
+        db.create_table('t', default_cols(id='integer'))
+        db.create_many('t', ('id',), [(i,) for i in range(1, 8)]) 
+
+        chunks = [[row['id'] for row in chunk] for chunk in qb.table('t').order_by('id', 'DESC').limit(5).chunk(2)]
+
+        self.assertEqual(chunks, [[7, 6], [5, 4], [3]])
+
+    def test_chunk_by_id_while_deleting(self):
+        db.create_table('t', default_cols(id='integer'))
+        db.create_many('t', ('id',), [(i,) for i in range(1, 8)]) 
+
+        seen = []
+        for chunk in qb.table('t').chunk_by_id(3):
+            ids = [row['id'] for row in chunk]
+            seen.extend(ids)
+            qb.table('t').where_in('id', ids).delete()
+
+        self.assertEqual(seen, list(range(1, 8)))
+
+    def test_chunk_by_id_respects_the_limit(self):
+        db.create_table('t', default_cols(id='integer'))
+        db.create_many('t', ('id',), [(i,) for i in range(1, 8)]) 
+
+        chunks = [[row['id'] for row in chunk] for chunk in qb.table('t').limit(5).chunk_by_id(2)]
+
+        self.assertEqual(chunks, [[1, 2], [3, 4], [5]])
+
+    def test_chunk_by_id_and_paginate_reject_orders_and_offsets(self):
+        db.create_table('t', default_cols(id='integer', a='integer'))
+
+        with self.assertRaises(ValueError):
+            next(qb.table('t').order_by('a').chunk_by_id(2))
+
+        with self.assertRaises(ValueError):
+            next(qb.table('t').offset(2).chunk_by_id(2))
+
+        with self.assertRaises(ValueError):
+            qb.table('t').limit(10).paginate(2)
+
+    def test_each(self):
+        db.create_table('t', default_cols(id='integer'))
+        db.create_many('t', ('id',), [(i,) for i in range(1, 8)]) 
+
+        seen = []
+        self.assertTrue(qb.table('t').each(lambda row: seen.append(row['id']), size=3))
+        self.assertEqual(seen, list(range(1, 8)))
+
+        seen = []
+        self.assertFalse(qb.table('t').each(lambda row: seen.append(row['id']) or len(seen) < 4, size=3))
+        self.assertEqual(seen, [1, 2, 3, 4])
+
+    def test_page(self):
+        db.create_table('t', default_cols(a='integer'))
+        db.create_many('t', ('a',), [(i,) for i in range(10)]) 
+
+        page = qb.table('t').where('a', '>', 2).order_by('a').page(2, per_page=3)
+
+        self.assertEqual([row['a'] for row in page.items], [6, 7, 8])
+        self.assertEqual((page.total, page.page, page.per_page, page.last_page), (7, 2, 3, 3))
+
     def test_table_count(self):
         db.create_table('t', default_cols(a='integer'))
         db.create_many('t', ('a',), [(i,) for i in range(10)]) 
@@ -172,6 +703,67 @@ class RecordManipulationTest(unittest.TestCase):
         self.assertEqual(qb.table('t').min('a'), 0)
         self.assertEqual(qb.table('t').sum('a'), sum(range(10)))
 
+    def test_table_where_subqueries(self):
+        db.create_table('t', default_cols(id='integer'))
+        db.create_table('s', default_cols(t_id='integer', a='integer'))
+        db.create_many('t', ('id',), [(i,) for i in range(1, 5)]) 
+        db.create_many('s', ('t_id', 'a'), [(1, 1), (2, 2), (2, 3), (4, 1)]) 
+
+        try:
+            ids = lambda query: [row['id'] for row in query.get()]
+
+            self.assertEqual(ids(qb.table('t').where_in('id', qb.table('s').select('t_id').where('a', '>', 1))), [2])
+            self.assertEqual(ids(qb.table('t').where_not_in('id', qb.table('s').select('t_id'))), [3])
+            self.assertEqual(ids(qb.table('t').where_exists(qb.table('s').where_column('s.t_id', '=', 't.id').where('a', '=', 1))), [1, 4])
+            self.assertEqual(ids(qb.table('t').where_not_exists(qb.table('s').where_column('s.t_id', '=', 't.id'))), [3])
+        finally:
+            db.drop_table('s')
+
+    def test_table_exists(self):
+        db.create_table('t', default_cols(a='integer'))
+        db.create_many('t', ('a',), [(i,) for i in range(3)]) 
+
+        with record_queries() as queries:
+            self.assertTrue(qb.table('t').where('a', '=', 2).exists())
+            self.assertFalse(qb.table('t').where('a', '=', 3).exists())
+            self.assertTrue(qb.table('t').where('a', '=', 3).doesnt_exist())
+
+        self.assertEqual(queries[0], 'SELECT EXISTS(SELECT 1 FROM t WHERE a = ? LIMIT 1)')
+
+    def test_table_first_with_fields(self):
+        db.create_table('t', default_cols(a='integer', b='text'))
+        db.create('t', a=1, b='t')
+
+        self.assertEqual(tuple(qb.table('t').first(fields=('b',))), ('t',))
+
+    def test_table_aggregate(self):
+        db.create_table('t', default_cols(a='integer', b='integer'))
+        db.create_many('t', ('a', 'b'), [(i % 2, i) for i in range(10)]) 
+
+        query = qb.table('t').where('b', '>', 1)
+        aggregates = query.aggregate(total=Count(), kinds=Count('a', distinct=True), top=Max('b'), bottom=Min('b'), mean=Avg('b'), sum=Sum('b'))
+
+        self.assertEqual(aggregates, {'total': 8, 'kinds': 2, 'top': 9, 'bottom': 2, 'mean': 5.5, 'sum': 44})
+        self.assertEqual(query.get_sql(), saft + ' WHERE (b NOT NULL AND b > ?)')
+
+    def test_table_aggregate_grouped(self):
+        db.create_table('t', default_cols(a='integer', b='integer'))
+        db.create_many('t', ('a', 'b'), [(i % 3, i) for i in range(10)]) 
+
+        aggregates = qb.table('t').group_by('a').having('total', '>', 3).aggregate(total=Count(), sum=Sum('b'))
+        self.assertEqual(aggregates, [{'a': 0, 'total': 4, 'sum': 18}])
+
+        aggregates = qb.table('t').where('b', '<', 6).group_by('a').aggregate(top=Max('b'))
+        self.assertEqual(aggregates, [{'a': 0, 'top': 3}, {'a': 1, 'top': 4}, {'a': 2, 'top': 5}])
+
+    def test_table_group_by_having(self):
+        db.create_table('t', default_cols(a='integer'))
+        db.create_many('t', ('a',), [(i % 3,) for i in range(10)]) 
+
+        rows = qb.table('t').select('a', 'count(*) AS total').group_by('a').having('total', '=', 3).get()
+
+        self.assertEqual([tuple(row) for row in rows], [(1, 3), (2, 3)])
+
     def test_table_first(self):
         db.create_table('t', default_cols(a='text', b='integer'))
         db.create_many('t', ('a', 'b'), (('t1', 1), ('t2', 2)))
@@ -365,4 +957,29 @@ class RecordManipulationTest(unittest.TestCase):
 
         qb.table('t').update({'id':0})
         for row in db.all('t'):
-            self.assertEqual(row['id'], 0)
\ No newline at end of file
+            self.assertEqual(row['id'], 0)
+
+    def test_bulk_update(self):
+        db.create_table('t', default_cols(id='integer', a='text', b='integer'))
+        db.create_many('t', ('id', 'a', 'b'), ((i, 't', 0) for i in range(1, 5)))
+
+        updated = qb.table('t').bulk_update([
+            {'id': 1, 'a': 's'},
+            {'id': 2, 'b': 2},
+            {'id': 3, 'a': 'r', 'b': 3},
+            {'id': 4, 'a': 'q'},
+        ])
+
+        self.assertEqual(updated, 4)
+        self.assertEqual(
+            [tuple(row) for row in db.all('t')], 
+            [(1, 's', 0), (2, 't', 2), (3, 'r', 3), (4, 'q', 0)]
+        )
+
+    def test_bulk_update_only_given_fields(self):
+        db.create_table('t', default_cols(id='integer', a='text', b='integer'))
+        db.create_many('t', ('id', 'a', 'b'), ((i, 't', 0) for i in range(1, 3)))
+
+        qb.table('t').bulk_update([{'id': 1, 'a': 's', 'b': 1}, {'id': 2, 'a': 's', 'b': 2}], fields=['b'])
+
+        self.assertEqual([tuple(row) for row in db.all('t')], [(1, 't', 1), (2, 't', 2)])
@@ -70,6 +70,21 @@ class TestSQLite3DBHelpers(unittest.TestCase):
         
         self.assertEqual(result, expected)
 
+    def test_insert_clause(self):
+        self.assertEqual(insert_clause('t', ('a', 'b')), 'INSERT INTO t (a, b) VALUES (?, ?)')
+
+    def test_insert_clause_with_many_rows(self):
+        self.assertEqual(insert_clause('t', ('a', 'b'), 3), 'INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)')
+
+    def test_upsert_clause(self):
+        self.assertEqual(
+            upsert_clause('t', ('a', 'b', 'c'), ('a',), ('b', 'c')), 
+            'INSERT INTO t (a, b, c) VALUES (?, ?, ?) ON CONFLICT (a) DO UPDATE SET b = excluded.b, c = excluded.c'
+        )
+
+    def test_upsert_clause_without_update_does_nothing(self):
+        self.assertEqual(upsert_clause('t', ('a', 'b'), ('a', 'b')), 'INSERT INTO t (a, b) VALUES (?, ?) ON CONFLICT (a, b) DO NOTHING')
+
     def test_create_table_clause(self):
         result   = create_table_clause('test', default_cols(a='t1', b='t2', c='t3'))
         self.assertTrue(re.match("CREATE TABLE test [(]( ?(a|b|c) t(1|2|3),?)+[)]", result))
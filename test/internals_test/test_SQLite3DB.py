@@ -1,13 +1,19 @@
 # Test cases for OxygenRM Models
 
 import unittest
+import tempfile
+import threading
 import logging
+import time
+import gc
+import os
 from . import default_cols
 
 logging.basicConfig(filename='test/test.log',level=logging.DEBUG)
 
 import sqlite3 as sql3
 from OxygenRM.internals.SQLite3DB import SQLite3DB
+from OxygenRM.internals.ConnectionPool import PoolExhaustedError
 from OxygenRM.internals.columns import ColumnData
 
 db_name = ':memory:'
@@ -163,6 +169,15 @@ class TestSQLite3DB(unittest.TestCase):
             self.assertIn(row['name'], ['t1', 't2', 't4', None])
             self.assertIn(row['number'], [1, None])
     
+    @unittest.skipUnless(db.supports_returning, 'RETURNING clauses are not supported by this SQLite version')
+    def test_record_creation_returns_the_created_row(self):
+        db.create_table('t', default_cols(name='text', number='integer'))
+
+        row = db.create('t', name='t1')
+
+        self.assertEqual(row['name'], 't1')
+        self.assertIs(row['number'], None)
+
     def test_create_many_creates_the_records_correctly(self):
         db.create_table('t', default_cols(name='text', number='integer')       ) 
         db.create_many('t', ('number', 'name'), [(1,'t1'), (None, 't2'), (3, None)])
@@ -183,4 +198,272 @@ class TestSQLite3DB(unittest.TestCase):
 
         created = db.all('t').fetchone()
         self.assertEqual(created['name'], 't1')
-        self.assertEqual(created['number'], 1)
\ No newline at end of file
+        self.assertEqual(created['number'], 1)
+
+
+class TestSQLite3DBPool(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        self.db = SQLite3DB(self.db_file, pool_size=2, pool_timeout=0.1)
+
+        self.db.create_table('t', default_cols(a='integer'))
+        self.db.release()
+
+    def tearDown(self):
+        self.db.pool.close()
+        os.remove(self.db_file)
+
+    def run_in_thread(self, f):
+        thread = threading.Thread(target=f)
+        thread.start()
+        thread.join()
+
+    def test_every_thread_gets_its_own_connection(self):
+        connections = []
+
+        def use_connection():
+            connections.append(self.db.connection)
+            self.db.release()
+
+        use_connection()
+        self.run_in_thread(use_connection)
+
+        self.assertIsNot(connections[0], None)
+        self.assertEqual(self.db.pool_stats()['opened'], 1)
+        self.assertEqual(self.db.pool_stats()['checkouts'], 3)
+        self.assertEqual(self.db.pool_stats()['checkins'], 3)
+
+    def test_connections_are_returned_when_the_thread_dies(self):
+        self.run_in_thread(lambda: self.db.create('t', a=1))
+        gc.collect()
+
+        self.assertEqual(self.db.pool_stats()['in_use'], 0)
+        self.assertEqual(self.db.all('t').fetchone()['a'], 1)
+
+    def test_pool_is_bounded(self):
+        results = []
+        self.db.connection
+
+        def hold_connection():
+            self.db.connection
+            self.run_in_thread(lambda: results.append(self.assertRaises(PoolExhaustedError, lambda: self.db.connection)))
+            self.db.release()
+
+        self.run_in_thread(hold_connection)
+        self.db.release()
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.db.pool_stats()['waits'], 1)
+
+    def test_transactions_are_bound_to_the_thread(self):
+        def create_record():
+            self.db.create('t', a=2)
+            self.db.release()
+
+        try:
+            with self.db.transaction():
+                self.run_in_thread(create_record)
+                self.db.create('t', a=1)
+                raise ValueError('Test')
+        except ValueError:
+            pass
+
+        self.assertEqual([row['a'] for row in self.db.all('t')], [2])
+
+class TestSQLite3DBDurability(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        self.reader = sql3.connect(self.db_file)
+
+        SQLite3DB(self.db_file).create_table('t', default_cols(a='integer'))
+
+    def tearDown(self):
+        self.reader.close()
+        os.remove(self.db_file)
+
+    def commited_records(self):
+        return self.reader.execute('SELECT count(*) FROM t').fetchone()[0]
+
+    def test_strict_durability_commits_every_write(self):
+        db = SQLite3DB(self.db_file)
+        db.create('t', a=1)
+
+        self.assertEqual(db.durability, 'strict')
+        self.assertEqual(self.commited_records(), 1)
+
+    def test_batched_durability_commits_every_n_writes(self):
+        db = SQLite3DB(self.db_file, commit_every=3)
+
+        db.create('t', a=1)
+        db.create('t', a=2)
+        self.assertEqual(self.commited_records(), 0)
+
+        db.create('t', a=3)
+        self.assertEqual(self.commited_records(), 3)
+
+        db.create('t', a=4)
+        db.flush()
+        self.assertEqual(self.commited_records(), 4)
+
+    def test_batched_durability_commits_after_the_interval(self):
+        db = SQLite3DB(self.db_file, commit_interval=1)
+
+        db.create('t', a=1)
+        time.sleep(0.01)
+        db.all('t')
+
+        self.assertEqual(self.commited_records(), 1)
+
+    def test_manual_durability_commits_on_flush_or_transactions(self):
+        db = SQLite3DB(self.db_file, durability='manual')
+
+        db.create('t', a=1)
+        self.assertEqual(self.commited_records(), 0)
+
+        try:
+            with db.transaction():
+                db.create('t', a=2)
+                raise ValueError('Test')
+        except ValueError:
+            pass
+
+        self.assertEqual(self.commited_records(), 1)
+
+    def test_pending_writes_are_commited_when_a_pooled_thread_dies(self):
+        db = SQLite3DB(self.db_file, pool_size=1, durability='manual')
+
+        thread = threading.Thread(target=lambda: db.create('t', a=1))
+        thread.start()
+        thread.join()
+        gc.collect()
+
+        self.assertEqual(self.commited_records(), 1)
+
+    def test_invalid_durability_raises_value_error(self):
+        self.assertRaises(ValueError, SQLite3DB, self.db_file, durability='eventually')
+
+class TestSQLite3DBNestedTransactions(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        self.reader = sql3.connect(self.db_file)
+        self.db = SQLite3DB(self.db_file)
+
+        self.db.create_table('t', default_cols(a='integer'))
+
+    def tearDown(self):
+        self.reader.close()
+        os.remove(self.db_file)
+
+    def commited_values(self):
+        return [row[0] for row in self.reader.execute('SELECT a FROM t')]
+
+    def test_nested_transactions_are_commited_with_the_outer_one(self):
+        with self.db.transaction():
+            self.db.create('t', a=1)
+
+            with self.db.transaction():
+                self.db.create('t', a=2)
+
+            self.db.create('t', a=3)
+            self.assertEqual(self.commited_values(), [])
+
+        self.assertEqual(self.commited_values(), [1, 2, 3])
+
+    def test_failed_nested_transaction_only_undoes_its_changes(self):
+        with self.db.transaction():
+            self.db.create('t', a=1)
+
+            try:
+                with self.db.transaction():
+                    self.db.create('t', a=2)
+                    raise ValueError('Test')
+            except ValueError:
+                pass
+
+            self.db.create('t', a=3)
+
+        self.assertEqual(self.commited_values(), [1, 3])
+
+    def test_failed_outer_transaction_undoes_the_nested_ones(self):
+        try:
+            with self.db.transaction():
+                with self.db.transaction():
+                    self.db.create('t', a=1)
+
+                raise ValueError('Test')
+        except ValueError:
+            pass
+
+        self.assertEqual(self.commited_values(), [])
+
+class TestSQLite3DBPragmas(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_no_pragmas_are_set_by_default(self):
+        db = SQLite3DB(self.db_file)
+
+        self.assertEqual(db.pragmas, {})
+        self.assertEqual(db.effective_pragmas()['journal_mode'], 'delete')
+
+    def test_throughput_profile_is_applied(self):
+        db = SQLite3DB(self.db_file, profile='throughput')
+        pragmas = db.effective_pragmas()
+
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual(pragmas['synchronous'], 1)
+        self.assertEqual(pragmas['temp_store'], 2)
+        self.assertEqual(pragmas['cache_size'], -64000)
+
+    def test_pragmas_override_the_profile(self):
+        db = SQLite3DB(self.db_file, profile='durable', pragmas={'synchronous': 'NORMAL', 'cache_size': -1000})
+        pragmas = db.effective_pragmas()
+
+        self.assertEqual(pragmas['synchronous'], 1)
+        self.assertEqual(pragmas['cache_size'], -1000)
+
+    def test_pragmas_are_applied_to_every_pooled_connection(self):
+        db = SQLite3DB(self.db_file, pool_size=2, profile='throughput')
+        journal_modes = []
+
+        def read_journal_mode():
+            journal_modes.append(db.effective_pragmas()['journal_mode'])
+
+        thread = threading.Thread(target=read_journal_mode)
+        thread.start()
+        thread.join()
+        read_journal_mode()
+
+        self.assertEqual(journal_modes, ['wal', 'wal'])
+
+    def test_readonly_profile_rejects_writes(self):
+        SQLite3DB(self.db_file).create_table('t', default_cols(a='integer'))
+        db = SQLite3DB(self.db_file, profile='readonly')
+
+        with self.assertRaises(sql3.OperationalError):
+            db.create('t', a=1)
+
+    def test_invalid_pragmas_raise(self):
+        with self.assertRaises(ValueError):
+            SQLite3DB(self.db_file, profile='fastest')
+
+        with self.assertRaises(ValueError):
+            SQLite3DB(self.db_file, pragmas={'key': 'secret'})
+
+        with self.assertRaises(ValueError):
+            SQLite3DB(self.db_file, pragmas={'journal_mode': 'WAL; DROP TABLE t'})
+
+    def test_modify_columns_restores_foreign_keys(self):
+        db = SQLite3DB(self.db_file, pragmas={'foreign_keys': 'ON'})
+        old_cols = {col.name: col for col in default_cols(a='integer')}
+        db.create_table('t', old_cols.values())
+        db.modify_columns('t', tuple(default_cols(b='text')), {}, {}, old_cols)
+
+        self.assertIn('b', db.table_fields_types('t'))
+
+        self.assertEqual(db.effective_pragmas()['foreign_keys'], 1)
@@ -1,4 +1,8 @@
 from . import *
+import gc
+import weakref
+
+from OxygenRM.testing import record_queries
 
 class Todo(O.Model):
     a = Text()
@@ -144,6 +148,30 @@ class TestModels(unittest.TestCase):
 
         self.assertIs(None, first_todo())
 
+    def test_models_exists_and_first_with_fields(self):
+        Todo = todo_with_id()
+        create_todo()
+
+        self.assertTrue(Todo.where('a', '=', 't').exists())
+        self.assertTrue(Todo.where('a', '=', 's').doesnt_exist())
+
+        with record_queries() as queries:
+            todo = Todo.first(fields=('id',))
+
+        self.assertEqual(todo.id, 1)
+        self.assertEqual(queries, ['SELECT id FROM todos LIMIT 1'])
+
+    def test_models_paginate(self):
+        Todo = todo_with_id()
+        db.create_many('todos', ['a'], [('t',), ('s',), ('t',)])
+
+        first_page = Todo.order_by('a', 'DESC').paginate(2)
+        second_page = Todo.order_by('a', 'DESC').paginate(2, after=first_page.next_cursor)
+
+        self.assertEqual([todo.id for todo in first_page.items], [1, 3])
+        self.assertEqual([todo.id for todo in second_page.items], [2])
+        self.assertIsInstance(second_page.items[0], Todo)
+
     def test_models_table_truncate_deletes_all_redcords(self):
         db.create_many('todos', ['a'], zip(range(10)))
         Todo.truncate()
@@ -173,6 +201,422 @@ class TestModels(unittest.TestCase):
         t.save()
         self.assertEqual(t.id, 1)
 
+    def test_model_craft_and_save_without_returning_support(self):
+        Todo = todo_with_id()
+        db.supports_returning = False
+
+        try:
+            t = Todo.craft(a='t')
+            t.a = 's'
+            t.save()
+        finally:
+            del db.supports_returning
+
+        self.assertEqual(t.id, 1)
+        self.assertEqual(Todo.find(1).a, 's')
+
+    @unittest.skipUnless(db.supports_returning, 'RETURNING clauses are not supported by this SQLite version')
+    def test_model_save_gets_the_row_in_the_same_statement(self):
+        Todo = todo_with_id()
+        t = Todo(a='t').save()
+        t.a = 's'
+
+        with record_queries() as queries:
+            t.save()
+
+        self.assertEqual(queries, ['UPDATE todos SET a = ? WHERE id = ? RETURNING *'])
+        self.assertEqual(t.a, 's')
+
+    def test_model_save_without_changes_does_nothing(self):
+        Todo = todo_with_id()
+        t = Todo(a='t').save()
+        t.a = 't'
+
+        with record_queries() as queries:
+            t.save()
+            Todo.first().save()
+
+        self.assertEqual(queries, ['SELECT * FROM todos LIMIT 1'])
+
+    def test_dumb_model_can_be_saved_many_times(self):
+        t = Todo(a='t').save()
+        t.a = 's'
+        t.save()
+        t.a = 'r'
+        t.save()
+
+        self.assertEqual([record['a'] for record in db.all('todos')], ['r'])
+
+    def test_model_craft_many_creates_every_record(self):
+        self.assertTrue(Todo.craft_many(({'a': str(i)} for i in range(10)), chunk_size=3))
+
+        self.assertEqual([record['a'] for record in db.all('todos')], [str(i) for i in range(10)])
+
+    def test_model_craft_many_returns_models_with_their_ids(self):
+        Todo = todo_with_id()
+
+        models = Todo.craft_many([{'a': 't1'}, Todo(a='t2'), {'a': 't3', 'id': 10}, {'a': 't4'}], return_models=True)
+
+        self.assertEqual(list(models.pluck('id')), [1, 2, 10, 11])
+        self.assertEqual(list(models.pluck('a')), ['t1', 't2', 't3', 't4'])
+        self.assertFalse(models[0].being_created())
+        self.assertEqual(Todo.find(11).a, 't4')
+
+    def test_model_craft_many_takes_the_ids_from_the_database(self):
+        Todo = todo_with_id()
+        db.execute("CREATE TRIGGER extra_todo AFTER INSERT ON todos WHEN NEW.a = 't1' BEGIN INSERT INTO todos (a) VALUES ('extra'); END")
+
+        models = Todo.craft_many([{'a': 't1'}, {'a': 't2'}], return_models=True)
+
+        self.assertEqual(list(models.pluck('id')), [1, 3])
+        self.assertEqual(Todo.find(3).a, 't2')
+
+    def test_model_craft_many_saves_the_pending_relations(self):
+        Todo = todo_with_id()
+        created_before = []
+
+        todo = Todo(a='t2')
+        todo._rel_queue.append(lambda: created_before.append(Todo.scalars('a')))
+
+        models = Todo.craft_many([{'a': 't1'}, todo, Todo(a='t3')], return_models=True)
+
+        self.assertEqual(list(models.pluck('a')), ['t1', 't2', 't3'])
+        self.assertEqual(created_before, [['t1', 't2']])
+        self.assertFalse(todo._has_pending_relations())
+
+    def test_model_craft_many_sets_up_the_given_models(self):
+        Todo = todo_with_id()
+        todo = Todo(a='t2')
+
+        self.assertTrue(Todo.craft_many([{'a': 't1'}, todo]))
+        self.assertEqual(todo.id, 2)
+        self.assertFalse(todo.being_created())
+
+        todo.a = 'edited'
+        todo.save()
+
+        self.assertEqual(Todo.scalars('a'), ['t1', 'edited'])
+
+    def test_model_craft_many_respects_the_variables_limit(self):
+        Todo = todo_with_id()
+        rows = [{'a': str(i)} for i in range(db.max_variables() + 1)]
+
+        models = Todo.craft_many(rows, chunk_size=len(rows), return_models=True)
+
+        self.assertEqual(Todo.count(), len(rows))
+        self.assertEqual(models[-1].id, len(rows))
+
+    def test_model_save_many_updates_and_creates(self):
+        Todo = todo_with_id()
+        Todo.craft_many({'a': str(i)} for i in range(3))
+
+        todos = list(Todo.all())
+        todos[0].a = 's'
+        todos[2].a = 'r'
+        todos.append(Todo(a='new'))
+
+        self.assertTrue(Todo.save_many(todos))
+
+        self.assertEqual([record['a'] for record in db.all('todos')], ['s', '1', 'r', 'new'])
+        self.assertEqual(todos[-1].id, 4)
+        self.assertFalse(todos[-1].being_created())
+
+    def test_model_save_many_leaves_the_models_unchanged(self):
+        Todo = todo_with_id()
+        Todo.craft_many({'a': str(i)} for i in range(3))
+
+        todos = list(Todo.all())
+        todos[1].a = 's'
+
+        self.assertEqual(todos[0]._changed_db_values(), {})
+        self.assertEqual(todos[1]._changed_db_values(), {'a': 's'})
+
+        Todo.save_many(todos)
+
+        self.assertEqual(todos[1]._changed_db_values(), {})
+
+    def test_model_stream_yields_every_model_once(self):
+        Todo.craft_many({'a': str(i)} for i in range(10))
+
+        streamed = Todo.where('a', '!=', '0').stream(arraysize=3)
+
+        self.assertEqual([todo.a for todo in streamed], [str(i) for i in range(1, 10)])
+
+        with self.assertRaises(RuntimeError):
+            list(streamed)
+
+    def test_model_stream_does_not_keep_the_models(self):
+        Todo.craft_many({'a': str(i)} for i in range(10))
+        streamed = Todo.where('a', '!=', '').stream(arraysize=2)
+        references = []
+
+        for todo in streamed:
+            references.append(weakref.ref(todo))
+            del todo
+
+        gc.collect()
+        self.assertTrue(all(reference() is None for reference in references))
+
+        with self.assertRaises(TypeError):
+            streamed[0]
+
+    def test_model_raw_results_skip_the_models(self):
+        Todo = todo_with_id()
+        Todo.craft_many({'a': str(i)} for i in range(3))
+
+        self.assertEqual(Todo.where('id', '>', 1).values(), [{'a': '1', 'id': 2}, {'a': '2', 'id': 3}])
+        self.assertEqual(Todo.where('id', '<', 3).tuples('id', 'a'), [(1, '0'), (2, '1')])
+        self.assertEqual(Todo.scalars('a'), ['0', '1', '2'])
+        self.assertEqual(Todo.where('id', '>', 5).values(), [])
+
+    def test_model_hydration_layout_is_calculated_per_set_of_columns(self):
+        Todo = todo_with_id()
+        Todo.craft_many({'a': str(i)} for i in range(3))
+
+        todos = list(Todo.all())
+        list(Todo.select('a').get())
+
+        self.assertLessEqual({('a', 'id'), ('a',)}, set(Todo._row_layouts))
+        self.assertEqual([todo.a for todo in todos], ['0', '1', '2'])
+        self.assertEqual(todos[1]._original_values, {'id': 2, 'a': '1'})
+
+    def test_model_snapshot_copies_mutable_values_only(self):
+        value = ['mutable']
+        t = Todo(b=value)
+        value.append('changed')
+
+        self.assertEqual(t._original_values, {'b': ['mutable']})
+        self.assertIs(t.b, value)
+
+class TestModelUpserting(unittest.TestCase):
+    def setUp(self):
+        db.create_table('products', (
+            id_col, 
+            next(default_cols(code='text'))._replace(unique=True), 
+            *default_cols(name='text', stock='integer')
+        ))
+
+        class Product(O.Model):
+            id = Id()
+            code = Text()
+            name = Text()
+            stock = Integer()
+
+        self.Product = Product
+
+    def tearDown(self):
+        db.drop_table('products')
+
+    def test_upsert_creates_missing_record(self):
+        product = self.Product.upsert({'code': 'a', 'name': 'Apple', 'stock': 1}, conflict=('code',))
+
+        self.assertEqual(product.id, 1)
+        self.assertEqual(product.name, 'Apple')
+
+    def test_upsert_updates_existing_record(self):
+        db.create('products', code='a', name='Apple', stock=1)
+
+        product = self.Product.upsert({'code': 'a', 'name': 'Green apple', 'stock': 5}, conflict=('code',), update=('stock',))
+
+        self.assertEqual(product.id, 1)
+        self.assertEqual(product.name, 'Apple')
+        self.assertEqual(product.stock, 5)
+        self.assertEqual(self.Product.count(), 1)
+
+    def test_upsert_many(self):
+        db.create('products', code='a', name='Apple', stock=1)
+
+        self.assertTrue(self.Product.upsert_many([
+            {'code': 'a', 'name': 'Apple', 'stock': 2},
+            {'code': 'b', 'name': 'Banana', 'stock': 3},
+            {'code': 'c', 'stock': 4},
+        ], conflict=('code',)))
+
+        self.assertEqual(
+            [(row['code'], row['name'], row['stock']) for row in db.all('products')], 
+            [('a', 'Apple', 2), ('b', 'Banana', 3), ('c', None, 4)]
+        )
+
+    def test_upsert_returns_the_row_of_its_statement(self):
+        db.create('products', code='a', name='Apple', stock=1)
+
+        with record_queries() as queries:
+            product = self.Product.upsert({'code': 'a', 'name': 'Apple', 'stock': 2}, conflict=('code',))
+
+        self.assertEqual((product.id, product.stock), (1, 2))
+
+        if db.supports_returning:
+            self.assertEqual(len(queries), 1)
+
+    def test_upsert_many_updates_the_fields_of_every_group(self):
+        db.create('products', code='a', name='Apple', stock=1)
+        db.create('products', code='b', name='Banana', stock=1)
+
+        self.Product.upsert_many([
+            {'code': 'a', 'stock': 2},
+            {'code': 'b', 'name': 'Banana', 'stock': 3},
+        ], conflict=('code',), update=(field for field in ('stock',)))
+
+        self.assertEqual([row['stock'] for row in db.all('products')], [2, 3])
+
+class TestCompactModels(unittest.TestCase):
+    def setUp(self):
+        db.create_table('todos', (id_col, *default_cols(a='text', done='boolean')))
+
+        class CompactTodo(O.Model):
+            table_name = 'todos'
+            compact = True
+
+            id = Id()
+            a = Text()
+            done = Bool()
+
+        self.Todo = CompactTodo
+
+    def tearDown(self):
+        db.drop_table('todos')
+
+    def test_compact_models_have_no_instance_dict(self):
+        todo = self.Todo(a='t')
+
+        self.assertFalse(hasattr(todo, '__dict__'))
+        self.assertEqual(todo._field_values, [None, 't', 0])
+        self.assertEqual(todo.to_dict(), {'id': None, 'a': 't', 'done': 0})
+
+    def test_compact_models_are_saved_and_fetched(self):
+        todo = self.Todo(a='t')
+        todo.done = True
+        todo.save()
+
+        fetched = self.Todo.first()
+        self.assertEqual((fetched.id, fetched.a, fetched.done), (1, 't', 1))
+
+        fetched.a = 's'
+        fetched.save()
+
+        self.assertEqual(self.Todo.find(1).a, 's')
+        self.assertEqual(self.Todo.craft(a='r').id, 2)
+
+    def test_compact_models_columns_that_are_not_fields_can_be_read(self):
+        db.create('todos', a='t')
+
+        todo = self.Todo.select('*', 'a AS alias').first()
+
+        self.assertEqual(todo.alias, 't')
+
+        with self.assertRaises(AttributeError):
+            todo.missing
+
+    def test_compact_models_relations_bookkeeping_is_lazy(self):
+        todo = self.Todo.craft(a='t')
+
+        self.assertIsNone(todo._lazy_relations_loaded)
+        self.assertIsNone(todo._lazy_rel_queue)
+        self.assertEqual(todo.relations_loaded, {})
+
+class TestModelPrimaryKeyCache(unittest.TestCase):
+    def setUp(self):
+        db.create_table('plans', (id_col, *default_cols(name='text')))
+        db.create_table('users', (id_col, *default_cols(plan_id='integer')))
+        db.create_many('plans', ('name',), (('free',), ('pro',)))
+        db.create_many('users', ('plan_id',), ((1,), (2,), (2,)))
+
+        class Plan(O.Model):
+            cache_size = 10
+
+            id = Id()
+            name = Text()
+
+        class User(O.Model):
+            id = Id()
+            plan_id = Integer()
+
+            @classmethod
+            def relations(cls):
+                cls.plan = BelongsTo('one', Plan, on_self_col='plan_id')
+
+        self.Plan = Plan
+        self.User = User
+
+    def tearDown(self):
+        db.drop_table('plans')
+        db.drop_table('users')
+
+    def test_find_is_served_from_the_cache(self):
+        self.Plan.find(1)
+
+        with record_queries() as queries:
+            plan = self.Plan.find(1)
+            plans = self.Plan.find(2, 1)
+
+        self.assertEqual(plan.name, 'free')
+        self.assertEqual(list(plans.pluck('name')), ['pro', 'free'])
+        self.assertEqual(queries, ['SELECT * FROM plans WHERE id IN (?)'])
+        self.assertEqual(self.Plan.cache_stats()['hits'], 2)
+        self.assertIsNot(plan, self.Plan.find(1))
+
+    def test_relations_use_the_cache(self):
+        users = list(self.User.all())
+        users[0].plan
+
+        with record_queries() as queries:
+            self.assertEqual(users[0].plan.name, 'free')
+            self.assertEqual(users[1].plan.name, 'pro')
+            self.assertEqual(users[2].plan.name, 'pro')
+
+        self.assertEqual(len(queries), 1)
+
+        with record_queries() as queries:
+            users = list(self.User.with_relations('plan').get())
+
+        self.assertEqual(queries, ['SELECT * FROM users'])
+
+    def test_writes_invalidate_the_cache(self):
+        plan = self.Plan.find(1)
+        plan.name = 'basic'
+        plan.save()
+
+        self.assertEqual(self.Plan.find(1).name, 'basic')
+
+        self.Plan.where('id', '=', 1).update(name='starter')
+        self.assertEqual(self.Plan.find(1).name, 'starter')
+
+        self.Plan.destroy(1)
+        self.assertIsNone(self.Plan.find(1))
+
+    def test_rollbacks_invalidate_the_cache(self):
+        try:
+            with db.transaction():
+                self.Plan.where('id', '=', 1).update(name='starter')
+                self.Plan.find(1)
+                raise ValueError('Test')
+        except ValueError:
+            pass
+
+        self.assertEqual(self.Plan.find(1).name, 'free')
+
+    def test_raw_writes_invalidate_the_cache(self):
+        self.Plan.find(1)
+        db.execute('UPDATE plans SET name = ? WHERE id = ?', ('basic', 1))
+
+        self.assertEqual(self.Plan.find(1).name, 'basic')
+
+    def test_cache_is_not_used_with_uncommited_changes(self):
+        self.Plan.find(2)
+
+        with db.transaction():
+            self.Plan.where('id', '=', 1).update(name='starter')
+
+            with record_queries() as queries:
+                self.assertEqual(self.Plan.find(1).name, 'starter')
+                self.assertEqual(self.Plan.find(2).name, 'pro')
+
+            self.assertEqual(len(queries), 2)
+            self.assertEqual(self.Plan.cache_stats()['size'], 0)
+
+        self.assertEqual(self.Plan.find(1).name, 'starter')
+        self.assertEqual(self.Plan.cache_stats()['size'], 1)
+
 class TestModelSettingUp(unittest.TestCase):
     def setUp(self):
         class Todo(O.Model):
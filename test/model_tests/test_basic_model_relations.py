@@ -1,4 +1,6 @@
 from . import *
+from OxygenRM.internals.QueryBuilder import QueryBuilder, LARGE_IN_STRATEGIES
+from OxygenRM.testing import record_queries
 
 class User(O.Model):
     id = Id()
@@ -79,6 +81,66 @@ class TestSimpleRelations(BaseClass):
         self.assertIsInstance(user_post, User)
         self.assertIsInstance(user_post.relations_loaded['posts'], ModelContainer)
 
+    def test_has_eagerly_loaded_while_streaming(self):
+        db.create_many('users', ('username', ), (('t1',), ('t2',), ('t3',)))
+        db.create_many('posts', ('text', 'author_id'), (('t', 1), ('s', 3), ('r', 3)))
+
+        users = User.with_relations('posts').stream(arraysize=2)
+        loaded_posts = {user.username: user.relations_loaded['posts'] for user in users}
+
+        self.assertEqual(list(loaded_posts), ['t1', 't2', 't3'])
+        self.assertEqual(list(loaded_posts['t1'].pluck('text')), ['t'])
+        self.assertEqual(list(loaded_posts['t3'].pluck('text')), ['s', 'r'])
+
+    def test_has_eagerly_loaded_in_every_chunk(self):
+        db.create_many('users', ('username', ), (('t1',), ('t2',), ('t3',)))
+        db.create_many('posts', ('text', 'author_id'), (('t', 1), ('s', 3), ('r', 3)))
+
+        for chunk in (User.with_relations('posts').chunk(2), User.with_relations('posts').chunk_by_id(2)):
+            loaded_posts = {user.username: user.relations_loaded['posts'] for users in chunk for user in users}
+
+            self.assertEqual(list(loaded_posts), ['t1', 't2', 't3'])
+            self.assertEqual(list(loaded_posts['t3'].pluck('text')), ['s', 'r'])
+
+    def test_has_eagerly_loaded_for_many_parents(self):
+        db.create_many('users', ('username', ), [('t{}'.format(i),) for i in range(10)])
+        db.create_many('posts', ('text', 'author_id'), [(str(i), i) for i in range(1, 11)])
+
+        for strategy in LARGE_IN_STRATEGIES:
+            QueryBuilder.large_in_threshold, QueryBuilder.large_in_strategy = 3, strategy
+
+            try:
+                users = User.with_relations('posts').get()
+            finally:
+                QueryBuilder.large_in_threshold, QueryBuilder.large_in_strategy = 999, 'temp_table'
+
+            self.assertEqual([list(user.relations_loaded['posts'].pluck('id')) for user in users], [[i] for i in range(1, 11)])
+
+    def test_eagerly_loaded_relations_are_accessed_without_querying(self):
+        db.create_many('users', ('username', ), (('t1',), ('t2',), ('t3',)))
+        db.create_many('posts', ('text', 'author_id'), (('t', 1), ('s', 3), ('r', 3)))
+
+        with record_queries() as queries:
+            users = User.with_relations('posts').get()
+            posts = [list(user.posts.pluck('text')) for user in users]
+
+            loaded_posts = Post.with_relations('author').get()
+            authors = [post.author.username for post in loaded_posts]
+
+        self.assertEqual(posts, [['t'], [], ['s', 'r']])
+        self.assertEqual(authors, ['t1', 't3', 't3'])
+        self.assertEqual(len(queries), 4)
+
+    def test_eagerly_loaded_relations_are_queried_again_after_saving(self):
+        db.create_many('users', ('username', ), (('t1',), ('t2',)))
+        db.create_many('posts', ('text', 'author_id'), (('t', 1),))
+
+        post = Post.with_relations('author').first()
+        post.author_id = 2
+        post.save()
+
+        self.assertEqual(post.author.username, 't2')
+
     def test_that_models_has_key_access_is_not_broken_on_simple_methods(self):
         db.create('users', username='t1')
         db.create_many('posts', ('text', 'author_id'), (('t', 1),))
@@ -119,6 +181,16 @@ class TestSimpleRelations(BaseClass):
 
         self.assertIsInstance(post, Post)
 
+    def test_models_filtered_by_subqueries(self):
+        db.create_many('users', ('username', ), (('t1',), ('t2',), ('t3',)))
+        db.create_many('posts', ('text', 'author_id'), (('t', 1), ('s', 3), ('r', 3)))
+
+        with_posts = User.where_exists(Post.where_column('posts.author_id', '=', 'users.id').where('text', '!=', 't'))
+        self.assertEqual(list(with_posts.get().pluck('username')), ['t3'])
+
+        without_posts = User.where_not_in('id', Post.select('author_id'))
+        self.assertEqual(list(without_posts.get().pluck('username')), ['t2'])
+
     # Belongs To!
     def test_belongsTo_queries_correctly_with_one_related_model(self):
         db.create('users', username='t1')
@@ -263,4 +335,15 @@ class TestRelationEditing(BaseClass):
             pass
 
         self.assertEqual(len(Post.get()), 0) 
-        self.assertEqual(len(User.get()), 0) 
\ No newline at end of file
+        self.assertEqual(len(User.get()), 0) 
+
+    def test_saves_inside_a_transaction_are_undone_together(self):
+        try:
+            with O.transaction():
+                Post(text='t').save()
+                Post(text='s').save()
+                raise Exception('Test')
+        except Exception as e:
+            pass
+
+        self.assertEqual(len(Post.get()), 0) 
@@ -45,6 +45,15 @@ class TestDateTimeFields(unittest.TestCase):
         self.assertLess(t1.updated, first.updated)
         self.assertEqual(t1.created, first.created)
 
+    def test_updated_date_is_only_saved_with_other_changes(self):
+        DatetimeModel().save()
+        t1 = DatetimeModel.first()
+
+        self.assertEqual(t1._changed_db_values(), {})
+
+        t1.random = 0
+        self.assertEqual(set(t1._changed_db_values()), {'random', 'updated'})
+
     def test_model_random_datetime_setting_with_timestamp(self):
         t1 = DatetimeModel()
         t1.random = datetime.datetime(2000, 1, 1, 1, 1, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
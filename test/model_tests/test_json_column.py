@@ -53,4 +53,24 @@ class TestJSONFields(unittest.TestCase):
 
         result = QueryBuilder.table('JsonModels').first()
 
-        self.assertEqual(result['a'], t1.a.to_json())
\ No newline at end of file
+        self.assertEqual(result['a'], t1.a.to_json())
+
+    def test_json_raw_values_can_be_converted(self):
+        t1 = JsonModel()
+        t1.a = [1, 2]
+        t1.save()
+
+        self.assertEqual(JsonModel.scalars('a'), ['[1, 2]'])
+        self.assertEqual(JsonModel.scalars('a', convert=True), [[1, 2]])
+
+    def test_json_mutations_are_saved(self):
+        t1 = JsonModel()
+        t1.a = [1, 2]
+        t1.save()
+
+        loaded = JsonModel.first()
+        loaded.a.append(3)
+        loaded.save()
+
+        self.assertEqual(JsonModel.first().a, [1, 2, 3])
+        self.assertEqual(loaded._changed_db_values(), {})
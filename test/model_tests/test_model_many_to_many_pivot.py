@@ -90,6 +90,15 @@ class TestManyToManyPivot(unittest.TestCase):
         self.assertEqual(result['t2_id'], 1)
         self.assertFalse(result['pivot3'])
 
+    def test_new_model_with_pivot_save_many(self):
+        model = T1()
+        model.t2s.pivot.t2_id = 1
+
+        T1.save_many([model])
+
+        self.assertEqual(len(list(db.all('t1_t2'))), 1)
+        self.assertEqual(model.id, 1)
+
     def test_pivot_access(self):
         create_basic_pivot()
         db.create('t2s', id=1)
@@ -0,0 +1,113 @@
+from . import *
+import gc
+from OxygenRM.session import Session, current_session, dependency_order
+from OxygenRM.testing import record_queries
+
+class Author(O.Model):
+    id = Id()
+    name = Text()
+
+class Book(O.Model):
+    id = Id()
+    title = Text()
+    author_id = Integer()
+
+    @classmethod
+    def relations(cls):
+        cls.author = BelongsTo('one', Author, on_self_col='author_id')
+
+Author.set_up()
+Book.set_up()
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        db.create_table('authors', (id_col, *default_cols(name='text')))
+        db.create_table('books', (id_col, *default_cols(title='text', author_id='integer')))
+
+        db.create_many('authors', ('name',), (('a1',), ('a2',)))
+        db.create_many('books', ('title', 'author_id'), (('b1', 1), ('b2', 1), ('b3', 2)))
+
+    def tearDown(self):
+        db.drop_table('authors')
+        db.drop_table('books')
+
+    def test_session_is_only_current_inside_the_block(self):
+        self.assertIsNone(current_session())
+
+        with Session() as session:
+            self.assertIs(current_session(), session)
+
+            with Session() as inner_session:
+                self.assertIs(current_session(), inner_session)
+
+            self.assertIs(current_session(), session)
+
+        self.assertIsNone(current_session())
+
+    def test_same_record_is_the_same_instance(self):
+        with Session() as session:
+            author = Author.find(1)
+
+            with record_queries() as queries:
+                self.assertIs(Author.find(1), author)
+                self.assertIs(Book.find(1).author, author)
+                self.assertIs(Author.where('name', '=', 'a1').first(), author)
+
+            self.assertEqual(len(queries), 2)
+            self.assertIn(author, session)
+
+    def test_changes_are_flushed_on_exit(self):
+        with Session() as session:
+            books = list(Book.all())
+            books[0].title = 'edited'
+            books[2].title = 'edited too'
+
+            self.assertEqual(session.dirty(), [books[0], books[2]])
+            self.assertEqual(Book.scalars('title'), ['b1', 'b2', 'b3'])
+
+        self.assertEqual(Book.scalars('title'), ['edited', 'b2', 'edited too'])
+
+    def test_unchanged_models_are_forgotten_when_unused(self):
+        with Session() as session:
+            for book in Book.stream(arraysize=1):
+                pass
+
+            del book
+            gc.collect()
+
+            self.assertEqual(len(session), 0)
+
+    def test_changed_models_are_kept_until_flushed(self):
+        with Session() as session:
+            Book.find(1).title = 'edited'
+            gc.collect()
+
+            self.assertEqual(len(session), 1)
+            self.assertEqual(Book.find(1).title, 'edited')
+
+        self.assertEqual(Book.scalars('title'), ['edited', 'b2', 'b3'])
+
+    def test_new_and_deleted_models_are_flushed_on_exit(self):
+        with Session() as session:
+            new_book = Book(title='b4', author_id=2)
+
+            session.add(new_book)
+            session.delete(Book.find(1), Book.find(2))
+
+        self.assertEqual(Book.scalars('title'), ['b3', 'b4'])
+        self.assertEqual(new_book.id, 4)
+        self.assertFalse(new_book.being_created())
+
+    def test_nothing_is_flushed_after_an_error(self):
+        try:
+            with Session() as session:
+                Book.find(1).title = 'edited'
+                session.add(Book(title='b4'))
+                raise ValueError('Test')
+        except ValueError:
+            pass
+
+        self.assertEqual(Book.scalars('title'), ['b1', 'b2', 'b3'])
+
+    def test_flush_saves_the_related_models_first(self):
+        self.assertEqual(dependency_order({Book, Author}), [Author, Book])
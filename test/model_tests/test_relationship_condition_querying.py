@@ -139,4 +139,23 @@ class TestSimpleRelations(BaseClass):
         self.assertIs(Post.doesnt_have('author').first(), None)
 
         db.create('posts', text='t', author_id=None)
-        self.assertEqual(Post.doesnt_have('author').first().text, 't')
\ No newline at end of file
+        self.assertEqual(Post.doesnt_have('author').first().text, 't')
+    def test_relation_conditions_exist(self):
+        db.create('posts', text='t', author_id=2)
+        db.create('users', username='t1')
+        db.create('users', username='t2')
+
+        self.assertTrue(User.has('posts').exists())
+        self.assertTrue(User.doesnt_have('posts').exists())
+        self.assertFalse(User.has('posts').where('username', '=', 't1').exists())
+        self.assertTrue(User.doesnt_have('posts').where('username', '=', 't2').doesnt_exist())
+
+    def test_relation_conditions_aggregate(self):
+        db.create_many('posts', ('text', 'author_id'), (('t', 2), ('s', 2), ('r', 1)))
+        db.create('users', username='t1')
+        db.create('users', username='t2')
+
+        self.assertEqual(User.has('posts').aggregate(n=O.Count()), {'n': 3})
+
+        groups = User.has('posts').group_by('username').having('n', '>', 1).aggregate(n=O.Count(), last=O.Max('posts.id'))
+        self.assertEqual(groups, [{'username': 't2', 'n': 2, 'last': 2}])